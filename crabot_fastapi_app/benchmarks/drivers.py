@@ -0,0 +1,106 @@
+"""
+Сравнение драйверов MySQL на большой выборке: чтение + группировка остатков, как в get_current_stocks.
+
+    python -m benchmarks.drivers --rows 100000
+
+Варианты: pymysql + DictCursor (как было), pymysql + кортежи, mysqlclient + DictCursor,
+mysqlclient + кортежи. mysqlclient пропускается, если не установлен.
+Нужен заполненный стенд (python -m benchmarks.seed --scale 1 даёт ~300k строк остатков).
+"""
+import argparse
+import gc
+import os
+import statistics
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+os.environ.setdefault("NEZKA_LOG_LEVEL", "WARNING")
+
+from infrastructure.db.mysql.drivers import load_driver
+from services.mysql_db_service.stock_transfer_service import DBController
+
+QUERY = """
+    SELECT
+        a.article_name,
+        s.wb_article_id AS wb_article_id,
+        sz.size,
+        s.qty AS stock_from,
+        0 AS stock_to,
+        0 AS on_the_way
+    FROM mp_data.a_wb_catalog_stocks s
+    LEFT JOIN mp_data.a_wb_article a ON a.wb_article_id = s.wb_article_id
+    LEFT JOIN mp_data.a_wb_izd_size sz ON sz.size_id = s.size_id
+    LIMIT %s
+"""
+
+
+def connect(driver):
+    return driver.connect({"host": os.getenv("MYSQL_HOST", "127.0.0.1"),
+                           "port": int(os.getenv("MYSQL_PORT", "3307")),
+                           "user": os.getenv("MYSQL_USER", "root"),
+                           "password": os.getenv("MYSQL_PASSWORD", "bench"),
+                           "db": "mp_data",
+                           "autocommit": True,
+                           "charset": "utf8mb4"})
+
+
+def fetch_and_group(conn, cursorclass, rows_limit: int):
+    with conn.cursor(cursorclass) as cursor:
+        cursor.execute(QUERY, (rows_limit,))
+        rows = cursor.fetchall()
+        columns = [d[0] for d in cursor.description]
+    if rows and isinstance(rows[0], dict):
+        # старый путь: словарь на каждую строку
+        rows = [tuple(r[c] for c in columns) for r in rows]
+    return DBController(db=None)._group_stock_rows(columns, rows, ["article_name", "wb_article_id", "sizes"])
+
+
+def measure(conn, cursorclass, rows_limit: int, rounds: int) -> Dict[str, Any]:
+    fetch_and_group(conn, cursorclass, rows_limit)  # прогрев кэша MySQL
+    timings = []
+    for _ in range(rounds):
+        gc.collect()
+        started = time.perf_counter()
+        fetch_and_group(conn, cursorclass, rows_limit)
+        timings.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    result = fetch_and_group(conn, cursorclass, rows_limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_ms": round(statistics.median(timings) * 1000, 1),
+            "min_ms": round(min(timings) * 1000, 1),
+            "peak_mib": round(peak / 2 ** 20, 1),
+            "articles": len(result)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pymysql/DictCursor vs mysqlclient/tuples on a large result set")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    variants: List[tuple] = []
+    for name in ("pymysql", "mysqlclient"):
+        try:
+            driver = load_driver(name)
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+            continue
+        variants.append((f"{name} / dict", driver, driver.dict_cursor))
+        variants.append((f"{name} / tuple", driver, driver.tuple_cursor))
+
+    print(f"{'variant':<24}{'median ms':>11}{'min ms':>10}{'peak MiB':>10}{'articles':>10}")
+    for label, driver, cursorclass in variants:
+        conn = connect(driver)
+        try:
+            r = measure(conn, cursorclass, args.rows, args.rounds)
+        finally:
+            conn.close()
+        print(f"{label:<24}{r['median_ms']:>11}{r['min_ms']:>10}{r['peak_mib']:>10}{r['articles']:>10}")
+
+
+if __name__ == "__main__":
+    main()
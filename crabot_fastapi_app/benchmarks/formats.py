@@ -0,0 +1,80 @@
+"""
+Форматы ответа get_tasks: JSON массивом объектов против колоночного JSON, MessagePack и Arrow IPC.
+
+    python -m benchmarks.formats --rows 100000
+
+Для каждого формата — размер тела (и после gzip), время кодирования на сервере и разбора
+на клиенте. Строки синтетические, в виде кортежей курсора; форматы без установленной
+библиотеки (msgpack, pyarrow) пропускаются. Без MySQL и HTTP.
+"""
+import argparse
+import gc
+import gzip
+import json
+import os
+import random
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+os.environ.setdefault("NEZKA_LOG_LEVEL", "WARNING")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.micro import task_rows
+from core.tabular import ARROW_STREAM, MSGPACK, available_formats, encode_table, msgpack, pyarrow
+from services.mysql_db_service.stock_transfer_service import DBController
+
+
+def json_rows(columns: List[str], rows: List[tuple]) -> bytes:
+    # прежний путь: dict на строку (DictCursor), jsonable_encoder + JSONResponse
+    return JSONResponse(content=jsonable_encoder([dict(zip(columns, r)) for r in rows])).body
+
+
+def parse(media_type: str, body: bytes) -> Any:
+    if media_type == ARROW_STREAM:
+        return pyarrow.ipc.open_stream(body).read_all()
+    if media_type == MSGPACK:
+        return msgpack.unpackb(body)
+    return json.loads(body)
+
+
+def timed(fn: Callable, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON of objects vs columnar JSON, MessagePack and Arrow IPC")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    dict_rows = task_rows(args.rows, random.Random(1))
+    columns = list(dict_rows[0])
+    rows = [tuple(r.values()) for r in dict_rows]
+
+    variants: Dict[str, Callable[[], bytes]] = {"application/json": lambda: json_rows(columns, rows)}
+    for media_type in available_formats():
+        variants[media_type] = (lambda m=media_type: encode_table(DBController._to_columns(columns, rows), m))
+
+    print(f"{'format':<40}{'body KiB':>10}{'gzip KiB':>10}{'encode ms':>11}{'parse ms':>10}")
+    for media_type, encode in variants.items():
+        body = encode()
+        encode_ms = timed(encode, args.rounds)
+        parse_ms = timed(lambda: parse(media_type, body), args.rounds)
+        print(f"{media_type:<40}{len(body) / 1024:>10.0f}{len(gzip.compress(body, 6)) / 1024:>10.0f}"
+              f"{encode_ms:>11}{parse_ms:>10}")
+    missing = [m for m in (MSGPACK, ARROW_STREAM) if m not in variants]
+    if missing:
+        print(f"skipped (library not installed): {', '.join(missing)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Нагрузочные сценарии по эндпойнтам.
+
+    python -m benchmarks.load --scenarios all --duration 20 --concurrency 16 \
+        --output bench_output.json --baseline benchmarks/baseline.json
+
+По умолчанию поднимает uvicorn с приложением против локального MySQL (переменные
+MYSQL_* как у benchmarks.seed) и меряет p50/p95/p99, пропускную способность и RSS
+процесса сервера. --baseline сравнивает с сохранённым прогоном и завершается с
+кодом 1 при регрессии больше --tolerance; --save-baseline записывает текущий прогон.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+# логи приложения на INFO искажают замеры (и в сервере, и в сценарии upstream)
+os.environ.setdefault("NEZKA_LOG_LEVEL", "WARNING")
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_TOKEN = "bench-token"
+
+WAREHOUSES = [1000 + i for i in range(40)]
+ARTICLES = [100000 + i for i in range(2000)]
+
+
+def _task_id(rng: random.Random) -> int:
+    return rng.randint(1, 1000)
+
+
+# имя -> (метод, путь, params(rng), json(rng))
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "healthcheck": {"method": "GET", "path": "/healthcheck"},
+    "get_regions": {"method": "GET", "path": "/stock_transfer/get_regions"},
+    "get_warehouses": {"method": "GET", "path": "/stock_transfer/get_warehouses"},
+    "get_tasks": {
+        "method": "GET", "path": "/stock_transfer/get_tasks",
+        "params": lambda rng: {"start_date": "2000-01-01", "end_date": "2100-01-01", "only_active": "false"},
+    },
+    "get_tasks_active": {
+        "method": "GET", "path": "/stock_transfer/get_tasks",
+        "params": lambda rng: {"start_date": "2000-01-01", "end_date": "2100-01-01", "only_active": "true"},
+    },
+    "get_tasks_changes": {
+        "method": "GET", "path": "/stock_transfer/tasks/changes",
+        "params": lambda rng: {"since": "2000-01-01T00:00:00", "limit": "500"},
+    },
+    "get_task_products": {
+        "method": "GET", "path": "/stock_transfer/get_task_products",
+        "params": lambda rng: {"task_id": str(_task_id(rng))},
+    },
+    "get_transferable_products": {
+        "method": "GET", "path": "/stock_transfer/get_transferable_products",
+        "params": lambda rng: [("warehouse_from_ids", str(w)) for w in rng.sample(WAREHOUSES, 5)],
+    },
+    "get_regular_task": {"method": "GET", "path": "/stock_transfer/regular_tasks"},
+    "update_task_products": {
+        "method": "POST", "path": "/stock_transfer/update_task_products",
+        "json": lambda rng: {"task_id": _task_id(rng),
+                             "products": [{"product_id": a, "size": str(rng.randint(1, 12)), "quantity": rng.randint(1, 50)}
+                                          for a in rng.sample(ARTICLES, 200)]},
+    },
+}
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # nearest-rank
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int], errors: int, elapsed: float, rss: List[float]) -> Dict[str, Any]:
+    latencies.sort()
+    total = len(latencies)
+    to_ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "requests": total,
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p95_ms": to_ms(percentile(latencies, 95)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+        "max_ms": to_ms(latencies[-1] if latencies else None),
+        "rss_max_mb": round(max(rss), 1) if rss else None,
+    }
+
+
+async def _sample_rss(pid: int, samples: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        value = read_rss_mb(pid)
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_http_scenario(base_url: str, name: str, duration: float, concurrency: int,
+                            warmup: float, server_pid: Optional[int]) -> Dict[str, Any]:
+    spec = SCENARIOS[name]
+    headers = {"Authorization": f"Bearer {BENCH_TOKEN}", "Accept-Encoding": "gzip"}
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    rss: List[float] = []
+
+    timeout = aiohttp.ClientTimeout(total=60)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(base_url, headers=headers, timeout=timeout, connector=connector) as session:
+        async def worker(worker_id: int, until: float, record: bool):
+            nonlocal errors
+            rng = random.Random(worker_id)
+            while time.perf_counter() < until:
+                params = spec["params"](rng) if "params" in spec else None
+                body = spec["json"](rng) if "json" in spec else None
+                started = time.perf_counter()
+                try:
+                    async with session.request(spec["method"], spec["path"], params=params, json=body) as resp:
+                        await resp.read()
+                        status = resp.status
+                except Exception:
+                    if record:
+                        errors += 1
+                    continue
+                if record:
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+        if warmup:
+            until = time.perf_counter() + warmup
+            await asyncio.gather(*(worker(i, until, False) for i in range(concurrency)))
+
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(_sample_rss(server_pid, rss, stop)) if server_pid else None
+        started = time.perf_counter()
+        until = started + duration
+        await asyncio.gather(*(worker(i, until, True) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        if sampler:
+            await sampler
+
+    return summarize(latencies, statuses, errors, elapsed, rss)
+
+
+def run_upstream_scenario(duration: float, concurrency: int, warmup: float, latency_ms: float, items: int) -> Dict[str, Any]:
+    """SyncAPIController против мок-сервера: парсинг ответа и накладные расходы requests."""
+    from benchmarks.mock_upstream import start_in_thread
+    from infrastructure.api.sync_controller import SyncAPIController
+
+    port = 18099
+    server = start_in_thread(port, latency_ms=latency_ms, items=items)
+    controller = SyncAPIController(base_url=f"http://127.0.0.1:{port}")
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    rss: List[float] = []
+
+    def worker(until: float, record: bool, stream: bool):
+        nonlocal errors
+        while time.perf_counter() < until:
+            started = time.perf_counter()
+            result = controller.request("GET", "/items", stream=stream)
+            if not record:
+                continue
+            latencies.append(time.perf_counter() - started)
+            status = result.get("status", 200) if isinstance(result, dict) else 200
+            statuses[status] = statuses.get(status, 0) + 1
+            if status >= 400:
+                errors += 1
+            rss.append(read_rss_mb(os.getpid()) or 0.0)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            if warmup:
+                until = time.perf_counter() + warmup
+                list(pool.map(lambda i: worker(until, False, i % 2 == 0), range(concurrency)))
+            started = time.perf_counter()
+            until = started + duration
+            list(pool.map(lambda i: worker(until, True, i % 2 == 0), range(concurrency)))
+            elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+
+    return summarize(latencies, statuses, errors, elapsed, rss)
+
+
+def spawn_server(port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("MYSQL_HOST", "127.0.0.1")
+    env.setdefault("MYSQL_PORT", "3307")
+    env.setdefault("MYSQL_USER", "root")
+    env.setdefault("MYSQL_PASSWORD", "bench")
+    env["STOCK_TRANSFER_FASTAPI_API_KEY"] = BENCH_TOKEN
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    return subprocess.Popen(cmd, cwd=APP_DIR, env=env)
+
+
+async def wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/healthcheck") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.3)
+    raise RuntimeError(f"Server at {base_url} did not become ready in {timeout}s")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for name, current in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        checks = [
+            ("p95_ms", current.get("p95_ms"), base.get("p95_ms"), lambda c, b: c > b * (1 + tolerance)),
+            ("p99_ms", current.get("p99_ms"), base.get("p99_ms"), lambda c, b: c > b * (1 + tolerance)),
+            ("throughput_rps", current.get("throughput_rps"), base.get("throughput_rps"), lambda c, b: c < b * (1 - tolerance)),
+            ("rss_max_mb", current.get("rss_max_mb"), base.get("rss_max_mb"), lambda c, b: c > b * (1 + tolerance)),
+        ]
+        for metric, cur, ref, worse in checks:
+            if cur is None or not ref:
+                continue
+            if worse(cur, ref):
+                regressions.append(f"{name}.{metric}: {ref} -> {cur}")
+    return regressions
+
+
+def print_table(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    header = f"{'scenario':<28}{'req':>8}{'err':>6}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results["scenarios"].items():
+        print(f"{name:<28}{r['requests']:>8}{r['errors']:>6}{r['throughput_rps']:>10}"
+              f"{str(r['p50_ms']):>10}{str(r['p95_ms']):>10}{str(r['p99_ms']):>10}{str(r['rss_max_mb']):>9}")
+        base = (baseline or {}).get("scenarios", {}).get(name)
+        if base:
+            print(f"{'  baseline':<28}{base['requests']:>8}{base['errors']:>6}{base['throughput_rps']:>10}"
+                  f"{str(base['p50_ms']):>10}{str(base['p95_ms']):>10}{str(base['p99_ms']):>10}{str(base['rss_max_mb']):>9}")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+async def main_async(args) -> int:
+    names = list(SCENARIOS) + ["upstream"] if args.scenarios == "all" else args.scenarios.split(",")
+    unknown = [n for n in names if n not in SCENARIOS and n != "upstream"]
+    if unknown:
+        print(f"unknown scenarios: {unknown}", file=sys.stderr)
+        return 2
+
+    server = None
+    base_url = args.base_url
+    server_pid = args.server_pid
+    http_names = [n for n in names if n != "upstream"]
+    if http_names and not base_url:
+        server = spawn_server(args.port, args.workers)
+        base_url = f"http://127.0.0.1:{args.port}"
+        # при --workers > 1 это pid мастера uvicorn, RSS воркеров в него не входит
+        server_pid = server.pid
+        await wait_ready(base_url)
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "duration_sec": args.duration,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in names:
+            print(f"running {name} ...", file=sys.stderr)
+            if name == "upstream":
+                results["scenarios"][name] = await asyncio.to_thread(
+                    run_upstream_scenario, args.duration, args.concurrency, args.warmup,
+                    args.upstream_latency_ms, args.upstream_items)
+            else:
+                results["scenarios"][name] = await run_http_scenario(
+                    base_url, name, args.duration, args.concurrency, args.warmup, server_pid)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nno regressions against baseline")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load scenarios for the stock transfer API")
+    parser.add_argument("--scenarios", default="all", help=f"comma list of: {', '.join(list(SCENARIOS) + ['upstream'])}")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--base-url", default=None, help="use an already running server instead of spawning one")
+    parser.add_argument("--server-pid", type=int, default=None, help="pid to sample RSS from with --base-url")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--upstream-latency-ms", type=float, default=20)
+    parser.add_argument("--upstream-items", type=int, default=1000)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--save-baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Микробенчмарки Python-части: постобработка строк в DBController и кодирование ответа.
+
+    python -m benchmarks.micro                          # прогон и таблица
+    python -m benchmarks.micro --save-baseline          # записать benchmarks/micro_baseline.json
+    python -m benchmarks.micro --check                  # код 1, если что-то стало медленнее порога
+
+Кейсы написаны в стиле pytest-benchmark: функция bench_* получает фикстуру
+benchmark и вызывает benchmark(fn, *args). На вход подаются синтетические строки
+в том виде, в каком их отдаёт драйвер (словари DictCursor или кортежи для execute_query_rows);
+все цифры приводятся к 10k строк.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+os.environ.setdefault("NEZKA_LOG_LEVEL", "WARNING")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from core.response_cache import CachedBody
+from schemas.requests.stock_transfer import task_product_update_adapter
+from services.mysql_db_service.reference_service import ReferenceDictionaries
+from services.mysql_db_service.stock_transfer_service import DBController
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "micro_baseline.json")
+ROWS = 10_000
+
+
+class RowsDB:
+    """Вместо SyncDatabase: каждый execute_query отдаёт свежие копии заготовленных строк, как курсор."""
+    def __init__(self, *row_sets: List[Dict[str, Any]]):
+        self._row_sets = row_sets
+        self._calls = 0
+
+    def execute_query(self, query, params=None):
+        rows = self._row_sets[self._calls % len(self._row_sets)]
+        self._calls += 1
+        return [dict(r) for r in rows]
+
+    def execute_query_rows(self, query, params=None):
+        rows = self._row_sets[self._calls % len(self._row_sets)]
+        self._calls += 1
+        columns = list(rows[0]) if rows else []
+        return columns, [tuple(r.values()) for r in rows]
+
+
+# -------- синтетические строки
+
+def stock_rows(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    sizes = ["XS", "S", "M", "L", "XL", "XXL"]
+    rows = []
+    article = 100000
+    while len(rows) < n:
+        article += 1
+        for size in rng.sample(sizes, rng.randint(3, 6)):
+            rows.append({"article_name": f"Артикул {article}", "wb_article_id": article, "size": size,
+                         "stock_from": rng.randint(0, 500), "stock_to": 0, "on_the_way": 0})
+    return rows[:n]
+
+
+def task_rows(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    base = datetime(2025, 1, 1)
+    rows = []
+    for task_id in range(1, n + 1):
+        created = base + timedelta(minutes=task_id)
+        rows.append({"task_id": task_id,
+                     "warehouses_from_ids": json.dumps(rng.sample(range(1000, 1040), 2)),
+                     "warehouses_to_ids": json.dumps(rng.sample(range(1000, 1040), 2)),
+                     "task_status": rng.choice([0, 1, 2]), "is_archived": 0, "version": rng.randint(0, 10),
+                     "task_creation_date": created, "task_archiving_date": None,
+                     "last_change_date": created + timedelta(hours=1),
+                     "positions_total": 40, "quantity_total": Decimal(rng.randint(40, 2000)),
+                     "quantity_left": Decimal(rng.randint(0, 40))})
+    return rows
+
+
+def task_product_rows(task_ids: List[int], rng: random.Random) -> List[Dict[str, Any]]:
+    return [{"task_id": t, "product_wb_id": 100000 + rng.randint(0, 2000), "size": "M",
+             "quantity": rng.randint(1, 50), "quantity_left": rng.randint(0, 50)} for t in task_ids]
+
+
+def regular_task_row(rng: random.Random) -> Dict[str, Any]:
+    row = {"task_id": 1, "version": 3, "task_creation_date": datetime(2025, 1, 1)}
+    for t_col, m_col in DBController._REGION_COLS.values():
+        row[t_col] = Decimal(str(round(rng.random(), 4)))
+        row[m_col] = Decimal(str(round(rng.random() / 10, 4)))
+    return row
+
+
+def render_json(content: Any) -> bytes:
+    """Путь FastAPI без response_model: jsonable_encoder + JSONResponse.render."""
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+
+# -------- кейсы
+
+def bench_group_current_stocks(benchmark):
+    rows = stock_rows(ROWS, random.Random(1))
+    controller = DBController(db=RowsDB(rows))
+    benchmark(controller.get_current_stocks, [1000, 1001])
+
+
+def bench_group_current_stocks_with_totals(benchmark):
+    rows = stock_rows(ROWS, random.Random(1))
+    controller = DBController(db=RowsDB(rows))
+    benchmark(controller.get_current_stocks, [1000, 1001], ["wb_article_id", "sizes", "stock_total"])
+
+
+def bench_group_current_stocks_with_references(benchmark):
+    # SQL без join-ов на справочники: size — size_id, названия подставляются из словарей в памяти
+    rows = stock_rows(ROWS, random.Random(1))
+    size_ids = {size: i for i, size in enumerate(sorted({r["size"] for r in rows}), start=1)}
+    references = ReferenceDictionaries(
+        db=RowsDB([{"size_id": i, "size": size} for size, i in size_ids.items()],
+                  [{"wb_article_id": r["wb_article_id"], "article_name": r["article_name"]} for r in rows]),
+        refresh_sec=float("inf"), full_reload_sec=float("inf"))
+    id_rows = [{**r, "article_name": None, "size": size_ids[r["size"]]} for r in rows]
+    controller = DBController(db=RowsDB(id_rows), references=references)
+    benchmark(controller.get_current_stocks, [1000, 1001])
+
+
+def bench_map_regular_task_rows(benchmark):
+    rng = random.Random(2)
+    rows = [regular_task_row(rng) for _ in range(ROWS)]
+    controller = DBController(db=RowsDB([]))
+    benchmark(lambda: [controller._map_regular_task_row(r) for r in rows])
+
+
+def bench_tasks_changes_shaping(benchmark):
+    rng = random.Random(3)
+    tasks = task_rows(ROWS, rng)
+    products = task_product_rows([t["task_id"] for t in tasks], rng)
+    controller = DBController(db=RowsDB(tasks, products))
+    benchmark(controller.get_tasks_changes, None, ROWS - 1, 2)
+
+
+def bench_encode_tasks(benchmark):
+    rows = task_rows(ROWS, random.Random(4))
+    benchmark(render_json, rows)
+
+
+def bench_encode_current_stocks(benchmark):
+    grouped = DBController(db=RowsDB(stock_rows(ROWS, random.Random(5)))).get_current_stocks([1000])
+    benchmark(render_json, grouped)
+
+
+def bench_cached_body_from_data(benchmark):
+    rows = task_rows(ROWS, random.Random(6))
+    benchmark(CachedBody.from_data, rows)
+
+
+def bench_validate_task_products(benchmark):
+    rng = random.Random(7)
+    products = [{"product_id": rng.randint(10 ** 7, 10 ** 8), "size": str(rng.randint(1, 60)),
+                 "quantity": rng.randint(1, 500)} for _ in range(ROWS)]
+    body = json.dumps({"task_id": 1, "products": products}).encode("utf-8")
+    benchmark(task_product_update_adapter.validate_json, body)
+
+
+CASES: Dict[str, Callable] = {name[len("bench_"):]: fn for name, fn in sorted(globals().items())
+                              if name.startswith("bench_") and callable(fn)}
+
+
+# -------- раннер
+
+class Benchmark:
+    """Минимальный аналог фикстуры pytest-benchmark: время по раундам + аллокации за один вызов."""
+    def __init__(self, rounds: int, warmup: int):
+        self.rounds = rounds
+        self.warmup = warmup
+        self.result: Dict[str, Any] = {}
+
+    def __call__(self, fn, *args, **kwargs):
+        for _ in range(self.warmup):
+            fn(*args, **kwargs)
+
+        timings = []
+        gc.collect()
+        for _ in range(self.rounds):
+            started = time.perf_counter()
+            fn(*args, **kwargs)
+            timings.append(time.perf_counter() - started)
+
+        gc.collect()
+        tracemalloc.start()
+        before_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.reset_peak()
+        result = fn(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+        after_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+        del result
+
+        self.result = {
+            "median_ms": round(statistics.median(timings) * 1000, 3),
+            "min_ms": round(min(timings) * 1000, 3),
+            "stdev_ms": round(statistics.stdev(timings) * 1000, 3) if len(timings) > 1 else 0.0,
+            "peak_kib": round(peak / 1024, 1),
+            "live_blocks": after_blocks - before_blocks,
+        }
+
+
+def run(names: List[str], rounds: int, warmup: int) -> Dict[str, Any]:
+    results = {}
+    for name in names:
+        bench = Benchmark(rounds=rounds, warmup=warmup)
+        CASES[name](bench)
+        results[name] = bench.result
+    return results
+
+
+def check(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            continue
+        if current["median_ms"] > base["median_ms"] * (1 + threshold):
+            regressions.append(f"{name}: median {base['median_ms']}ms -> {current['median_ms']}ms")
+        if current["peak_kib"] > base["peak_kib"] * (1 + threshold):
+            regressions.append(f"{name}: peak {base['peak_kib']}KiB -> {current['peak_kib']}KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for DBController row shaping and response encoding")
+    parser.add_argument("-k", dest="select", default=None, help="substring filter on case names")
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="fail when slower than baseline by more than --threshold")
+    parser.add_argument("--threshold", type=float, default=0.20)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    names = [n for n in CASES if not args.select or args.select in n]
+    results = run(names, args.rounds, args.warmup)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"{'case (per 10k rows)':<36}{'median ms':>11}{'min ms':>10}{'peak KiB':>11}{'blocks':>9}{'vs base':>9}")
+    for name, r in results.items():
+        base = baseline.get("cases", {}).get(name)
+        delta = f"{(r['median_ms'] / base['median_ms'] - 1) * 100:+.0f}%" if base and base["median_ms"] else ""
+        print(f"{name:<36}{r['median_ms']:>11}{r['min_ms']:>10}{r['peak_kib']:>11}{r['live_blocks']:>9}{delta:>9}")
+
+    payload = {"meta": {"python": platform.python_version(), "rows": ROWS, "rounds": args.rounds}, "cases": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+
+    if args.check:
+        if not baseline:
+            print(f"no baseline at {args.baseline}", file=sys.stderr)
+            sys.exit(2)
+        regressions = check(results, baseline, args.threshold)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nno regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
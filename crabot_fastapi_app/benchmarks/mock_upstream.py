@@ -0,0 +1,81 @@
+"""
+Мок внешнего HTTP API для SyncAPIController.
+
+    python -m benchmarks.mock_upstream --port 8099 --latency-ms 20 --items 1000
+
+GET/POST на любой путь -> JSON-массив из --items элементов (как отдаёт WB),
+/stocks_report -> tests.mock_data.stocks_report_mock_response,
+/status/<code> -> ответ с этим HTTP-кодом (проверка обработки ошибок).
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tests.mock_data import stocks_report_mock_response
+
+
+def make_handler(latency_ms: float, items: int):
+    list_body = json.dumps([{"nmId": 100000 + i, "stock": i % 500, "warehouse": f"Склад {i % 40}"}
+                            for i in range(items)], ensure_ascii=False).encode("utf-8")
+    report_body = json.dumps(stocks_report_mock_response, ensure_ascii=False).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+
+            status, body = 200, list_body
+            if self.path.startswith("/status/"):
+                status = int(self.path.rsplit("/", 1)[-1])
+                body = json.dumps({"message": "mock error"}).encode("utf-8")
+            elif self.path.startswith("/stocks_report"):
+                body = report_body
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = _reply
+        do_POST = _reply
+        do_PUT = _reply
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_in_thread(port: int, latency_ms: float = 0, items: int = 1000) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency_ms, items))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="mock-upstream").start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock upstream HTTP API for SyncAPIController")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--items", type=int, default=1000)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.latency_ms, args.items))
+    server.daemon_threads = True
+    print(f"mock upstream on http://127.0.0.1:{args.port} (latency={args.latency_ms}ms, items={args.items})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Генератор данных локального стенда.
+
+    python -m benchmarks.seed --scale 1
+
+База mp_data пересоздаётся с нуля. Размеры растут линейно со --scale; генерация
+детерминирована (--seed), так что прогоны на одном масштабе сравнимы между собой.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import pymysql
+
+from infrastructure.db.mysql.migrations import MigrationRunner
+from services.mysql_db_service.stock_transfer_service import DBController
+
+SIZES = ["XS", "S", "M", "L", "XL", "XXL", "40", "42", "44", "46", "48", "50"]
+REGIONS = list(DBController._REGION_COLS)
+BATCH = 5000
+
+
+def connect(db=None):
+    return pymysql.connect(host=os.getenv("MYSQL_HOST", "127.0.0.1"),
+                           port=int(os.getenv("MYSQL_PORT", "3307")),
+                           user=os.getenv("MYSQL_USER", "root"),
+                           password=os.getenv("MYSQL_PASSWORD", "bench"),
+                           database=db,
+                           autocommit=True,
+                           charset="utf8mb4")
+
+
+def apply_schema(conn):
+    # схема — те же миграции, что и на рабочей базе, вместе с индексами
+    with conn.cursor() as cur:
+        cur.execute("DROP DATABASE IF EXISTS mp_data")
+        cur.execute("CREATE DATABASE mp_data CHARACTER SET utf8mb4")
+        cur.execute("CREATE DATABASE IF NOT EXISTS dostup CHARACTER SET utf8mb4")
+    MigrationRunner(conn).apply()
+
+
+def insert_batched(conn, query, rows):
+    total = 0
+    with conn.cursor() as cur:
+        for i in range(0, len(rows), BATCH):
+            cur.executemany(query, rows[i:i + BATCH])
+            total += len(rows[i:i + BATCH])
+    return total
+
+
+def seed(conn, scale: float, rng: random.Random):
+    n_articles = max(10, int(2000 * scale))
+    n_warehouses = 40
+    n_snapshots = 3
+    n_tasks = max(10, int(1000 * scale))
+    products_per_task = 40
+    product_versions = 3  # 2 архивных набора + 1 актуальный на задание
+    now = datetime.now().replace(microsecond=0)
+
+    counts = {}
+    counts["sizes"] = insert_batched(conn,
+        "INSERT INTO mp_data.a_wb_izd_size (size_id, size) VALUES (%s, %s)",
+        [(i + 1, name) for i, name in enumerate(SIZES)])
+
+    article_ids = [100000 + i for i in range(n_articles)]
+    counts["articles"] = insert_batched(conn,
+        "INSERT INTO mp_data.a_wb_article (wb_article_id, article_name) VALUES (%s, %s)",
+        [(a, f"Артикул {a}") for a in article_ids])
+
+    counts["regions"] = insert_batched(conn,
+        "INSERT INTO mp_data.a_wb_stock_transfer_wb_regions (region_id, region_name) VALUES (%s, %s)",
+        [(i + 1, name) for i, name in enumerate(REGIONS)])
+
+    warehouse_ids = [1000 + i for i in range(n_warehouses)]
+    counts["warehouses"] = insert_batched(conn,
+        "INSERT INTO mp_data.a_wb_stock_transfer_wb_warehourses (wb_office_id, warehouse_name, region_id) "
+        "VALUES (%s, %s, %s)",
+        [(w, f"Склад {w}", rng.randint(1, len(REGIONS))) for w in warehouse_ids])
+    insert_batched(conn,
+        "INSERT INTO mp_data.a_wb_warehouseName (warehouse_id, warehouse_name) VALUES (%s, %s)",
+        [(w, f"Склад {w}") for w in warehouse_ids])
+
+    # остатки: несколько снимков, последний — сейчас
+    article_sizes = {a: rng.sample(range(1, len(SIZES) + 1), rng.randint(3, 6)) for a in article_ids}
+    stock_rows = []
+    for a in article_ids:
+        for w in rng.sample(warehouse_ids, rng.randint(5, 15)):
+            for size_id in article_sizes[a]:
+                for k in range(n_snapshots):
+                    stock_rows.append((a, size_id, w, rng.randint(0, 500), now - timedelta(hours=6 * k)))
+    counts["stocks"] = insert_batched(conn,
+        "INSERT INTO mp_data.a_wb_catalog_stocks (wb_article_id, size_id, warehouse_id, qty, time_end) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        stock_rows)
+
+    task_rows = []
+    for t in range(n_tasks):
+        created = now - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86400))
+        archived = rng.random() < 0.3
+        task_rows.append((json.dumps(rng.sample(warehouse_ids, 2)),
+                          json.dumps(rng.sample(warehouse_ids, 2)),
+                          rng.choice([0, 1, 2]),
+                          int(archived),
+                          created,
+                          created + timedelta(days=3) if archived else None,
+                          created + timedelta(hours=rng.randint(0, 72))))
+    counts["tasks"] = insert_batched(conn,
+        "INSERT INTO mp_data.a_wb_stock_transfer_one_time_tasks "
+        "(warehouses_from_ids, warehouses_to_ids, task_status, is_archived, "
+        " task_creation_date, task_archiving_date, last_change_date) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        task_rows)
+
+    product_rows = []
+    for task_id in range(1, n_tasks + 1):
+        for version in range(product_versions):
+            is_archived = int(version < product_versions - 1)
+            for a in rng.sample(article_ids, products_per_task):
+                qty = rng.randint(1, 50)
+                product_rows.append((task_id, a, rng.choice(article_sizes[a]), qty, rng.randint(0, qty), is_archived))
+    counts["task_products"] = insert_batched(conn,
+        "INSERT INTO mp_data.a_wb_stock_transfer_products_to_one_time_tasks "
+        "(task_id, product_wb_id, size_id, transfer_qty, transfer_qty_left, is_archived) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        product_rows)
+
+    region_cols = [c for pair in DBController._REGION_COLS.values() for c in pair]
+    regular_rows = [tuple([int(i < 4), i + 1] + [round(rng.random() / 4, 4) for _ in region_cols]) for i in range(5)]
+    counts["regular_tasks"] = insert_batched(conn,
+        f"INSERT INTO mp_data.a_wb_stock_transfer_regular_tasks (is_archived, version, {', '.join(region_cols)}) "
+        f"VALUES ({', '.join(['%s'] * (len(region_cols) + 2))})",
+        regular_rows)
+
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE TABLE mp_data.a_wb_catalog_stocks, "
+                    "mp_data.a_wb_stock_transfer_one_time_tasks, "
+                    "mp_data.a_wb_stock_transfer_products_to_one_time_tasks")
+        cur.fetchall()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the local benchmark MySQL with synthetic data")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    conn = connect()
+    try:
+        apply_schema(conn)
+        counts = seed(conn, args.scale, random.Random(args.seed))
+    finally:
+        conn.close()
+
+    for table, count in counts.items():
+        print(f"{table:>15}: {count}")
+    print(f"seeded in {time.perf_counter() - started:.1f}s (scale={args.scale})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Проверка больших тел запросов: модель Pydantic на строку против TypeAdapter над TypedDict.
+
+    python -m benchmarks.validation --rows 50000
+
+Для update_task_products считается путь от сырых байт тела до кортежей для executemany,
+для import_distribution_targets — до проверенных строк. Без MySQL и HTTP.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+os.environ.setdefault("NEZKA_LOG_LEVEL", "WARNING")
+
+from schemas.requests.stock_transfer import (
+    DistributionImportRequest, TaskProductUpdateRequest,
+    distribution_import_adapter, task_product_update_adapter)
+
+
+def products_body(rows: int, rng: random.Random) -> bytes:
+    products = [{"product_id": rng.randint(10 ** 7, 10 ** 8), "size": str(rng.randint(1, 60)),
+                 "quantity": rng.randint(1, 500)} for _ in range(rows)]
+    return json.dumps({"task_id": 1, "products": products}).encode("utf-8")
+
+
+def distribution_body(rows: int, rng: random.Random) -> bytes:
+    data = [{"region_id": rng.randint(1, 8), "warehouse_id": rng.randint(1, 200),
+             "article": f"ART-{rng.randint(1, 10 ** 6)}", "size": rng.choice(["S", "M", "L", "42", "44"]),
+             "target_percent": round(rng.random(), 4)} for _ in range(rows)]
+    return json.dumps({"supplier_id": 1, "rows": data}).encode("utf-8")
+
+
+def to_batch(task_id: int, products) -> List[tuple]:
+    """Как DBController.update_task_products собирает строки для executemany."""
+    return [(task_id, p["product_id"], int(p["size"]), p["quantity"], p["quantity"], 0) for p in products]
+
+
+# -------- варианты: сырое тело -> то, что уходит дальше
+
+def products_models(body: bytes):
+    # прежний путь: json.loads в FastAPI, модель на строку, model_dump() в обработчике
+    request = TaskProductUpdateRequest.model_validate(json.loads(body))
+    return to_batch(request.task_id, [p.model_dump() for p in request.products])
+
+
+def products_models_json(body: bytes):
+    request = TaskProductUpdateRequest.model_validate_json(body)
+    return to_batch(request.task_id, [p.model_dump() for p in request.products])
+
+
+def products_type_adapter(body: bytes):
+    payload = task_product_update_adapter.validate_json(body)
+    return to_batch(payload["task_id"], payload["products"])
+
+
+def distribution_models(body: bytes):
+    return DistributionImportRequest.model_validate(json.loads(body)).rows
+
+
+def distribution_type_adapter(body: bytes):
+    return distribution_import_adapter.validate_json(body)["rows"]
+
+
+def measure(fn: Callable, body: bytes, rounds: int) -> Dict[str, Any]:
+    fn(body)
+    timings = []
+    for _ in range(rounds):
+        gc.collect()
+        started = time.perf_counter()
+        fn(body)
+        timings.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    result = fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"median_ms": round(statistics.median(timings) * 1000, 1),
+            "min_ms": round(min(timings) * 1000, 1),
+            "peak_mib": round(peak / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-row Pydantic models vs TypeAdapter on large request bodies")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    cases = [("update_task_products", products_body(args.rows, rng),
+              [("models", products_models), ("models from json", products_models_json),
+               ("type adapter", products_type_adapter)]),
+             ("import_distribution_targets", distribution_body(args.rows, rng),
+              [("models", distribution_models), ("type adapter", distribution_type_adapter)])]
+
+    print(f"{'case':<30}{'variant':<18}{'median ms':>11}{'min ms':>10}{'peak MiB':>10}")
+    for case, body, variants in cases:
+        for label, fn in variants:
+            r = measure(fn, body, args.rounds)
+            print(f"{case:<30}{label:<18}{r['median_ms']:>11}{r['min_ms']:>10}{r['peak_mib']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,7 @@ class BaseRequestProcessor:
         self.db = db
         
     def process_request_no_pagination(self, url, method, headers, schema, params, body, store_uuid, stream, stream_path):
-        logger.info(f"Start processing request: method={method}, url={url}, store_uuid={store_uuid}")
+        logger.info("Start processing request: method=%s, url=%s, store_uuid=%s", method, url, store_uuid)
 
         try:
             cached_result = self.db.get_recent_cached_data(url=url,
@@ -26,7 +26,7 @@ class BaseRequestProcessor:
                 logger.info("Returning cached result from DB.")
                 return cached_result
         except Exception as e:
-            logger.error(f"Error fetching cached data: {e}", exc_info=True)
+            logger.error("Error fetching cached data: %s", e, exc_info=True)
         
         try:
             new_data_json = self.api_controller.request(method=method, 
@@ -39,7 +39,7 @@ class BaseRequestProcessor:
             
             logger.info("Received response from API.")
         except Exception as e:
-            logger.error(f"API request failed: {e}", exc_info=True)
+            logger.error("API request failed: %s", e, exc_info=True)
             return None
 
         if new_data_json:
@@ -54,6 +54,6 @@ class BaseRequestProcessor:
                 
                 logger.info("API response successfully stored in DB.")
             except Exception as e:
-                logger.error(f"Failed to store API response in DB: {e}", exc_info=True)
+                logger.error("Failed to store API response in DB: %s", e, exc_info=True)
 
         return new_data_json
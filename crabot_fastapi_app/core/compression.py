@@ -0,0 +1,146 @@
+import asyncio
+import gzip
+from typing import Optional
+
+from core.config import settings
+from core.tracing import span
+
+# zstd и brotli — опциональные зависимости: без них остаётся gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+_COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml",
+                       "application/vnd.crabot.columnar+json", "application/x-msgpack",
+                       "application/vnd.apache.arrow.stream")
+
+
+def available_encodings() -> list[str]:
+    """Поддерживаемые кодировки в порядке предпочтения сервера."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Разбирает Accept-Encoding (с q-весами) и выбирает лучшую доступную кодировку."""
+    if not accept_encoding:
+        return None
+
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compress(body)
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    ASGI-мидлварь сжатия ответов.
+    Сжимает только ответы, пришедшие одним куском (JSONResponse и т.п.), размером
+    от min_size. Потоковые ответы (SSE) и уже сжатые (Content-Encoding задан
+    эндпойнтом, например из кэша) пропускаются как есть.
+    """
+    # крупные тела жмём в потоке, чтобы не держать event loop
+    _OFFLOAD_SIZE = 512 * 1024
+
+    def __init__(self, app, min_size: int = 1024):
+        self.app = app
+        self.min_size = int(min_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = None
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # заголовки придержим до первого куска тела
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = [(k, v) for k, v in start.get("headers", [])]
+            header_map = {k.lower(): v for k, v in headers}
+            body = message.get("body", b"")
+
+            if (message.get("more_body", False)
+                    or b"content-encoding" in header_map
+                    or len(body) < self.min_size
+                    or not is_compressible(header_map.get(b"content-type", b"").decode("latin-1"))):
+                await send(start)
+                await send(message)
+                return
+
+            with span("compress", **{"http.response.content_encoding": encoding, "http.response.body.size": len(body)}):
+                if len(body) >= self._OFFLOAD_SIZE:
+                    compressed = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    compressed = compress(body, encoding)
+            headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+            headers.append((b"vary", b"Accept-Encoding"))
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
@@ -5,7 +5,134 @@ load_dotenv()
 
 class Settings:
     LOG_LEVEL = os.getenv("NEZKA_LOG_LEVEL", 'INFO')
+    # text | json; запись в stdout идёт из отдельного потока через очередь этого размера
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
+    # Лента изменений заданий: строки младше этого лага не отдаются,
+    # чтобы курсор не «перепрыгнул» через запись, закоммиченную позже своей отметки last_change_date.
+    # Отметка (NOW() — время начала оператора) ставится последним оператором транзакции, когда строка
+    # задания уже заблокирована; лаг должен перекрывать этот оператор и COMMIT, а не всю транзакцию.
+    # Новые записи в задания ставят отметку так же (DBController._mark_tasks_changed) — иначе лента их пропустит
+    TASK_CHANGES_SAFETY_LAG_SEC = int(os.getenv("TASK_CHANGES_SAFETY_LAG_SEC", "2"))
+    TASK_CHANGES_MAX_LIMIT = int(os.getenv("TASK_CHANGES_MAX_LIMIT", "5000"))
+
+    # SSE-поток событий по заданиям
+    TASK_EVENTS_POLL_INTERVAL_SEC = float(os.getenv("TASK_EVENTS_POLL_INTERVAL_SEC", "2"))
+    TASK_EVENTS_HEARTBEAT_SEC = float(os.getenv("TASK_EVENTS_HEARTBEAT_SEC", "15"))
+    TASK_EVENTS_QUEUE_SIZE = int(os.getenv("TASK_EVENTS_QUEUE_SIZE", "100"))
+
+    # Сжатие ответов
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
+    # Кэш справочников (склады, регионы)
+    REFERENCE_CACHE_TTL_SEC = float(os.getenv("REFERENCE_CACHE_TTL_SEC", "300"))
+
+    # Справочники размеров и артикулов в памяти воркера: чтения без join-ов, size_name в записи.
+    # Раз в REFRESH_SEC дочитываются новые размеры и забываются промахи по артикулам,
+    # целиком (переименования) — раз в FULL_RELOAD_SEC
+    REFERENCE_DICT_ENABLED = os.getenv("REFERENCE_DICT_ENABLED", "1") == "1"
+    REFERENCE_DICT_REFRESH_SEC = float(os.getenv("REFERENCE_DICT_REFRESH_SEC", "60"))
+    REFERENCE_DICT_FULL_RELOAD_SEC = float(os.getenv("REFERENCE_DICT_FULL_RELOAD_SEC", "3600"))
+
+    # Трассировка запросов: заголовок Server-Timing и выгрузка спанов (OTLP/JSON)
+    # в "stdout" или путь к файлу; пустое значение — без выгрузки
+    TRACING_SERVER_TIMING = os.getenv("TRACING_SERVER_TIMING", "1") == "1"
+    TRACING_EXPORT = os.getenv("TRACING_EXPORT", "")
+
+    # Медленные запросы: порог, размер кольцевого буфера, EXPLAIN на отдельном соединении
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "500"))
+    SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "200"))
+    SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+    SLOW_QUERY_EXPLAIN_INTERVAL_SEC = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL_SEC", "300"))
+
+    # Системные метрики процесса/контейнера для /metrics
+    SYSTEM_METRICS_ENABLED = os.getenv("SYSTEM_METRICS_ENABLED", "1") == "1"
+    SYSTEM_METRICS_INTERVAL_SEC = float(os.getenv("SYSTEM_METRICS_INTERVAL_SEC", "5"))
+    EVENT_LOOP_LAG_PROBE_SEC = float(os.getenv("EVENT_LOOP_LAG_PROBE_SEC", "1"))
+
+
+    # Предохранители MySQL и внешних API: доля ошибок в окне -> разомкнуть на OPEN_SEC
+    CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", "0.5"))
+    CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", "10"))
+    CIRCUIT_BREAKER_WINDOW_SEC = float(os.getenv("CIRCUIT_BREAKER_WINDOW_SEC", "30"))
+    CIRCUIT_BREAKER_OPEN_SEC = float(os.getenv("CIRCUIT_BREAKER_OPEN_SEC", "10"))
+
+    # Лимиты одновременных запросов на эндпойнт: "get_transferable_products=4,get_tasks=16"; 0 — без лимита
+    BULKHEAD_DEFAULT_LIMIT = int(os.getenv("BULKHEAD_DEFAULT_LIMIT", "32"))
+    BULKHEAD_LIMITS = os.getenv("BULKHEAD_LIMITS", "get_transferable_products=4,get_tasks=16")
 
-settings = Settings()
 
+    # Срок запроса: из заголовка (секунды) или по маршруту; ограничивает ожидание пула,
+    # MAX_EXECUTION_TIME для SELECT и таймаут внешних API. 0 — без срока
+    DEADLINE_HEADER = os.getenv("DEADLINE_HEADER", "X-Request-Timeout")
+    DEADLINE_DEFAULT_SEC = float(os.getenv("DEADLINE_DEFAULT_SEC", "30"))
+    DEADLINE_MAX_SEC = float(os.getenv("DEADLINE_MAX_SEC", "120"))
+    DEADLINE_ROUTE_TIMEOUTS = os.getenv("DEADLINE_ROUTE_TIMEOUTS", "task_events=0")
+
+    # Реплика для чтений (MYSQL_REPLICA_HOST): отставание больше MAX_LAG_SEC -> чтения идут в primary;
+    # клиент, который писал, READ_YOUR_WRITES_SEC секунд читает из primary. 0 — без липкости
+    REPLICA_MAX_LAG_SEC = float(os.getenv("REPLICA_MAX_LAG_SEC", "2"))
+    REPLICA_LAG_CHECK_SEC = float(os.getenv("REPLICA_LAG_CHECK_SEC", "1"))
+    READ_YOUR_WRITES_SEC = float(os.getenv("READ_YOUR_WRITES_SEC", "5"))
+
+    # Драйвер MySQL: auto (mysqlclient, если установлен, иначе pymysql) | pymysql | mysqlclient
+    MYSQL_DRIVER = os.getenv("MYSQL_DRIVER", "auto")
+
+    # Пул потоков для вызовов БД из обработчиков: потоков — по размеру пула MySQL,
+    # сверх них в очереди не больше DB_EXECUTOR_QUEUE_LIMIT вызовов, остальным — 503
+    DB_EXECUTOR_QUEUE_LIMIT = int(os.getenv("DB_EXECUTOR_QUEUE_LIMIT", "64"))
+
+    # Адаптивный лимит одновременных запросов: сжимается при росте задержки маршрутов, лаге event loop
+    # и устойчивой очереди в пуле БД; сверх лимита — 503 по классам (exempt | high | normal | low)
+    LOAD_SHED_ENABLED = os.getenv("LOAD_SHED_ENABLED", "1") == "1"
+    LOAD_SHED_INITIAL_LIMIT = int(os.getenv("LOAD_SHED_INITIAL_LIMIT", "64"))
+    LOAD_SHED_MIN_LIMIT = int(os.getenv("LOAD_SHED_MIN_LIMIT", "8"))
+    LOAD_SHED_MAX_LIMIT = int(os.getenv("LOAD_SHED_MAX_LIMIT", "512"))
+    LOAD_SHED_LATENCY_TOLERANCE = float(os.getenv("LOAD_SHED_LATENCY_TOLERANCE", "2.0"))
+    LOAD_SHED_LOOP_LAG_SEC = float(os.getenv("LOAD_SHED_LOOP_LAG_SEC", "0.1"))
+    # очередь за соединениями/потоками БД считается перегрузкой, только если держится столько секунд
+    LOAD_SHED_QUEUE_SUSTAIN_SEC = float(os.getenv("LOAD_SHED_QUEUE_SUSTAIN_SEC", "0.5"))
+    LOAD_SHED_ROUTES = os.getenv("LOAD_SHED_ROUTES",
+                                 "exempt=/healthcheck,/metrics,/stock_transfer/tasks/events;"
+                                 "high=/stock_transfer/get_warehouses,/stock_transfer/get_regions,/admin;"
+                                 "low=/stock_transfer/get_tasks,/stock_transfer/get_transferable_products,"
+                                 "/stock_transfer/tasks/changes")
+
+    # Idempotency-Key: первый ответ хранится TTL_SEC (LRU воркера + таблица MySQL) и отдаётся повторам;
+    # LEASE_SEC — сколько считать ключ занятым упавшим воркером
+    IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "1") == "1"
+    IDEMPOTENCY_ROUTES = os.getenv("IDEMPOTENCY_ROUTES",
+                                   "/stock_transfer/create_full_task,/stock_transfer/regular_tasks,"
+                                   "/stock_transfer/update_task_products")
+    IDEMPOTENCY_TTL_SEC = int(os.getenv("IDEMPOTENCY_TTL_SEC", "86400"))
+    IDEMPOTENCY_LEASE_SEC = int(os.getenv("IDEMPOTENCY_LEASE_SEC", "60"))
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+    # Прогресс отгрузки: обновления копятся в памяти и пишутся пачками раз в FLUSH_MS или по BATCH_ROWS;
+    # больше MAX_BUFFERED ключей в буфере — 503
+    WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "200"))
+    WRITE_BEHIND_BATCH_ROWS = int(os.getenv("WRITE_BEHIND_BATCH_ROWS", "500"))
+    WRITE_BEHIND_MAX_BUFFERED = int(os.getenv("WRITE_BEHIND_MAX_BUFFERED", "100000"))
+
+    # Перенос мёртвых строк (старые версии товаров, архивные задания старше RETENTION_DAYS) в *_archive:
+    # пачками по BATCH_ROWS с паузой BATCH_PAUSE_MS, раз в INTERVAL_SEC; пока БД занята — ждёт
+    ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "0") == "1"
+    ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "500"))
+    ARCHIVE_BATCH_PAUSE_MS = float(os.getenv("ARCHIVE_BATCH_PAUSE_MS", "200"))
+    ARCHIVE_INTERVAL_SEC = float(os.getenv("ARCHIVE_INTERVAL_SEC", "300"))
+    ARCHIVE_MAX_BATCHES = int(os.getenv("ARCHIVE_MAX_BATCHES", "100"))
+    ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "30"))
+
+    # Миграции схемы (migrations/NNNN_*.sql) при старте воркера; иначе —
+    # python -m infrastructure.db.mysql.migrations
+    MIGRATIONS_AUTO_APPLY = os.getenv("MIGRATIONS_AUTO_APPLY", "0") == "1"
+    # EXPLAIN запросов горячих путей при старте: полный просмотр таблицы от MIN_ROWS строк — warning
+    QUERY_PLAN_CHECK_ENABLED = os.getenv("QUERY_PLAN_CHECK_ENABLED", "1") == "1"
+    QUERY_PLAN_CHECK_MIN_ROWS = int(os.getenv("QUERY_PLAN_CHECK_MIN_ROWS", "1000"))
+
+
+settings = Settings()
@@ -0,0 +1,161 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from core.config import settings
+from utils.logger import get_logger
+
+logger = get_logger("Deadline")
+
+
+class DeadlineExceededError(TimeoutError):
+    """Время запроса вышло или клиент уже отключился — продолжать работу бессмысленно."""
+    pass
+
+
+class RequestDeadline:
+    """
+    Срок запроса. Один объект на запрос: to_thread копирует контекст, но ссылается на тот же объект,
+    поэтому отключение клиента видно и в рабочих потоках.
+    """
+    __slots__ = ("expires_at", "cancelled")
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.expires_at = time.monotonic() + timeout if timeout else None
+        self.cancelled = False
+
+    def apply_default(self, timeout: float):
+        """Дефолт маршрута действует, только если клиент не прислал свой срок; 0 — без срока."""
+        if self.expires_at is None and timeout > 0:
+            self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def check(self):
+        if self.cancelled:
+            raise DeadlineExceededError("Client disconnected")
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceededError("Request deadline exceeded")
+
+
+_current_deadline: ContextVar[Optional[RequestDeadline]] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[RequestDeadline]:
+    return _current_deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Секунд до срока текущего запроса; None — срока нет (фоновые задачи, скрипты)."""
+    deadline = _current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def check_deadline():
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+@contextmanager
+def detached_from_client():
+    """
+    Внутри — копия срока текущего запроса без реакции на отключение клиента (срок по времени остаётся).
+    Задачи, созданные здесь, доводят операцию до конца, даже если клиент ушёл.
+    """
+    current = _current_deadline.get()
+    if current is None:
+        yield
+        return
+    detached = RequestDeadline()
+    detached.expires_at = current.expires_at
+    token = _current_deadline.set(detached)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def parse_route_timeouts(raw: str) -> Dict[str, float]:
+    """ "get_tasks=15,task_events=0" -> {"get_tasks": 15.0, "task_events": 0.0} """
+    result = {}
+    for part in (raw or "").split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip():
+            result[name.strip()] = float(value)
+    return result
+
+
+def _header_timeout(scope) -> Optional[float]:
+    name = settings.DEADLINE_HEADER.lower().encode("latin-1")
+    for key, value in scope.get("headers", []):
+        if key == name:
+            try:
+                timeout = float(value.decode("latin-1"))
+            except ValueError:
+                return None
+            return min(timeout, settings.DEADLINE_MAX_SEC) if timeout > 0 else None
+    return None
+
+
+class DeadlineMiddleware:
+    """
+    ASGI-мидлварь: создаёт срок запроса (из заголовка DEADLINE_HEADER, иначе его ставит
+    зависимость маршрута) и следит за отключением клиента.
+    Входящие сообщения читает отдельная задача и передаёт приложению через очередь —
+    так http.disconnect замечается, даже если обработчик уже прочитал тело и больше не слушает.
+    Отключился до конца ответа -> срок помечается отменённым, задача приложения отменяется.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = RequestDeadline(_header_timeout(scope))
+        token = _current_deadline.set(deadline)
+        messages: asyncio.Queue = asyncio.Queue()
+        response_complete = False
+        app_running = True
+        app_task = asyncio.current_task()
+
+        async def watch_receive():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if app_running and not response_complete:
+                        deadline.cancelled = True
+                        logger.info("Client disconnected before response: %s %s", scope.get("method"), scope.get("path"))
+                        app_task.cancel()
+                    return
+
+        async def receive_proxy():
+            return await messages.get()
+
+        async def send_wrapper(message):
+            nonlocal response_complete
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        watcher = asyncio.create_task(watch_receive())
+        try:
+            await self.app(scope, receive_proxy, send_wrapper)
+        except asyncio.CancelledError:
+            if not deadline.cancelled:
+                raise
+            # отмену инициировали мы сами, ответ всё равно некому отдавать
+            app_task.uncancel()
+        finally:
+            app_running = False
+            watcher.cancel()
+            _current_deadline.reset(token)
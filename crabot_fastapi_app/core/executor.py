@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from core import deadline
+from utils.logger import get_logger
+
+logger = get_logger("BlockingExecutor")
+
+executor_queued = Gauge("app_executor_queue_depth", "Calls waiting for a worker thread", ["name"])
+executor_running = Gauge("app_executor_running", "Calls currently running in worker threads", ["name"])
+executor_wait = Histogram("app_executor_wait_seconds", "Time from submit to start in a worker thread", ["name"],
+                          buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+executor_rejected = Counter("app_executor_rejected", "Calls rejected because the executor queue is full", ["name"])
+
+
+class ExecutorSaturatedError(Exception):
+    """Все потоки заняты и очередь полна — отказываем сразу, а не копим корутины за пулом соединений."""
+    def __init__(self, name: str, retry_after: float = 1.0):
+        super().__init__(f"{name} is overloaded, retry later")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class TrackedCall:
+    """Вызов, отправленный в пул внутри track_calls(): начал ли выполняться и чем закончился."""
+    __slots__ = ("future", "started")
+
+    def __init__(self):
+        self.future: Optional[Future] = None
+        self.started = False
+
+    @property
+    def may_have_applied(self) -> bool:
+        # не начался (отменён в очереди, отказ по сроку) или упал — изменений нет; иначе могли дойти до БД
+        if not self.started:
+            return False
+        future = self.future
+        return future is None or not future.done() or (not future.cancelled() and future.exception() is None)
+
+
+_tracked_calls: contextvars.ContextVar[Optional[List[TrackedCall]]] = contextvars.ContextVar(
+    "executor_tracked_calls", default=None)
+
+
+@contextmanager
+def track_calls() -> Iterator[List[TrackedCall]]:
+    """Собирает вызовы BlockingExecutor.run из текущего контекста (и созданных в нём задач)."""
+    calls: List[TrackedCall] = []
+    token = _tracked_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _tracked_calls.reset(token)
+
+
+class BlockingExecutor:
+    """
+    Отдельный пул потоков для блокирующих вызовов БД. Потоков столько же, сколько соединений
+    в пуле MySQL: лишние потоки всё равно ждали бы в Pool.acquire.
+    Сверх них в очереди ждут не больше max_queue вызовов, остальные получают ExecutorSaturatedError.
+    Контекст (срок запроса, трассировка, маршрутизация чтений) копируется в поток.
+    """
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = int(max_workers)
+        self.max_queue = int(max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0   # в очереди + выполняются
+        self._running = 0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                executor_rejected.labels(self.name).inc()
+                raise ExecutorSaturatedError(self.name)
+            self._pending += 1
+        executor_queued.labels(self.name).inc()
+
+        ctx = contextvars.copy_context()
+        submitted = time.perf_counter()
+        tracked = _tracked_calls.get()
+        call = None
+        if tracked is not None:
+            call = TrackedCall()
+            tracked.append(call)
+
+        def _call():
+            executor_queued.labels(self.name).dec()
+            executor_wait.labels(self.name).observe(time.perf_counter() - submitted)
+            with self._lock:
+                self._running += 1
+            executor_running.labels(self.name).inc()
+            try:
+                # клиент ушёл или срок вышел, пока вызов стоял в очереди, — не занимаем соединение
+                ctx.run(deadline.check_deadline)
+                if call is not None:
+                    call.started = True
+                return ctx.run(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                executor_running.labels(self.name).dec()
+
+        future = self._pool.submit(_call)
+        if call is not None:
+            call.future = future
+        # счётчик освобождается, когда поток закончил (или вызов отменён до старта), а не когда ушёл ожидающий
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+        if future.cancelled():
+            executor_queued.labels(self.name).dec()
+
+    def bind(self, target: Any) -> "_ExecutorProxy":
+        """Обёртка объекта: await proxy.method(...) выполняет target.method(...) в этом пуле."""
+        return _ExecutorProxy(self, target)
+
+    @property
+    def queued(self) -> int:
+        return self._pending - self._running
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"workers": self.max_workers,
+                    "max_queue": self.max_queue,
+                    "running": self._running,
+                    "queued": self._pending - self._running}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        logger.info("Executor %s shut down", self.name)
+
+
+class _ExecutorProxy:
+    __slots__ = ("_executor", "_target")
+
+    def __init__(self, executor: BlockingExecutor, target: Any):
+        self._executor = executor
+        self._target = target
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        return functools.partial(self._executor.run, attr)
@@ -0,0 +1,335 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from core.deadline import DeadlineExceededError, detached_from_client
+from core.executor import ExecutorSaturatedError, TrackedCall, track_calls
+from core.resilience import CircuitOpenError
+from utils.logger import get_logger
+
+logger = get_logger("Idempotency")
+
+idempotency_requests = Counter("app_idempotency_requests", "Requests with Idempotency-Key by outcome", ["outcome"])
+
+_HEADER = b"idempotency-key"
+# эти заголовки относятся к конкретному ответу, а не к результату операции
+_SKIP_HEADERS = {"set-cookie", "date", "server", "server-timing", "traceparent"}
+
+
+def _log_failure(action: str):
+    def callback(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Failed to %s: %s", action, task.exception())
+    return callback
+
+
+class _DetachableSend:
+    """send клиенту; после ухода клиента сообщения молча отбрасываются, а операция продолжается."""
+    __slots__ = ("send", "detached")
+
+    def __init__(self, send):
+        self.send = send
+        self.detached = False
+
+    async def __call__(self, message):
+        if not self.detached:
+            await self.send(message)
+
+
+class StoredResponse:
+    __slots__ = ("request_hash", "status", "headers", "body", "expires_at")
+
+    def __init__(self, request_hash: str, status: int, headers: List[Tuple[str, str]], body: bytes, expires_at: float):
+        self.request_hash = request_hash
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+
+class _LRU:
+    def __init__(self, capacity: int):
+        self.capacity = int(capacity)
+        self._items: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item.expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item
+
+    def put(self, key: str, item: StoredResponse):
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI-мидлварь для Idempotency-Key на мутирующих эндпойнтах (routes — пути, только POST/PUT/PATCH).
+    Первый ответ (кроме 5xx и 401/403/408/429) сохраняется: в LRU воркера и в MySQL для других воркеров —
+    и отдаётся повторам с тем же ключом и тем же телом. Тот же ключ с другим телом — 422.
+    Одновременные дубли в воркере ждут результат первого; дубль, который выполняет другой воркер, —
+    ждёт до wait_sec, затем 409. store — IdempotencyKeysController, executor — пул потоков БД.
+    Отключение клиента запрос не прерывает: операция доводится до конца и её ответ сохраняется,
+    иначе вызов БД, уже ушедший в поток, закоммитился бы, а повтор с тем же ключом выполнил бы его снова.
+    Подключается внутри сжатия: хранится несжатое тело.
+    """
+    _STORABLE_4XX_EXCLUDED = {401, 403, 408, 429}
+
+    def __init__(self, app, store, executor, routes: str, ttl: float = 86400, lease: float = 60,
+                 cache_size: int = 10000, wait_sec: float = 10.0):
+        self.app = app
+        self.store = store
+        self.executor = executor
+        self.routes = {p.strip() for p in (routes or "").split(",") if p.strip()}
+        self.ttl = int(ttl)
+        self.lease = int(lease)
+        self.wait_sec = float(wait_sec)
+        self._cache = _LRU(cache_size)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._purged_at = time.monotonic()
+
+    @staticmethod
+    def _scoped_key(scope, idem_key: str, headers: dict) -> str:
+        # ключ действует в пределах эндпойнта и учётных данных: чужой ключ не отдаст чужой ответ
+        auth = headers.get(b"authorization", b"")
+        return hashlib.sha256(b"\0".join([auth, scope["path"].encode("utf-8"), idem_key.encode("utf-8")])).hexdigest()
+
+    @staticmethod
+    def _request_hash(scope, headers: dict, body: bytes) -> str:
+        # If-Match меняет смысл запроса: тот же payload с другой версией — другой запрос
+        return hashlib.sha256(b"\0".join([scope["method"].encode("latin-1"),
+                                          headers.get(b"if-match", b""), body])).hexdigest()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH") or scope["path"] not in self.routes:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers", []))
+        idem_key = headers.get(_HEADER)
+        if not idem_key:
+            await self.app(scope, receive, send)
+            return
+        idem_key = idem_key.decode("latin-1")
+        if len(idem_key) > 255:
+            await self._send_json(send, 400, {"detail": "Idempotency-Key is too long"})
+            return
+
+        body, more = [], True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message.get("body", b""))
+            more = message.get("more_body", False)
+        body = b"".join(body)
+
+        key = self._scoped_key(scope, idem_key, headers)
+        request_hash = self._request_hash(scope, headers, body)
+
+        # дубль в этом же воркере: ждём первый запрос, потом смотрим в кэш
+        while True:
+            stored = self._cache.get(key)
+            if stored is not None:
+                await self._replay(send, stored, request_hash, "replayed_local")
+                return
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+            await asyncio.shield(pending)
+
+        done = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = done
+        sink = _DetachableSend(send)
+        with detached_from_client():
+            task = asyncio.ensure_future(self._execute(scope, receive, sink, body, key, request_hash))
+        # дубли в воркере ждут окончания операции, а не ухода клиента
+        task.add_done_callback(lambda _: self._finish_in_flight(key, done))
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.done():
+                raise
+            # DeadlineMiddleware отменил запрос (клиент ушёл): ответ отдать некому, но результат сохраним
+            sink.detached = True
+            task.add_done_callback(_log_failure("finish idempotent request"))
+            raise
+
+    def _finish_in_flight(self, key: str, done: asyncio.Future):
+        if self._in_flight.get(key) is done:
+            del self._in_flight[key]
+        if not done.done():
+            done.set_result(None)
+
+    async def _execute(self, scope, receive, send, body: bytes, key: str, request_hash: str):
+        use_db = True
+        try:
+            outcome, row = await self.executor.run(self.store.claim, key, scope["path"], request_hash, self.lease, self.ttl)
+        except (CircuitOpenError, ExecutorSaturatedError) as e:
+            # без проверки ключа выполнять нельзя: при перегрузке лучше отказать, чем продублировать
+            retry_after = str(math.ceil(e.retry_after)).encode("latin-1")
+            await self._send_json(send, 503, {"detail": str(e)}, [(b"retry-after", retry_after)])
+            return
+        except DeadlineExceededError as e:
+            await self._send_json(send, 504, {"detail": str(e)})
+            return
+        except Exception as e:
+            # таблица недоступна — работаем только с кэшем воркера, запрос не роняем
+            logger.warning("Idempotency store unavailable, using local cache only: %s", e)
+            outcome, row, use_db = "claimed", None, False
+
+        if outcome == "busy":
+            row = await self._wait_for_other_worker(key)
+            if row is None:
+                idempotency_requests.labels("conflict").inc()
+                await self._send_json(send, 409, {"detail": "A request with this Idempotency-Key is in progress"},
+                                      [(b"retry-after", b"1")])
+                return
+            outcome = "stored"
+        if outcome == "stored":
+            stored = self._from_row(row)
+            self._cache.put(key, stored)
+            await self._replay(send, stored, request_hash, "replayed_db")
+            return
+
+        status, headers, chunks = None, [], []
+
+        body_sent = False
+
+        async def receive_body():
+            # тело уже прочитано ради хеша — отдаём его приложению, дальше (disconnect) — исходный receive
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])
+                           if k.decode("latin-1").lower() not in _SKIP_HEADERS]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        completed = False
+        calls: List[TrackedCall] = []
+        try:
+            with track_calls() as calls:
+                await self.app(scope, receive_body, capture)
+            if status is not None and self._storable(status):
+                response_body = b"".join(chunks)
+                self._cache.put(key, StoredResponse(request_hash, status, headers, response_body,
+                                                    time.monotonic() + self.ttl))
+                if use_db:
+                    await self.executor.run(self.store.complete, key, status, headers, response_body)
+                completed = True
+                idempotency_requests.labels("stored").inc()
+        except Exception as e:
+            if status is None:
+                raise
+            # ответ клиенту уже ушёл; не удалось только сохранить его
+            logger.warning("Failed to store idempotent response: %s", e)
+        finally:
+            if use_db and not completed:
+                self._settle_lease(key, calls)
+        if use_db:
+            self._maybe_purge()
+
+    def _storable(self, status: int) -> bool:
+        return status < 500 and status not in self._STORABLE_4XX_EXCLUDED
+
+    async def _wait_for_other_worker(self, key: str) -> Optional[dict]:
+        deadline = time.monotonic() + self.wait_sec
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            try:
+                row = await self.executor.run(self.store.get, key)
+            except Exception as e:
+                logger.warning("Failed to poll idempotency key: %s", e)
+                return None
+            if row is None:
+                return None
+            if row["status_code"] is not None:
+                return row
+        return None
+
+    def _from_row(self, row: dict) -> StoredResponse:
+        headers = [tuple(h) for h in (row["response_headers"] or [])]
+        return StoredResponse(row["request_hash"], row["status_code"], headers, bytes(row["response_body"] or b""),
+                              time.monotonic() + self.ttl)
+
+    def _settle_lease(self, key: str, calls: List[TrackedCall]):
+        """
+        Ответ не сохранён. Аренду снимаем, только если ни один вызов БД не мог ничего изменить;
+        ещё выполняющиеся вызовы сначала дожидаемся.
+        """
+        pending = [c.future for c in calls if c.started and c.future is not None and not c.future.done()]
+        if pending:
+            task = asyncio.get_running_loop().create_task(self._settle_after(key, calls, pending),
+                                                          context=contextvars.Context())
+            task.add_done_callback(_log_failure("settle idempotency key"))
+        elif any(c.may_have_applied for c in calls):
+            # повтор до истечения аренды получит 409, а не выполнит операцию второй раз
+            logger.warning("Idempotency key kept until its lease expires: the operation may have been applied "
+                           "but no response was stored")
+        else:
+            self._release_in_background(key)
+
+    async def _settle_after(self, key: str, calls: List[TrackedCall], pending: list):
+        await asyncio.wait([asyncio.wrap_future(f) for f in pending])
+        self._settle_lease(key, calls)
+
+    def _release_in_background(self, key: str):
+        # чистый контекст: срок отменённого запроса не должен помешать снять аренду
+        coro = self.executor.run(self.store.release, key)
+        task = asyncio.get_running_loop().create_task(coro, context=contextvars.Context())
+        task.add_done_callback(_log_failure("release idempotency key"))
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        if now - self._purged_at < 600:
+            return
+        self._purged_at = now
+        task = asyncio.get_running_loop().create_task(self.executor.run(self.store.purge_expired),
+                                                      context=contextvars.Context())
+        task.add_done_callback(_log_failure("purge expired idempotency keys"))
+
+    async def _replay(self, send, stored: StoredResponse, request_hash: str, outcome: str):
+        if stored.request_hash != request_hash:
+            idempotency_requests.labels("mismatch").inc()
+            await self._send_json(send, 422, {"detail": "Idempotency-Key was already used with a different request"})
+            return
+        idempotency_requests.labels(outcome).inc()
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in stored.headers]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": stored.status, "headers": headers})
+        await send({"type": "http.response.body", "body": stored.body})
+
+    @staticmethod
+    async def _send_json(send, status: int, content: dict, extra_headers: Optional[list] = None):
+        body = json.dumps(content).encode("utf-8")
+        await send({"type": "http.response.start",
+                    "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode("latin-1"))] + (extra_headers or [])})
+        await send({"type": "http.response.body", "body": body})
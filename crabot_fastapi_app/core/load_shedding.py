@@ -0,0 +1,227 @@
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from utils.logger import get_logger
+
+logger = get_logger("LoadShedding")
+
+concurrency_limit = Gauge("app_concurrency_limit", "Current adaptive limit of in-flight requests")
+concurrency_in_flight = Gauge("app_concurrency_in_flight", "Requests counted against the adaptive limit")
+load_shed = Counter("app_load_shed", "Requests rejected by the adaptive concurrency limit", ["priority"])
+
+# доля лимита, до которой допускается класс: тяжёлые списки режутся первыми, справочники — последними
+PRIORITY_SHARES: Dict[str, float] = {"high": 1.0, "normal": 0.8, "low": 0.5}
+EXEMPT = "exempt"
+
+
+def parse_priority_routes(raw: str) -> List[Tuple[str, str]]:
+    """ "exempt=/healthcheck,/metrics;low=/stock_transfer/get_tasks" -> [(префикс, класс)], длинные префиксы первыми """
+    routes = []
+    for group in (raw or "").split(";"):
+        if not group.strip():
+            continue
+        priority, _, paths = group.partition("=")
+        priority = priority.strip()
+        if priority != EXEMPT and priority not in PRIORITY_SHARES:
+            raise ValueError(f"Unknown priority class: {priority!r}")
+        routes.extend((p.strip().rstrip("/"), priority) for p in paths.split(",") if p.strip())
+    return sorted(routes, key=lambda r: -len(r[0]))
+
+
+class _RouteLatency:
+    """Задержка одного маршрута: быстрая EWMA (текущая) и медленная (норма с обычным разбросом)."""
+    __slots__ = ("short", "long", "samples")
+
+    def __init__(self, rtt: float):
+        self.short = rtt
+        self.long = rtt
+        self.samples = 0
+
+    def observe(self, rtt: float, short_weight: float, long_weight: float, tolerance: float) -> float:
+        self.samples += 1
+        self.short += (rtt - self.short) * short_weight
+        gradient = self.short / self.long if self.long > 0 else 1.0
+        # пока маршрут перегружен, норма почти не растёт: иначе затяжная перегрузка за полсотни
+        # ответов стала бы новой нормой; настоящий сдвиг задержки она всё же догонит, в 10 раз медленнее
+        self.long += (rtt - self.long) * (long_weight if gradient <= tolerance else long_weight * 0.1)
+        return gradient
+
+
+class AdaptiveLimiter:
+    """
+    Адаптивный лимит одновременных запросов (AIMD).
+    Задержка сравнивается внутри маршрута: быстрая EWMA против медленной (градиент), а в сигнал идёт
+    средний градиент по ответам за интервал — смесь быстрых справочников и медленных списков
+    перегрузкой не считается. Маршрут участвует после warmup ответов; маршрутов не больше max_routes,
+    остальные считаются по классу приоритета.
+    Не чаще раза в adjust_interval: перегрузка (градиент больше tolerance, event loop отстаёт больше
+    lag_threshold, очередь за соединениями/потоками БД держится дольше queue_sustain) —
+    лимит умножается на backoff; иначе, если в лимит упираются (почти выбран или были отказы), растёт на 1.
+    signals() -> (задержка event loop, число ожидающих соединения/поток).
+    """
+    _SHORT_WEIGHT = 0.2
+    _LONG_WEIGHT = 0.01
+
+    def __init__(self,
+                 initial: int = 64,
+                 min_limit: int = 8,
+                 max_limit: int = 512,
+                 tolerance: float = 2.0,
+                 lag_threshold: float = 0.1,
+                 backoff: float = 0.9,
+                 adjust_interval: float = 0.1,
+                 queue_sustain: float = 0.5,
+                 warmup: int = 20,
+                 max_routes: int = 256,
+                 signals: Optional[Callable[[], Tuple[float, int]]] = None):
+        self.min_limit = int(min_limit)
+        self.max_limit = int(max_limit)
+        self.tolerance = float(tolerance)
+        self.lag_threshold = float(lag_threshold)
+        self.backoff = float(backoff)
+        self.adjust_interval = float(adjust_interval)
+        self.queue_sustain = float(queue_sustain)
+        self.warmup = int(warmup)
+        self.max_routes = int(max_routes)
+        self.signals = signals or (lambda: (0.0, 0))
+
+        self._lock = threading.Lock()
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._routes: Dict[str, _RouteLatency] = {}
+        self._gradient_sum = 0.0
+        self._gradient_count = 0
+        self._gradient: Optional[float] = None
+        self._queued_since: Optional[float] = None
+        self._adjusted_at = time.monotonic()
+        self._congested = False
+        self._shed_since_adjust = False
+        concurrency_limit.set(self._limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def try_acquire(self, priority: str) -> bool:
+        with self._lock:
+            if self._in_flight >= max(1, int(self._limit * PRIORITY_SHARES[priority])):
+                self._shed_since_adjust = True
+                return False
+            self._in_flight += 1
+        concurrency_in_flight.inc()
+        return True
+
+    def release(self, rtt: float, route: str = "normal", priority: str = "normal"):
+        """route — шаблон пути (или любой ключ маршрута), priority — запасной ключ сверх max_routes."""
+        now = time.monotonic()
+        with self._lock:
+            # спрос упирается в лимит: он почти выбран или кому-то уже отказали
+            utilized = self._in_flight >= self._limit * 0.9 or self._shed_since_adjust
+            self._in_flight -= 1
+            if route not in self._routes and len(self._routes) >= self.max_routes:
+                route = priority
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = _RouteLatency(rtt)
+            gradient = stats.observe(rtt, self._SHORT_WEIGHT, self._LONG_WEIGHT, self.tolerance)
+            if stats.samples > self.warmup:
+                self._gradient_sum += gradient
+                self._gradient_count += 1
+            adjust = now - self._adjusted_at >= self.adjust_interval
+            if adjust:
+                self._adjusted_at = now
+                self._shed_since_adjust = False
+        concurrency_in_flight.dec()
+        if adjust:
+            self._adjust(utilized, now)
+
+    def _adjust(self, utilized: bool, now: float):
+        lag, waiters = self.signals()
+        with self._lock:
+            if self._gradient_count:
+                self._gradient = self._gradient_sum / self._gradient_count
+                self._gradient_sum, self._gradient_count = 0.0, 0
+            # одиночный всплеск очереди (пачка вызовов чуть больше пула) — ещё не перегрузка
+            if waiters > 0:
+                if self._queued_since is None:
+                    self._queued_since = now
+            else:
+                self._queued_since = None
+            queue_sustained = self._queued_since is not None and now - self._queued_since >= self.queue_sustain
+            congested = ((self._gradient is not None and self._gradient > self.tolerance)
+                         or lag > self.lag_threshold or queue_sustained)
+            if congested:
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+            elif utilized:
+                self._limit = min(self.max_limit, self._limit + 1)
+            limit = self._limit
+            gradient = self._gradient or 1.0
+            changed = congested != self._congested
+            self._congested = congested
+        concurrency_limit.set(limit)
+        if changed:
+            logger.warning("Concurrency limit %s: limit=%d, latency_gradient=%.2f, loop_lag=%.0fms, waiters=%d",
+                           "backing off" if congested else "recovering", limit, gradient, lag * 1000, waiters)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"limit": int(self._limit),
+                    "in_flight": self._in_flight,
+                    "congested": self._congested,
+                    "latency_gradient": round(self._gradient, 2) if self._gradient is not None else None,
+                    "routes": {route: {"rtt_ms": round(r.short * 1000, 1), "normal_ms": round(r.long * 1000, 1)}
+                               for route, r in self._routes.items()}}
+
+
+class LoadSheddingMiddleware:
+    """
+    ASGI-мидлварь: запрос сверх адаптивного лимита своего класса получает 503 + Retry-After,
+    не доходя до обработчика. Класс — по префиксу пути (routes); exempt (healthcheck, метрики,
+    долгие SSE-потоки) в лимите не участвуют, прочие пути — normal.
+    """
+    def __init__(self, app, limiter: AdaptiveLimiter, routes: str = "", retry_after: int = 1):
+        self.app = app
+        self.limiter = limiter
+        self.routes = parse_priority_routes(routes)
+        self.retry_after = int(retry_after)
+
+    def _priority(self, path: str) -> str:
+        for prefix, priority in self.routes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return priority
+        return "normal"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        priority = self._priority(scope.get("path", ""))
+        if priority == EXEMPT:
+            await self.app(scope, receive, send)
+            return
+
+        if not self.limiter.try_acquire(priority):
+            load_shed.labels(priority).inc()
+            await self._reject(send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # шаблон пути маршрута (Starlette кладёт его в scope) — задержки /x/{id} сравниваются между собой
+            route = getattr(scope.get("route"), "path", None) or priority
+            self.limiter.release(time.perf_counter() - started, route, priority)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Server is overloaded, retry later"}).encode("utf-8")
+        await send({"type": "http.response.start",
+                    "status": 503,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode("latin-1")),
+                                (b"retry-after", str(self.retry_after).encode("latin-1"))]})
+        await send({"type": "http.response.body", "body": body})
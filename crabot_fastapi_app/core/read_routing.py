@@ -0,0 +1,115 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+from typing import Dict, Optional
+
+# кука переживает балансировку между воркерами; словарь в памяти — для клиентов без кук
+_COOKIE_NAME = "rw_primary_until"
+
+
+class ReadRouting:
+    """Состояние маршрутизации чтений в рамках одного HTTP-запроса."""
+    __slots__ = ("primary", "wrote")
+
+    def __init__(self, primary: bool = False):
+        self.primary = primary
+        self.wrote = False
+
+
+_current_routing: ContextVar[Optional[ReadRouting]] = ContextVar("read_routing", default=None)
+_force_primary: ContextVar[bool] = ContextVar("force_primary", default=False)
+
+
+def prefer_primary() -> bool:
+    """Чтение должно идти в primary: явный use_primary() или клиент недавно писал."""
+    if _force_primary.get():
+        return True
+    routing = _current_routing.get()
+    return routing is not None and routing.primary
+
+
+def mark_write():
+    """После записи все последующие чтения этого клиента на время окна идут в primary."""
+    routing = _current_routing.get()
+    if routing is not None:
+        routing.primary = True
+        routing.wrote = True
+
+
+@contextmanager
+def use_primary():
+    """Для чтений, которым нельзя отставать (лента изменений, проверка после CAS)."""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI-мидлварь: помечает запрос как «липкий к primary», если этот клиент писал
+    меньше window секунд назад. Клиент — X-Client-Id или адрес; отметка хранится
+    в памяти воркера и дублируется кукой, чтобы её видели и другие воркеры.
+    """
+    def __init__(self, app, window: float = 5.0):
+        self.app = app
+        self.window = float(window)
+        self._recent_writers: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _client_key(self, scope, headers: dict) -> Optional[str]:
+        client_id = headers.get(b"x-client-id")
+        if client_id:
+            return client_id.decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else None
+
+    def _sticky(self, key: Optional[str], headers: dict, now: float) -> bool:
+        if key is not None:
+            until = self._recent_writers.get(key)
+            if until is not None:
+                if until > now:
+                    return True
+                with self._lock:
+                    self._recent_writers.pop(key, None)
+        cookie_header = headers.get(b"cookie")
+        if cookie_header:
+            cookie = SimpleCookie()
+            try:
+                cookie.load(cookie_header.decode("latin-1"))
+                morsel = cookie.get(_COOKIE_NAME)
+                return morsel is not None and float(morsel.value) > time.time()
+            except Exception:
+                return False
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.window <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        key = self._client_key(scope, headers)
+        routing = ReadRouting(primary=self._sticky(key, headers, time.monotonic()))
+        token = _current_routing.set(routing)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and routing.wrote:
+                if key is not None:
+                    now = time.monotonic()
+                    with self._lock:
+                        if len(self._recent_writers) > 10000:
+                            self._recent_writers = {k: v for k, v in self._recent_writers.items() if v > now}
+                        self._recent_writers[key] = now + self.window
+                cookie = f"{_COOKIE_NAME}={time.time() + self.window:.3f}; Max-Age={int(self.window) + 1}; Path=/; HttpOnly"
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"set-cookie", cookie.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_routing.reset(token)
+
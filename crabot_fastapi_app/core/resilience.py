@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge
+
+from utils.logger import get_logger
+
+logger = get_logger("Resilience")
+
+breaker_state = Gauge("app_circuit_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", ["name"])
+bulkhead_in_flight = Gauge("app_bulkhead_in_flight", "Requests currently inside a bulkhead", ["name"])
+bulkhead_rejected = Counter("app_bulkhead_rejected", "Requests rejected by a full bulkhead", ["name"])
+
+
+class CircuitOpenError(Exception):
+    """Предохранитель разомкнут: вызов отклонён без обращения к ресурсу."""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open), retry after {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BulkheadFullError(Exception):
+    def __init__(self, name: str, retry_after: float = 1.0):
+        super().__init__(f"Too many concurrent requests to {name}")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Предохранитель по доле ошибок в скользящем окне.
+    closed -> open: в окне window_sec не меньше min_calls вызовов и доля ошибок >= failure_rate.
+    open -> half-open: через open_sec; пропускается half_open_calls пробных вызовов.
+    half-open -> closed после успешной пробы, -> open после неудачной.
+    """
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self,
+                 name: str,
+                 failure_rate: float = 0.5,
+                 min_calls: int = 10,
+                 window_sec: float = 30.0,
+                 open_sec: float = 10.0,
+                 half_open_calls: int = 1):
+        self.name = name
+        self.failure_rate = float(failure_rate)
+        self.min_calls = int(min_calls)
+        self.window_sec = float(window_sec)
+        self.open_sec = float(open_sec)
+        self.half_open_calls = int(half_open_calls)
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._calls: deque = deque()  # (monotonic ts, ok)
+        self._opened_at = 0.0
+        self._probes = 0
+        breaker_state.labels(name).set(0)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == self.OPEN and now - self._opened_at >= self.open_sec:
+            self._set_state(self.HALF_OPEN)
+            self._probes = 0
+        return self._state
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            logger.warning("Circuit breaker %s: %s -> %s", self.name, self._state, state)
+        self._state = state
+        breaker_state.labels(self.name).set(self._STATE_VALUES[state])
+
+    def before_call(self):
+        """Бросает CircuitOpenError, если вызов сейчас не разрешён."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return
+            retry_after = max(self.open_sec - (now - self._opened_at), 1.0)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        self._record(True)
+
+    def record_failure(self):
+        self._record(False)
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == self.HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+                if ok:
+                    self._calls.clear()
+                    self._set_state(self.CLOSED)
+                else:
+                    self._open(now)
+                return
+            if state == self.OPEN:
+                return
+
+            self._calls.append((now, ok))
+            while self._calls and now - self._calls[0][0] > self.window_sec:
+                self._calls.popleft()
+            if ok or len(self._calls) < self.min_calls:
+                return
+            failures = sum(1 for _, call_ok in self._calls if not call_ok)
+            if failures / len(self._calls) >= self.failure_rate:
+                self._open(now)
+
+    def _open(self, now: float):
+        self._opened_at = now
+        self._calls.clear()
+        self._set_state(self.OPEN)
+
+    def allows_retry(self) -> bool:
+        """Повтор имеет смысл только в закрытом состоянии — иначе мы лишь добавляем нагрузку."""
+        return self.state == self.CLOSED
+
+    def status(self) -> dict:
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            failures = sum(1 for _, ok in self._calls if not ok)
+            return {"state": state, "calls_in_window": len(self._calls), "failures_in_window": failures}
+
+
+class Bulkhead:
+    """Ограничение одновременных запросов к одному эндпойнту. Без очереди: нет места — сразу отказ."""
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = int(limit)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self._in_flight >= self.limit:
+                bulkhead_rejected.labels(self.name).inc()
+                raise BulkheadFullError(self.name)
+            self._in_flight += 1
+        bulkhead_in_flight.labels(self.name).inc()
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+        bulkhead_in_flight.labels(self.name).dec()
+
+    def status(self) -> dict:
+        return {"limit": self.limit, "in_flight": self._in_flight}
+
+
+class BulkheadRegistry:
+    """Бакхеды создаются лениво по имени эндпойнта; лимиты — из "name=limit,name=limit"."""
+    def __init__(self, default_limit: int, limits: str = ""):
+        self.default_limit = int(default_limit)
+        self._limits: Dict[str, int] = {}
+        for part in (limits or "").split(","):
+            name, _, value = part.partition("=")
+            if name.strip() and value.strip():
+                self._limits[name.strip()] = int(value)
+        self._bulkheads: Dict[str, Bulkhead] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[Bulkhead]:
+        bulkhead = self._bulkheads.get(name)
+        if bulkhead is None:
+            limit = self._limits.get(name, self.default_limit)
+            if limit <= 0:
+                return None
+            with self._lock:
+                bulkhead = self._bulkheads.setdefault(name, Bulkhead(name, limit))
+        return bulkhead
+
+    def status(self) -> dict:
+        return {name: b.status() for name, b in list(self._bulkheads.items())}
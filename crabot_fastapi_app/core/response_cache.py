@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from core.compression import choose_encoding, compress
+from core.config import settings
+
+
+class CachedBody:
+    """Сериализованный JSON-ответ + лениво посчитанные сжатые варианты."""
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.body = body
+        self.media_type = media_type
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_data(cls, data: Any) -> "CachedBody":
+        # как JSONResponse: без ASCII-экранирования и лишних пробелов
+        body = json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return cls(body)
+
+    def encoded(self, encoding: str) -> bytes:
+        cached = self._encoded.get(encoding)
+        if cached is None:
+            with self._lock:
+                cached = self._encoded.get(encoding)
+                if cached is None:
+                    cached = compress(self.body, encoding)
+                    self._encoded[encoding] = cached
+        return cached
+
+    def to_response(self, request: Request) -> Response:
+        encoding = None
+        if len(self.body) >= settings.COMPRESSION_MIN_SIZE:
+            encoding = choose_encoding(request.headers.get("accept-encoding"))
+        if encoding is None:
+            return Response(content=self.body, media_type=self.media_type, headers={"Vary": "Accept-Encoding"})
+        return Response(content=self.encoded(encoding),
+                        media_type=self.media_type,
+                        headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+
+
+class ResponseCache:
+    """TTL-кэш готовых тел ответов для редко меняющихся справочников."""
+    def __init__(self, ttl: float):
+        self._ttl = float(ttl)
+        self._entries: Dict[str, Tuple[float, CachedBody]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        """Только из кэша, без загрузки — для проверки в event loop до ухода в поток."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Optional[CachedBody]:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        data = loader()
+        if data is None:
+            # ошибку загрузки не кэшируем
+            return None
+        cached = CachedBody.from_data(data)
+        with self._lock:
+            self._entries[key] = (now + self._ttl, cached)
+        return cached
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
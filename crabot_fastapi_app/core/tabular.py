@@ -0,0 +1,118 @@
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from fastapi import Response
+
+# msgpack и pyarrow — опциональные зависимости: без них остаётся колоночный JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+COLUMNAR_JSON = "application/vnd.crabot.columnar+json"
+MSGPACK = "application/x-msgpack"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# синонимы, которые встречаются у клиентов
+_ALIASES = {"application/msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+
+# таблица: имя колонки -> значения по строкам
+Table = Dict[str, List[Any]]
+
+
+class NotAcceptableError(Exception):
+    pass
+
+
+def available_formats() -> list[str]:
+    """Табличные форматы в порядке предпочтения сервера."""
+    formats = []
+    if pyarrow is not None:
+        formats.append(ARROW_STREAM)
+    if msgpack is not None:
+        formats.append(MSGPACK)
+    formats.append(COLUMNAR_JSON)
+    return formats
+
+
+def choose_format(accept: Optional[str]) -> Optional[str]:
+    """
+    Разбирает Accept (с q-весами). None — обычный JSON массивом объектов: его дают и application/json,
+    и маски */* — табличный формат выбирается только явным типом с весом не меньше, чем у JSON.
+    Явно запрошенный формат без установленной библиотеки (и ничего другого) — NotAcceptableError.
+    """
+    if not accept:
+        return None
+
+    weights: dict[str, float] = {}
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        media_type = _ALIASES.get(media_type, media_type)
+        weights[media_type] = max(q, weights.get(media_type, 0.0))
+
+    json_q = max(weights.get("application/json", 0.0), weights.get("application/*", 0.0), weights.get("*/*", 0.0))
+    best, best_q = None, 0.0
+    for media_type in available_formats():
+        q = weights.get(media_type, 0.0)
+        if q > best_q:
+            best, best_q = media_type, q
+    if best is not None and best_q >= json_q:
+        return best
+    if json_q > 0 or not any(weights.get(t, 0.0) > 0 for t in (MSGPACK, ARROW_STREAM)):
+        return None
+    raise NotAcceptableError(f"Supported formats: application/json, {', '.join(available_formats())}")
+
+
+def _plain(value: Any) -> Any:
+    # как jsonable_encoder: даты — ISO-строкой, Decimal — int или float
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def encode_table(table: Table, media_type: str) -> bytes:
+    """
+    Колонки -> тело ответа. JSON и MessagePack: {"колонка": [значения], ...} — ключи один раз
+    на ответ, а не на строку. Arrow: IPC stream с одним record batch, типы колонок выводит pyarrow.
+    """
+    if media_type == COLUMNAR_JSON:
+        return json.dumps(table, default=_plain, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if media_type == MSGPACK:
+        return msgpack.packb(table, default=_plain, use_bin_type=True)
+    if media_type == ARROW_STREAM:
+        arrow_table = pyarrow.Table.from_pydict(table)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+        return sink.getvalue().to_pybytes()
+    raise ValueError(f"Unsupported format: {media_type}")
+
+
+def tabular_response(table: Table, media_type: str) -> Response:
+    return Response(content=encode_table(table, media_type), media_type=media_type, headers={"Vary": "Accept"})
@@ -0,0 +1,277 @@
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+
+from utils.logger import get_logger
+
+logger = get_logger("Tracing")
+
+SERVICE_NAME = "stock_transfer_fastapi_app"
+
+
+class Span:
+    """Отрезок работы внутри запроса. Поля — как у OpenTelemetry span."""
+    __slots__ = ("trace", "name", "span_id", "parent_span_id", "start_ns", "end_ns", "attributes", "error", "_token")
+
+    def __init__(self, trace: "Trace", name: str, parent_span_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = _random_hex(8)
+        self.parent_span_id = parent_span_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def finish(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.finish()
+        _current_span.reset(self._token)
+        return False
+
+
+class _NoopSpan:
+    """Заглушка вне трассируемого запроса (фоновые задачи, скрипты) — ничего не пишет."""
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Все спаны одного HTTP-запроса. Спаны могут прийти из to_thread — список дополняется под локом."""
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or _random_hex(16)
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, parent_span_id: Optional[str] = None, **attributes) -> Span:
+        s = Span(self, name, parent_span_id, attributes)
+        with self._lock:
+            self.spans.append(s)
+        return s
+
+    def server_timing(self, root: Span) -> str:
+        """Server-Timing: длительности, сложенные по имени спана, + общее время и trace id."""
+        totals: Dict[str, List[float]] = {}
+        with self._lock:
+            spans = [s for s in self.spans if s is not root and s.end_ns is not None]
+        for s in spans:
+            entry = totals.setdefault(s.name, [0.0, 0])
+            entry[0] += s.duration_ms
+            entry[1] += 1
+
+        parts = [f'{name};dur={dur:.1f};desc="x{count}"' for name, (dur, count) in totals.items()]
+        parts.append(f"app;dur={root.duration_ms:.1f}")
+        parts.append(f'trace;desc="{self.trace_id}"')
+        return ", ".join(parts)
+
+    def to_otlp(self) -> dict:
+        """Запрос в формате OTLP/JSON (ExportTraceServiceRequest) — его читает otlpjsonfile-ресивер коллектора."""
+        with self._lock:
+            spans = list(self.spans)
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": "crabot_fastapi_app.tracing"},
+                "spans": [_otlp_span(self.trace_id, s) for s in spans]}]}]}
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _random_hex(n_bytes: int) -> str:
+    return "%0*x" % (n_bytes * 2, random.getrandbits(n_bytes * 8))
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def _otlp_span(trace_id: str, s: Span) -> dict:
+    data = {"traceId": trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            # 2 = SERVER для корневого, 3 = CLIENT для БД/внешних API, 1 = INTERNAL
+            "kind": 2 if s.name == "http.server" else 3 if s.name in ("db", "http.client") else 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or time.time_ns()),
+            "attributes": _otlp_attributes(s.attributes),
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 0}}
+    if s.parent_span_id:
+        data["parentSpanId"] = s.parent_span_id
+    return data
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def span(name: str, **attributes):
+    """
+    with span("db", **{"db.statement": query}) as s: ...
+    Вне запроса (нет активного трейса) возвращает заглушку без накладных расходов.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP_SPAN
+    parent = _current_span.get()
+    return trace.start_span(name, parent.span_id if parent is not None else None, **attributes)
+
+
+def parse_traceparent(header: Optional[str]):
+    """W3C traceparent: 00-<trace_id 32 hex>-<parent_id 16 hex>-<flags>. Невалидный -> (None, None)."""
+    if not header:
+        return None, None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None, None
+    if parts[1] == "0" * 32:
+        return None, None
+    return parts[1], parts[2]
+
+
+class SpanExporter:
+    """
+    Пишет завершённые трейсы построчно (OTLP/JSON) в stdout или файл.
+    Запись идёт в отдельном потоке, чтобы не блокировать event loop.
+    """
+    def __init__(self, target: str):
+        self._target = target
+        self._queue: "queue.SimpleQueue[Optional[Trace]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="trace-exporter")
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        self._queue.put(trace)
+
+    def _run(self):
+        stream = sys.stdout
+        if self._target != "stdout":
+            os.makedirs(os.path.dirname(os.path.abspath(self._target)), exist_ok=True)
+            stream = open(self._target, "a", encoding="utf-8")
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                break
+            try:
+                stream.write(json.dumps(trace.to_otlp(), ensure_ascii=False) + "\n")
+                stream.flush()
+            except Exception as e:
+                logger.warning("Trace export failed: %s", e)
+        if stream is not sys.stdout:
+            stream.close()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+class TracingMiddleware:
+    """
+    ASGI-мидлварь: открывает трейс на каждый HTTP-запрос, добавляет заголовок
+    Server-Timing и, если задан TRACING_EXPORT, отдаёт трейс экспортёру.
+    Подключается последней, чтобы оказаться снаружи остальных мидлварей.
+    """
+    def __init__(self, app, server_timing: bool = True, export: str = ""):
+        self.app = app
+        self.server_timing = server_timing
+        self.exporter = SpanExporter(export) if export else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope.get("headers", []):
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        trace_id, parent_span_id = parse_traceparent(traceparent)
+
+        trace = Trace(trace_id)
+        root = trace.start_span("http.server", parent_span_id,
+                                **{"http.method": scope.get("method"), "http.target": scope.get("path")})
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message.get("status"))
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing(root).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            root.finish()
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if self.exporter is not None:
+                self.exporter.export(trace)
+
+
+class TracedJSONResponse(JSONResponse):
+    """JSONResponse, сериализация которого попадает в трейс отдельным спаном render."""
+    def render(self, content: Any) -> bytes:
+        with span("render") as s:
+            body = super().render(content)
+            s.set_attribute("http.response.body.size", len(body))
+        return body
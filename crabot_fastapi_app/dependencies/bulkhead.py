@@ -0,0 +1,26 @@
+# bulkhead.py
+import math
+from fastapi import HTTPException, Request, status
+
+from core.resilience import BulkheadFullError
+from dependencies.dependencies import deps
+
+
+async def limit_concurrency(request: Request):
+    """Бакхед на эндпойнт (по имени функции-обработчика): тяжёлый эндпойнт не выедает воркер целиком."""
+    route = request.scope.get("route")
+    bulkhead = deps.bulkheads.get(route.name) if route is not None else None
+    if bulkhead is None:
+        yield
+        return
+
+    try:
+        bulkhead.try_acquire()
+    except BulkheadFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail=str(e),
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
+    try:
+        yield
+    finally:
+        bulkhead.release()
@@ -0,0 +1,17 @@
+# deadline.py
+from fastapi import Request
+
+from core.config import settings
+from core.deadline import current_deadline, parse_route_timeouts
+
+_ROUTE_TIMEOUTS = parse_route_timeouts(settings.DEADLINE_ROUTE_TIMEOUTS)
+
+
+async def apply_route_deadline(request: Request):
+    """Срок по умолчанию для маршрута (по имени обработчика), если клиент не задал свой заголовком."""
+    deadline = current_deadline()
+    if deadline is None:
+        return
+    route = request.scope.get("route")
+    name = route.name if route is not None else None
+    deadline.apply_default(_ROUTE_TIMEOUTS.get(name, settings.DEADLINE_DEFAULT_SEC))
@@ -1,30 +1,147 @@
 # dependencies/dependencies.py
-from utils.access_data_loader import AccessDataLoader
+import os
 from infrastructure.db.mysql.base import SyncDatabase
+from infrastructure.events.task_events import TaskEventBroker
+from core.resilience import BulkheadRegistry
+from core.executor import BlockingExecutor
+from core.load_shedding import AdaptiveLimiter
+from infrastructure.db.mysql.query_plans import QueryPlanCheck
+from utils.system_metrics import current_event_loop_lag
+from core.config import settings
 from utils.logger import get_logger
 from typing import Optional
 
 class Dependencies:
     def __init__(self):
         self._logger = get_logger("stock_transfer_fastapi_app")
-        self.access_data_loader = AccessDataLoader(logger=self._logger)
+        self._access_data_loader = None
         self._db: Optional[SyncDatabase] = None
+        self._db_executor: Optional[BlockingExecutor] = None
+        self._task_progress = None
+        self._archive_mover = None
+        self._references = None
+        self._query_plans: Optional[QueryPlanCheck] = None
+        self.task_events = TaskEventBroker(queue_size=settings.TASK_EVENTS_QUEUE_SIZE)
+        self.bulkheads = BulkheadRegistry(default_limit=settings.BULKHEAD_DEFAULT_LIMIT,
+                                          limits=settings.BULKHEAD_LIMITS)
+        self.concurrency_limiter = AdaptiveLimiter(initial=settings.LOAD_SHED_INITIAL_LIMIT,
+                                                   min_limit=settings.LOAD_SHED_MIN_LIMIT,
+                                                   max_limit=settings.LOAD_SHED_MAX_LIMIT,
+                                                   tolerance=settings.LOAD_SHED_LATENCY_TOLERANCE,
+                                                   lag_threshold=settings.LOAD_SHED_LOOP_LAG_SEC,
+                                                   queue_sustain=settings.LOAD_SHED_QUEUE_SUSTAIN_SEC,
+                                                   signals=self._congestion_signals)
+
+    @property
+    def access_data_loader(self):
+        if self._access_data_loader is None:
+            # импорт здесь: модулю шифрования нужен utils/csd.py, которого нет в локальных стендах
+            from utils.access_data_loader import AccessDataLoader
+            self._access_data_loader = AccessDataLoader(logger=self._logger)
+        return self._access_data_loader
+
+    def _mysql_con_data(self) -> dict:
+        # MYSQL_HOST задан -> подключаемся напрямую (локальный MySQL для бенчмарков/разработки)
+        if os.getenv("MYSQL_HOST"):
+            return {"host": os.getenv("MYSQL_HOST"),
+                    "port": int(os.getenv("MYSQL_PORT", "3306")),
+                    "user": os.getenv("MYSQL_USER", "root"),
+                    "password": os.getenv("MYSQL_PASSWORD", "")}
+        mysql_connect_params_dict = self.access_data_loader.get_mysql_connect_params_dict()
+        return mysql_connect_params_dict['no_db_fixed']
+
+    def _mysql_replica_con_data(self) -> Optional[dict]:
+        # реплика не задана -> все запросы идут в primary
+        if not os.getenv("MYSQL_REPLICA_HOST"):
+            return None
+        return {"host": os.getenv("MYSQL_REPLICA_HOST"),
+                "port": int(os.getenv("MYSQL_REPLICA_PORT", "3306")),
+                "user": os.getenv("MYSQL_REPLICA_USER", os.getenv("MYSQL_USER", "root")),
+                "password": os.getenv("MYSQL_REPLICA_PASSWORD", os.getenv("MYSQL_PASSWORD", ""))}
 
     @property
     def db(self) -> SyncDatabase:
         if self._db is None:
-            mysql_connect_params_dict = self.access_data_loader.get_mysql_connect_params_dict()
-            con_data = mysql_connect_params_dict['no_db_fixed']
+            con_data = self._mysql_con_data()
             self._db = SyncDatabase(
                 host=con_data['host'],
                 port=con_data['port'],
                 user=con_data['user'],
                 password=con_data['password'],
-                db='dostup')
+                db='dostup',
+                replica=self._mysql_replica_con_data())
             
         return self._db
 
+    @property
+    def db_executor(self) -> BlockingExecutor:
+        if self._db_executor is None:
+            self._db_executor = BlockingExecutor("db",
+                                                 max_workers=self.db.pool_size,
+                                                 max_queue=settings.DB_EXECUTOR_QUEUE_LIMIT)
+        return self._db_executor
+
+    @property
+    def references(self):
+        """Справочники размеров/артикулов в памяти; None — выключены, DBController читает их join-ами."""
+        if self._references is None and settings.REFERENCE_DICT_ENABLED:
+            from services.mysql_db_service.reference_service import ReferenceDictionaries
+            self._references = ReferenceDictionaries(self.db,
+                                                     refresh_sec=settings.REFERENCE_DICT_REFRESH_SEC,
+                                                     full_reload_sec=settings.REFERENCE_DICT_FULL_RELOAD_SEC)
+        return self._references
+
+    @property
+    def task_progress(self):
+        if self._task_progress is None:
+            # импорт здесь: сервисный слой сам зависит от инфраструктуры БД
+            from services.mysql_db_service.stock_transfer_service import DBController
+            from services.mysql_db_service.task_progress_service import TaskProgressWriter
+            self._task_progress = TaskProgressWriter(DBController(db=self.db, references=self.references),
+                                                     interval_ms=settings.WRITE_BEHIND_FLUSH_MS,
+                                                     max_rows=settings.WRITE_BEHIND_BATCH_ROWS,
+                                                     max_buffered=settings.WRITE_BEHIND_MAX_BUFFERED)
+        return self._task_progress
+
+    @property
+    def archive_mover(self):
+        if self._archive_mover is None:
+            from services.mysql_db_service.archive_service import ArchiveController, ArchiveMover
+            self._archive_mover = ArchiveMover(ArchiveController(db=self.db),
+                                               batch_size=settings.ARCHIVE_BATCH_ROWS,
+                                               pause_ms=settings.ARCHIVE_BATCH_PAUSE_MS,
+                                               interval=settings.ARCHIVE_INTERVAL_SEC,
+                                               retention_days=settings.ARCHIVE_RETENTION_DAYS,
+                                               max_batches=settings.ARCHIVE_MAX_BATCHES,
+                                               busy=self._database_busy)
+        return self._archive_mover
+
+    @property
+    def query_plans(self) -> QueryPlanCheck:
+        if self._query_plans is None:
+            self._query_plans = QueryPlanCheck(connect=self.db.connect_direct,
+                                               min_rows=settings.QUERY_PLAN_CHECK_MIN_ROWS)
+        return self._query_plans
+
+    def _database_busy(self) -> bool:
+        # фоновые пачки уступают запросам и не раздувают отставание реплики удалениями
+        lag, waiters = self._congestion_signals()
+        if waiters > 0 or lag > settings.LOAD_SHED_LOOP_LAG_SEC:
+            return True
+        replica = self.db.replica_status()
+        return replica is not None and (replica["lag_sec"] or 0) > settings.REPLICA_MAX_LAG_SEC
+
+    def _congestion_signals(self):
+        # БД ещё не открывалась -> ждать в ней некому
+        waiters = self._db.pool_waiters if self._db is not None else 0
+        if self._db_executor is not None:
+            waiters += self._db_executor.queued
+        return current_event_loop_lag(), waiters
+
     def close(self):
+        if self._db_executor is not None:
+            self._db_executor.shutdown()
+            self._db_executor = None
         if self._db is not None:
             try:
                 self._db.close()
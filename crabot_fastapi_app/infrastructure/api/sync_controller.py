@@ -1,8 +1,13 @@
+import logging
 import requests
 import ijson
 from typing import Any, Dict, Optional, Union
 from http import HTTPStatus
-from utils.logger import get_logger
+from core import deadline
+from core.config import settings
+from core.resilience import CircuitBreaker, CircuitOpenError
+from core.tracing import span
+from utils.logger import get_logger, summarize
 
 class APIRequestError(Exception):
     def __init__(self, message: str, status_code: Optional[int] = None):
@@ -17,6 +22,11 @@ class SyncAPIController:
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
         self.logger = get_logger("SyncAPIController")
+        self.breaker = CircuitBreaker(f"api:{self.base_url}",
+                                      failure_rate=settings.CIRCUIT_BREAKER_FAILURE_RATE,
+                                      min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+                                      window_sec=settings.CIRCUIT_BREAKER_WINDOW_SEC,
+                                      open_sec=settings.CIRCUIT_BREAKER_OPEN_SEC)
 
     def request(self,
                 method: str,
@@ -39,6 +49,17 @@ class SyncAPIController:
 
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
 
+        # не ждём upstream дольше, чем осталось до срока запроса клиента
+        timeout = self.timeout
+        left = deadline.remaining()
+        if left is not None:
+            if left <= 0:
+                self.logger.warning("Request deadline exceeded before %s %s", method, url)
+                return {"status": 504,
+                        "error": "Gateway Timeout",
+                        "details": {"message": "Request deadline exceeded"}}
+            timeout = min(timeout, left)
+
         filtered_kwargs = {"params": params or None,
                             "json": json or None,
                             "data": data or None,
@@ -46,38 +67,59 @@ class SyncAPIController:
                             "cookies": cookies or None,
                             "files": files or None,
                             "auth": auth or None,
-                            "timeout": self.timeout,
+                            "timeout": timeout,
                             "stream": stream,
                             **kwargs,
                             }
         
         hidden_arg_keys = ['headers', 'cookies', 'auth']
         request_args = {k: v for k, v in filtered_kwargs.items() if v is not None}
-        request_args_for_logs = {k: v for k, v in filtered_kwargs.items() if k not in hidden_arg_keys and v is not None}
-
 
         try:
-            self.logger.debug(f"{method} Request to {url} | args={request_args_for_logs}")
-            response = requests.request(method=method, url=url, **request_args)
-            response.raise_for_status()
-            parsed_response = self._parse_response(response, stream=stream, stream_path=stream_path)
-            return parsed_response
-
-        except requests.exceptions.HTTPError as http_err:
-            return self._handle_http_error(http_err.response)
-
-        except requests.exceptions.RequestException as req_err:
-            self.logger.error(f"Request failed: {req_err}")
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            self.logger.warning("%s", e)
             return {"status": 503,
                     "error": "Service Unavailable",
-                    "details": {"message": str(req_err)}}
+                    "details": {"message": str(e), "retry_after": round(e.retry_after)}}
+
+        with span("http.client", **{"http.method": method, "http.url": url}) as s:
+            response = None
+            try:
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    request_args_for_logs = {k: v for k, v in request_args.items() if k not in hidden_arg_keys}
+                    self.logger.debug("%s Request to %s | args=%s", method, url, summarize(request_args_for_logs))
+                response = requests.request(method=method, url=url, **request_args)
+                s.set_attribute("http.status_code", response.status_code)
+                # 5xx и 429 — upstream не справляется; прочие 4xx — ошибка запроса, сервис жив
+                if response.status_code >= 500 or response.status_code == 429:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                response.raise_for_status()
+                parsed_response = self._parse_response(response, stream=stream, stream_path=stream_path)
+                return parsed_response
+
+            except requests.exceptions.HTTPError as http_err:
+                return self._handle_http_error(http_err.response)
+
+            except requests.exceptions.RequestException as req_err:
+                if response is None:
+                    self.breaker.record_failure()
+                self.logger.error("Request failed: %s", req_err)
+                return {"status": 503,
+                        "error": "Service Unavailable",
+                        "details": {"message": str(req_err)}}
+
+            except Exception as e:
+                if response is None:
+                    # до upstream не дошли — освобождаем пробу предохранителя
+                    self.breaker.record_success()
+                self.logger.exception("Unexpected error occurred")
+                return {"status": 500,
+                        "error": "Internal Server Error",
+                        "details": {"message": str(e)}}
 
-        except Exception as e:
-            self.logger.exception("Unexpected error occurred")
-            return {"status": 500,
-                    "error": "Internal Server Error",
-                    "details": {"message": str(e)}}
-        
     def _parse_response(self, response: requests.Response, stream: bool, stream_path: Optional[str]) -> Any:
         content_type = response.headers.get("Content-Type", "")
         if "application/json" not in content_type:
@@ -91,7 +133,7 @@ class SyncAPIController:
                     result = list(ijson.items(response.raw, stream_path))
                 else:
                     result = list(ijson.items(response.raw, "item"))
-                self.logger.info(f"Streamed JSON parsed: {len(result)} items")
+                self.logger.info("Streamed JSON parsed: %d items", len(result))
                 return result
             finally:
                 response.close()
@@ -105,7 +147,7 @@ class SyncAPIController:
             else:
                 summary = f"type={type(parsed).__name__}"
 
-            self.logger.info(f"Response from {response.url} | Status: {response.status_code} | JSON: {summary}")
+            self.logger.info("Response from %s | Status: %s | JSON: %s", response.url, response.status_code, summary)
             return parsed
 
 
@@ -116,7 +158,7 @@ class SyncAPIController:
             error_body = {"message": response.text or "<no content>"}
 
         status_code = response.status_code
-        self.logger.warning(f"HTTP Error {status_code}: {error_body}")
+        self.logger.warning("HTTP Error %s: %s", status_code, summarize(error_body))
 
         error_response = {
             "status": status_code,
@@ -1,17 +1,40 @@
 # infrastructure/db/mysql/base.py
 import os
-from typing import Any, Iterable, Optional, Sequence
+import time
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+from infrastructure.db.mysql.drivers import load_driver
 from infrastructure.db.mysql.pool import Pool
+from infrastructure.db.mysql.replica import ReplicaMonitor, is_replica_safe
+from infrastructure.db.mysql.slow_queries import SlowQueryLog
+from core.config import settings
+from core import deadline
+from core.read_routing import mark_write, prefer_primary
+from core.resilience import CircuitBreaker
+from core.tracing import span
 from utils.logger import get_logger  # <-- твой логгер
 
-import pymysql
-from pymysql import err as pymysql_err
-
 logger = get_logger("SyncDatabase")
 
 
+def _top_level_select(query: str) -> int:
+    """Позиция SELECT вне скобок (основной запрос после списка CTE) или -1."""
+    depth = 0
+    upper = query.upper()
+    i = 0
+    while i < len(query):
+        ch = query[i]
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0 and upper.startswith("SELECT", i) and (i == 0 or not (query[i - 1].isalnum() or query[i - 1] == "_")):
+            return i
+        i += 1
+    return -1
+
+
 class SyncDatabase:
-    def __init__(self, host, port, user, password, db):
+    def __init__(self, host, port, user, password, db, replica: Optional[dict] = None):
         self._db_params = {
             "host": host,
             "port": int(port),
@@ -19,36 +42,187 @@ class SyncDatabase:
             "password": password,
             "db": db,
             "autocommit": True,
-            "charset": "utf8mb4",
-            "cursorclass": pymysql.cursors.DictCursor}
+            "charset": "utf8mb4"}
+        # pymysql или mysqlclient (C); курсор по умолчанию — словари, для больших выборок есть execute_query_rows
+        self._driver = load_driver(settings.MYSQL_DRIVER)
 
-        self._pool = Pool(create_instance=lambda: pymysql.connect(**self._db_params),
+        self._pool = Pool(create_instance=lambda: self._driver.connect(self._db_params),
                             max_count=int(os.getenv("MYSQL_POOL_SIZE", "10")),
                             timeout=float(os.getenv("MYSQL_POOL_GET_TIMEOUT", "10")),
                             pre_ping=True,
-                            recycle=int(os.getenv("MYSQL_POOL_RECYCLE", "1800")))
+                            recycle=int(os.getenv("MYSQL_POOL_RECYCLE", "1800")),
+                            ping=self._driver.ping)
+
+        # реплика для чтений: {"host", "port", "user", "password"}; база и остальные параметры — как у primary
+        self._replica_params = None
+        self._replica_pool: Optional[Pool] = None
+        self.replica: Optional[ReplicaMonitor] = None
+        if replica:
+            self._replica_params = {**self._db_params, **replica, "port": int(replica.get("port", port))}
+            self._replica_pool = Pool(create_instance=lambda: self._driver.connect(self._replica_params),
+                                      max_count=int(os.getenv("MYSQL_REPLICA_POOL_SIZE", os.getenv("MYSQL_POOL_SIZE", "10"))),
+                                      timeout=float(os.getenv("MYSQL_POOL_GET_TIMEOUT", "10")),
+                                      pre_ping=True,
+                                      recycle=int(os.getenv("MYSQL_POOL_RECYCLE", "1800")),
+                                      ping=self._driver.ping)
+            self.replica = ReplicaMonitor(connect=lambda: self._driver.connect(self._replica_params, connect_timeout=2),
+                                          max_lag=settings.REPLICA_MAX_LAG_SEC,
+                                          interval=settings.REPLICA_LAG_CHECK_SEC)
+
+        # EXPLAIN медленных запросов снимается на отдельном соединении, мимо пула
+        self.slow_queries = SlowQueryLog(threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+                                         capacity=settings.SLOW_QUERY_BUFFER_SIZE,
+                                         connect=self.connect_direct if settings.SLOW_QUERY_EXPLAIN else None,
+                                         explain_interval=settings.SLOW_QUERY_EXPLAIN_INTERVAL_SEC)
+
+        self.breaker = CircuitBreaker("mysql",
+                                      failure_rate=settings.CIRCUIT_BREAKER_FAILURE_RATE,
+                                      min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+                                      window_sec=settings.CIRCUIT_BREAKER_WINDOW_SEC,
+                                      open_sec=settings.CIRCUIT_BREAKER_OPEN_SEC)
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool.max_count
+
+    @property
+    def pool_waiters(self) -> int:
+        waiters = self._pool.waiters
+        if self._replica_pool is not None:
+            waiters += self._replica_pool.waiters
+        return waiters
+
+    def connect_direct(self):
+        """Отдельное соединение с primary мимо пула: EXPLAIN, миграции."""
+        return self._driver.connect(self._db_params, connect_timeout=5)
+
+    # соединение потеряно (server has gone away / lost connection) — повтор на свежем соединении оправдан;
+    # остальные ошибки (lock wait, таймаут запроса, исчерпанный пул) повтор только усугубит
+    _CONNECTION_LOST_CODES = {2006, 2013, 2055}
+    # ER_QUERY_TIMEOUT: запрос прерван по MAX_EXECUTION_TIME
+    _QUERY_TIMEOUT_CODE = 3024
+
+    def _run_once(self, fn, pool: Optional[Pool] = None):
+        pool = pool or self._pool
+        try:
+            conn = pool.acquire(timeout=deadline.remaining())
+        except TimeoutError:
+            # пул не дал соединение за остаток срока запроса — это срок запроса, а не отказ БД
+            deadline.check_deadline()
+            raise
+        try:
+            return fn(conn)
+        finally:
+            pool.release(conn)
+
+    def _use_replica(self, query: str) -> bool:
+        return (self.replica is not None and self.replica.healthy
+                and not prefer_primary() and is_replica_safe(query))
+
+    def _run_on_replica(self, fn):
+        """
+        Чтение на реплике. Отказ реплики не трогает предохранитель primary:
+        реплика снимается с маршрута, а вызывающий повторяет чтение на primary. Возвращает (выполнено, результат).
+        """
+        deadline.check_deadline()
+        try:
+            return True, self._run_once(fn, self._replica_pool)
+        except self._driver.OperationalError as e:
+            if e.args and e.args[0] == self._QUERY_TIMEOUT_CODE:
+                raise deadline.DeadlineExceededError("Query interrupted by MAX_EXECUTION_TIME") from e
+            self.replica.mark_unhealthy(str(e))
+        except (self._driver.InterfaceError, TimeoutError) as e:
+            deadline.check_deadline()
+            self.replica.mark_unhealthy(str(e) or type(e).__name__)
+        logger.warning("Replica read failed, falling back to primary")
+        return False, None
+
+    def _is_connection_lost(self, e: Exception) -> bool:
+        if isinstance(e, self._driver.InterfaceError):
+            return True
+        return isinstance(e, self._driver.OperationalError) and bool(e.args) and e.args[0] in self._CONNECTION_LOST_CODES
 
     def _run_with_retry(self, fn):
+        deadline.check_deadline()
+        self.breaker.before_call()
         try:
-            conn = self._pool.acquire()
             try:
-                return fn(conn)
-            finally:
-                self._pool.release(conn)
-        except (pymysql_err.InterfaceError, pymysql_err.OperationalError) as e:
-            logger.warning(f"MySQL interface/operational error '{e}'. Retrying once...")
-            conn = self._pool.acquire()
-            try:
-                return fn(conn)
-            finally:
-                self._pool.release(conn)
+                result = self._run_once(fn)
+            except (self._driver.InterfaceError, self._driver.OperationalError) as e:
+                if not self._is_connection_lost(e) or not self.breaker.allows_retry():
+                    raise
+                logger.warning("MySQL connection lost '%s'. Retrying once...", e)
+                deadline.check_deadline()
+                result = self._run_once(fn)
+        except deadline.DeadlineExceededError:
+            self.breaker.record_success()
+            raise
+        except self._driver.OperationalError as e:
+            if e.args and e.args[0] == self._QUERY_TIMEOUT_CODE:
+                # сервер жив и сам прервал запрос по сроку
+                self.breaker.record_success()
+                raise deadline.DeadlineExceededError("Query interrupted by MAX_EXECUTION_TIME") from e
+            self.breaker.record_failure()
+            raise
+        except (self._driver.InterfaceError, self._driver.OperationalError, TimeoutError):
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # ошибки запроса/данных: сервер отвечает, предохранитель это не касается
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
 
-    def execute_query(self, query: str, params: Optional[Sequence[Any] | dict] = None):
+    @staticmethod
+    def _with_time_limit(query: str) -> str:
+        """
+        Подставляет /*+ MAX_EXECUTION_TIME(ms) */ в SELECT верхнего уровня (в том числе после WITH),
+        чтобы MySQL сам прервал чтение, которое клиент уже не дождётся. Прочие запросы — без изменений.
+        """
+        left = deadline.remaining()
+        if left is None:
+            return query
+        stripped = query.lstrip()
+        head = stripped[:6].upper()
+        if head.startswith("SELECT"):
+            pos = len(query) - len(stripped)
+        elif head.startswith("WITH"):
+            pos = _top_level_select(query)
+            if pos < 0:
+                return query
+        else:
+            return query
+        return f"{query[:pos + 6]} /*+ MAX_EXECUTION_TIME({max(int(left * 1000), 1)}) */{query[pos + 6:]}"
+
+    def _read(self, query: str, params, cursorclass=None):
+        """SELECT на реплике или primary; возвращает (курсор.description, строки)."""
         def _do(conn):
-            with conn.cursor() as cursor:
-                cursor.execute(query, params)
-                return cursor.fetchall()
-        return self._run_with_retry(_do)
+            with conn.cursor(cursorclass) as cursor:
+                started = time.perf_counter()
+                cursor.execute(self._with_time_limit(query), params)
+                rows = cursor.fetchall()
+                self.slow_queries.observe(query, params, (time.perf_counter() - started) * 1000, len(rows), "query")
+                return cursor.description, rows
+        with span("db", **{"db.system": "mysql", "db.operation": "query", "db.statement": query}) as s:
+            done, result = self._run_on_replica(_do) if self._use_replica(query) else (False, None)
+            if not done:
+                result = self._run_with_retry(_do)
+            s.set_attribute("db.replica", done)
+            s.set_attribute("db.rows", len(result[1]))
+            return result
+
+    def execute_query(self, query: str, params: Optional[Sequence[Any] | dict] = None):
+        return self._read(query, params)[1]
+
+    def execute_query_rows(self, query: str,
+                           params: Optional[Sequence[Any] | dict] = None) -> Tuple[List[str], Sequence[tuple]]:
+        """
+        Быстрый путь для больших выборок: имена колонок один раз и строки кортежами —
+        без словаря на каждую строку. Индексы колонок вызывающий берёт из списка имён.
+        """
+        description, rows = self._read(query, params, self._driver.tuple_cursor)
+        return [d[0] for d in description or ()], rows
 
     def execute_scalar(self, query: str, params: Optional[Sequence[Any] | dict] = None):
         rows = self.execute_query(query, params)
@@ -57,10 +231,14 @@ class SyncDatabase:
     def execute_non_query(self, query: str, params: Optional[Sequence[Any] | dict] = None):
         def _do(conn):
             with conn.cursor() as cursor:
+                started = time.perf_counter()
                 cursor.execute(query, params)
+                self.slow_queries.observe(query, params, (time.perf_counter() - started) * 1000, cursor.rowcount, "non_query")
                 return {"rowcount": cursor.rowcount, "lastrowid": getattr(cursor, "lastrowid", None)}
-            
-        return self._run_with_retry(_do)
+
+        mark_write()
+        with span("db", **{"db.system": "mysql", "db.operation": "non_query", "db.statement": query}):
+            return self._run_with_retry(_do)
 
     def execute_many(self, query: str, param_list: Iterable[Sequence[Any] | dict]):
         plist = list(param_list)
@@ -69,9 +247,61 @@ class SyncDatabase:
 
         def _do(conn):
             with conn.cursor() as cursor:
+                started = time.perf_counter()
                 cursor.executemany(query, plist)
+                self.slow_queries.observe(query, plist[0], (time.perf_counter() - started) * 1000, cursor.rowcount, "many")
                 return cursor.rowcount
-        return self._run_with_retry(_do)
+        mark_write()
+        with span("db", **{"db.system": "mysql", "db.operation": "many", "db.statement": query, "db.params_count": len(plist)}):
+            return self._run_with_retry(_do)
+
+    def execute_transaction(self, fn, lock: Optional[str] = None, lock_timeout: float = 10):
+        """
+        fn(cursor) выполняется в одной транзакции на одном соединении; любое исключение -> rollback.
+        lock — имя GET_LOCK, которое держится от BEGIN до COMMIT/ROLLBACK: сериализует транзакции,
+        которым нечего блокировать строками (например, вставку, когда строки ещё нет).
+        """
+        def _do(conn):
+            if lock is not None:
+                self._get_lock(conn, lock, lock_timeout)
+            try:
+                conn.begin()
+                try:
+                    with conn.cursor() as cursor:
+                        result = fn(cursor)
+                    conn.commit()
+                    return result
+                except Exception:
+                    conn.rollback()
+                    raise
+            finally:
+                if lock is not None:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT RELEASE_LOCK(%s)", (lock,))
+                        cursor.fetchall()
+
+        mark_write()
+        with span("db", **{"db.system": "mysql", "db.operation": "transaction"}):
+            return self._run_with_retry(_do)
+
+    @staticmethod
+    def _get_lock(conn, name: str, timeout: float):
+        left = deadline.remaining()
+        if left is not None:
+            timeout = min(timeout, left)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (name, max(timeout, 0)))
+            row = cursor.fetchone()
+        locked = next(iter(row.values())) if isinstance(row, dict) else row[0]
+        if locked != 1:
+            raise RuntimeError(f"Could not acquire lock {name!r} in {timeout:.1f}s")
+
+    def replica_status(self) -> Optional[dict]:
+        return self.replica.status() if self.replica is not None else None
 
     def close(self):
+        if self.replica is not None:
+            self.replica.close()
+        if self._replica_pool is not None:
+            self._replica_pool.close_all()
         self._pool.close_all()
@@ -0,0 +1,71 @@
+# infrastructure/db/mysql/drivers.py
+from typing import Any, Dict
+
+import pymysql
+import pymysql.cursors
+from pymysql import err as pymysql_err
+
+from utils.logger import get_logger
+
+logger = get_logger("MySQLDriver")
+
+
+class MySQLDriver:
+    """
+    Обёртка над DB-API драйвером: подключение, классы курсоров и исключения.
+    SyncDatabase и пул работают только через неё, поэтому драйвер меняется настройкой MYSQL_DRIVER.
+    """
+    name = "pymysql"
+    dict_cursor = pymysql.cursors.DictCursor
+    tuple_cursor = pymysql.cursors.Cursor
+    OperationalError = pymysql_err.OperationalError
+    InterfaceError = pymysql_err.InterfaceError
+
+    def connect(self, params: Dict[str, Any], **extra):
+        """params — host/port/user/password/db/charset/autocommit; курсор по умолчанию — словари."""
+        return pymysql.connect(**params, cursorclass=self.dict_cursor, **extra)
+
+    def ping(self, conn):
+        conn.ping(reconnect=True)
+
+
+class MySQLClientDriver(MySQLDriver):
+    """mysqlclient (MySQLdb): разбор пакетов и строк в C, в разы быстрее на больших выборках."""
+    name = "mysqlclient"
+
+    def __init__(self):
+        import MySQLdb
+        import MySQLdb.cursors
+
+        self._MySQLdb = MySQLdb
+        self.dict_cursor = MySQLdb.cursors.DictCursor
+        self.tuple_cursor = MySQLdb.cursors.Cursor
+        self.OperationalError = MySQLdb.OperationalError
+        self.InterfaceError = MySQLdb.InterfaceError
+
+    def connect(self, params: Dict[str, Any], **extra):
+        params = dict(params)
+        # старые версии mysqlclient понимают только db/passwd
+        params["passwd"] = params.pop("password", "")
+        return self._MySQLdb.connect(**params, cursorclass=self.dict_cursor, **extra)
+
+    def ping(self, conn):
+        # reconnect у mysqlclient устаревший; упавший ping пул обработает пересозданием соединения
+        conn.ping()
+
+
+def load_driver(name: str = "auto") -> MySQLDriver:
+    """"auto" — mysqlclient, если установлен, иначе pymysql; "pymysql" / "mysqlclient" — явно."""
+    name = (name or "auto").lower()
+    if name in ("auto", "mysqlclient"):
+        try:
+            driver = MySQLClientDriver()
+            logger.info("MySQL driver: mysqlclient")
+            return driver
+        except ImportError:
+            if name == "mysqlclient":
+                raise
+    elif name != "pymysql":
+        raise ValueError(f"Unknown MySQL driver: {name!r}")
+    logger.info("MySQL driver: pymysql")
+    return MySQLDriver()
@@ -0,0 +1,144 @@
+# infrastructure/db/mysql/migrations.py
+"""
+Версионные миграции схемы: файлы migrations/NNNN_name.sql применяются по порядку номеров,
+каждый ровно один раз; применённые записываются в журнал в mp_data.
+
+    python -m infrastructure.db.mysql.migrations            # применить недостающие
+    python -m infrastructure.db.mysql.migrations --status   # только показать
+"""
+import argparse
+import hashlib
+import os
+import re
+from typing import Any, List, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger("Migrations")
+
+MIGRATIONS_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "migrations"))
+JOURNAL_TABLE = "mp_data.a_wb_stock_transfer_schema_migrations"
+_FILE_RE = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+_LOCK_NAME = "stock_transfer_schema_migrations"
+# индекс или колонка уже есть (заведены вручную до миграций) — шаг считается выполненным
+_ALREADY_DONE_CODES = {1060, 1061}
+
+
+def split_statements(sql: str) -> List[str]:
+    """Текст файла -> отдельные операторы: разделитель — ';' в конце строки, строки '--' отбрасываются."""
+    statements = []
+    for chunk in re.split(r";\s*$", sql, flags=re.MULTILINE):
+        lines = [l for l in chunk.splitlines() if not l.strip().startswith("--")]
+        statement = "\n".join(lines).strip()
+        if statement:
+            statements.append(statement)
+    return statements
+
+
+def discover(path: str = MIGRATIONS_DIR) -> List[Tuple[str, str, str]]:
+    """[(версия, имя, путь)] по возрастанию версии; повтор номера — ошибка."""
+    found = {}
+    for filename in sorted(os.listdir(path)):
+        match = _FILE_RE.match(filename)
+        if not match:
+            continue
+        version, name = match.groups()
+        if version in found:
+            raise ValueError(f"Duplicate migration version {version}: {found[version][1]} and {name}")
+        found[version] = (version, name, os.path.join(path, filename))
+    return [found[v] for v in sorted(found)]
+
+
+def _checksum(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _column(row: Any, name: str, index: int) -> Any:
+    return row[name] if isinstance(row, dict) else row[index]
+
+
+class MigrationRunner:
+    """
+    Применяет миграции на одном соединении (DB-API, словари или кортежи — неважно).
+    Воркеры, стартующие одновременно, разводит GET_LOCK: второй ждёт, пока первый закончит,
+    и видит миграции уже применёнными. Изменённый после применения файл — предупреждение в лог.
+    """
+    def __init__(self, conn, path: str = MIGRATIONS_DIR, lock_timeout: int = 60):
+        self.conn = conn
+        self.path = path
+        self.lock_timeout = int(lock_timeout)
+
+    def _applied(self, cursor) -> dict:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {JOURNAL_TABLE} (
+                version    CHAR(4)      NOT NULL PRIMARY KEY,
+                name       VARCHAR(255) NOT NULL,
+                checksum   CHAR(64)     NOT NULL,
+                applied_at DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute(f"SELECT version, checksum FROM {JOURNAL_TABLE}")
+        return {_column(r, "version", 0): _column(r, "checksum", 1) for r in cursor.fetchall()}
+
+    def status(self) -> List[dict]:
+        with self.conn.cursor() as cursor:
+            applied = self._applied(cursor)
+        return [{"version": version, "name": name, "applied": version in applied} for version, name, _ in discover(self.path)]
+
+    def apply(self) -> List[str]:
+        """Применяет недостающие миграции; возвращает их версии."""
+        done = []
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (_LOCK_NAME, self.lock_timeout))
+            if _column(cursor.fetchone(), "locked", 0) != 1:
+                raise TimeoutError(f"Could not acquire migration lock in {self.lock_timeout}s")
+            try:
+                applied = self._applied(cursor)
+                for version, name, file_path in discover(self.path):
+                    with open(file_path, encoding="utf-8") as f:
+                        text = f.read()
+                    checksum = _checksum(text)
+                    if version in applied:
+                        if applied[version] != checksum:
+                            logger.warning("Migration %s_%s was changed after it had been applied", version, name)
+                        continue
+                    logger.info("Applying migration %s_%s", version, name)
+                    for statement in split_statements(text):
+                        try:
+                            cursor.execute(statement)
+                        except Exception as e:
+                            if e.args and e.args[0] in _ALREADY_DONE_CODES:
+                                logger.warning("Migration %s_%s: %s, skipping statement", version, name, e.args[1])
+                                continue
+                            raise
+                    cursor.execute(f"INSERT INTO {JOURNAL_TABLE} (version, name, checksum) VALUES (%s, %s, %s)",
+                                   (version, name, checksum))
+                    done.append(version)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (_LOCK_NAME,))
+                cursor.fetchall()
+        return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to MySQL")
+    parser.add_argument("--status", action="store_true", help="only list migrations and whether they are applied")
+    args = parser.parse_args()
+
+    from dependencies.dependencies import deps
+
+    conn = deps.db.connect_direct()
+    try:
+        runner = MigrationRunner(conn)
+        if args.status:
+            for item in runner.status():
+                print(f"{item['version']}_{item['name']}: {'applied' if item['applied'] else 'pending'}")
+        else:
+            applied = runner.apply()
+            print(f"applied: {', '.join(applied) if applied else 'nothing to apply'}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
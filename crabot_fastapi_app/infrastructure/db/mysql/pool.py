@@ -1,7 +1,9 @@
 # infrastructure/db/mysql/pool.py
 import time
 import threading
+from typing import Optional
 import pymysql
+from core.tracing import span
 from utils.logger import get_logger
 
 logger = get_logger("MySQLPool")
@@ -9,9 +11,11 @@ logger = get_logger("MySQLPool")
 
 class Pool:
     """Простой потокобезопасный пул с pre_ping и recycle."""
-    def __init__(self, create_instance, max_count=10, timeout=10.0, *, pre_ping=True, recycle=1800):
+    def __init__(self, create_instance, max_count=10, timeout=10.0, *, pre_ping=True, recycle=1800, ping=None):
         assert create_instance is not None
         self._create = create_instance
+        # проверка соединения зависит от драйвера; по умолчанию — как у pymysql
+        self._ping = ping or (lambda conn: conn.ping(reconnect=True))
         self._max = int(max_count)
         self._timeout = float(timeout)
         self._pre_ping = bool(pre_ping)
@@ -21,6 +25,16 @@ class Pool:
         self._cv = threading.Condition(self._lock)
         self._free: list[pymysql.connections.Connection] = []
         self._in_use: set[pymysql.connections.Connection] = set()
+        self._waiters = 0
+
+    @property
+    def max_count(self) -> int:
+        return self._max
+
+    @property
+    def waiters(self) -> int:
+        """Сколько потоков сейчас ждут свободное соединение — сигнал перегрузки для ограничителя."""
+        return self._waiters
 
     def _spawn(self) -> pymysql.connections.Connection:
         conn = self._create()
@@ -32,7 +46,12 @@ class Pool:
         created = getattr(conn, "_created_at", None)
         return created is None or (time.time() - created) >= self._recycle
 
-    def acquire(self) -> pymysql.connections.Connection:
+    def acquire(self, timeout: Optional[float] = None) -> pymysql.connections.Connection:
+        """timeout — остаток срока запроса; ждём не дольше него и не дольше таймаута пула."""
+        with span("pool.acquire"):
+            return self._acquire(self._timeout if timeout is None else min(self._timeout, max(timeout, 0.0)))
+
+    def _acquire(self, timeout: float) -> pymysql.connections.Connection:
         with self._lock:
             # есть свободные
             if self._free:
@@ -44,21 +63,25 @@ class Pool:
                 self._in_use.add(conn)
             else:
                 # ждём освобождения
-                end = time.time() + self._timeout
+                end = time.time() + timeout
                 logger.debug("Pool exhausted; waiting for a free connection")
-                while not self._free:
-                    remain = end - time.time()
-                    if remain <= 0:
-                        logger.warning("Pool acquire timeout (max=%d, in_use=%d)", self._max, len(self._in_use))
-                        raise TimeoutError("Pool acquire timeout")
-                    self._cv.wait(remain)
+                self._waiters += 1
+                try:
+                    while not self._free:
+                        remain = end - time.time()
+                        if remain <= 0:
+                            logger.warning("Pool acquire timeout (max=%d, in_use=%d)", self._max, len(self._in_use))
+                            raise TimeoutError("Pool acquire timeout")
+                        self._cv.wait(remain)
+                finally:
+                    self._waiters -= 1
                 conn = self._free.pop()
                 self._in_use.add(conn)
 
         try:
             if self._pre_ping:
                 try:
-                    conn.ping(reconnect=True)
+                    self._ping(conn)
                 except Exception as e:
                     logger.warning("Pre-ping failed, recreating connection: %s", e)
                     try:
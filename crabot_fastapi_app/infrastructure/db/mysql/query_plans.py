@@ -0,0 +1,88 @@
+# infrastructure/db/mysql/query_plans.py
+import threading
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from prometheus_client import Gauge
+
+from utils.logger import get_logger
+
+logger = get_logger("QueryPlanCheck")
+
+plan_full_scans = Gauge("app_query_plan_full_scans", "Tables read with a full scan in the plan of a registered query",
+                        ["query"])
+
+
+def full_scans(plan: List[dict], min_rows: int) -> List[dict]:
+    """
+    Строки EXPLAIN с type=ALL по настоящим таблицам (не <derivedN>/<unionN>)
+    и оценкой не меньше min_rows: маленькие справочники MySQL законно читает целиком.
+    """
+    found = []
+    for row in plan:
+        table = row.get("table") or ""
+        if row.get("type") != "ALL" or table.startswith("<"):
+            continue
+        rows = int(row.get("rows") or 0)
+        if rows >= min_rows:
+            found.append({"table": table, "rows": rows, "possible_keys": row.get("possible_keys"),
+                          "extra": row.get("Extra")})
+    return found
+
+
+class QueryPlanCheck:
+    """
+    EXPLAIN зарегистрированных запросов (DBController.plan_probes) на отдельном соединении мимо пула:
+    полный просмотр большой таблицы — warning в лог, метрика и /admin/query_plans.
+    Обычно — один раз при старте, в фоне, чтобы не задерживать готовность воркера.
+    """
+    def __init__(self, connect: Callable[[], Any], min_rows: int = 1000):
+        self._connect = connect
+        self.min_rows = int(min_rows)
+        self._lock = threading.Lock()
+        self._results: List[dict] = []
+        self._checked_at: Optional[float] = None
+
+    def run(self, probes: Sequence[Tuple[str, str, Sequence[Any]]]) -> List[dict]:
+        results = []
+        try:
+            conn = self._connect()
+        except Exception as e:
+            logger.warning("Query plan check skipped, no MySQL connection: %s", e)
+            return results
+        try:
+            for name, query, params in probes:
+                entry = {"query": name, "full_scans": [], "error": None}
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("EXPLAIN " + query.strip().rstrip(";"), params or None)
+                        entry["full_scans"] = full_scans(list(cursor.fetchall()), self.min_rows)
+                except Exception as e:
+                    entry["error"] = str(e)
+                    logger.warning("EXPLAIN failed for %s: %s", name, e)
+                for scan in entry["full_scans"]:
+                    logger.warning("Query %s does a full scan of %s (~%d rows, possible keys: %s)",
+                                   name, scan["table"], scan["rows"], scan["possible_keys"])
+                plan_full_scans.labels(name).set(len(entry["full_scans"]))
+                results.append(entry)
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+        with self._lock:
+            self._results = results
+            self._checked_at = time.time()
+        if not any(r["full_scans"] or r["error"] for r in results):
+            logger.info("Query plan check passed for %d queries", len(results))
+        return results
+
+    def run_in_background(self, probes: Sequence[Tuple[str, str, Sequence[Any]]]):
+        threading.Thread(target=self.run, args=(probes,), daemon=True, name="query-plan-check").start()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"checked_at": self._checked_at,
+                    "min_rows": self.min_rows,
+                    "results": list(self._results)}
@@ -0,0 +1,121 @@
+# infrastructure/db/mysql/replica.py
+import re
+import threading
+import time
+from typing import Callable, Optional
+
+from prometheus_client import Gauge
+
+from utils.logger import get_logger
+
+logger = get_logger("ReplicaMonitor")
+
+replica_lag = Gauge("app_mysql_replica_lag_seconds", "Replica lag behind primary (-1 = unknown / replication stopped)")
+replica_in_use = Gauge("app_mysql_replica_in_use", "1 if reads are routed to the replica")
+
+_LOCKING_READ_RE = re.compile(r"\bFOR\s+(UPDATE|SHARE)\b|\bLOCK\s+IN\s+SHARE\s+MODE\b|\bLAST_INSERT_ID\s*\(|\bGET_LOCK\s*\(",
+                              re.IGNORECASE)
+
+
+def is_replica_safe(query: str) -> bool:
+    """Только чистые чтения: SELECT/WITH без блокировок и функций, завязанных на сессию primary."""
+    head = query.lstrip()[:6].upper()
+    if not (head.startswith("SELECT") or head.startswith("WITH")):
+        return False
+    return _LOCKING_READ_RE.search(query) is None
+
+
+class ReplicaMonitor:
+    """
+    Следит за отставанием реплики: раз в interval читает SHOW REPLICA STATUS
+    (до MySQL 8.0.22 — SHOW SLAVE STATUS) на отдельном соединении.
+    Реплика пригодна для чтений, пока отставание известно и не больше max_lag.
+    Ошибка запроса на реплике снимает её с маршрута до следующей успешной проверки.
+    """
+    def __init__(self, connect: Callable, max_lag: float = 2.0, interval: float = 1.0):
+        self._connect = connect
+        self.max_lag = float(max_lag)
+        self.interval = float(interval)
+
+        self._healthy = False
+        self._lag: Optional[float] = None
+        self._checked_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="replica-monitor")
+        self._thread.start()
+
+    @property
+    def healthy(self) -> bool:
+        return self._healthy
+
+    def mark_unhealthy(self, reason: str):
+        if self._healthy:
+            logger.warning("Replica taken out of read routing: %s", reason)
+        self._healthy = False
+        self._last_error = reason
+        replica_in_use.set(0)
+
+    def _read_lag(self) -> Optional[float]:
+        if self._conn is None:
+            self._conn = self._connect()
+        with self._conn.cursor() as cursor:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except Exception:
+                cursor.execute("SHOW SLAVE STATUS")
+            row = cursor.fetchone()
+        if not row:
+            return None  # репликация не настроена
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return float(lag) if lag is not None else None  # NULL — SQL-поток остановлен
+
+    def check(self):
+        try:
+            lag = self._read_lag()
+            self._last_error = None if lag is not None else "replication is not running"
+        except Exception as e:
+            lag = None
+            self._last_error = str(e)
+            try:
+                if self._conn is not None:
+                    self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+        self._lag = lag
+        self._checked_at = time.time()
+        replica_lag.set(lag if lag is not None else -1)
+
+        healthy = lag is not None and lag <= self.max_lag
+        if healthy != self._healthy:
+            if healthy:
+                logger.info("Replica is back in read routing (lag %.1fs)", lag)
+            else:
+                logger.warning("Replica taken out of read routing: lag=%s, error=%s", lag, self._last_error)
+        self._healthy = healthy
+        replica_in_use.set(1 if healthy else 0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.interval)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def status(self) -> dict:
+        return {"healthy": self._healthy,
+                "lag_sec": self._lag,
+                "max_lag_sec": self.max_lag,
+                "checked_at": self._checked_at,
+                "last_error": self._last_error}
@@ -0,0 +1,144 @@
+# infrastructure/db/mysql/slow_queries.py
+import hashlib
+import json
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger("SlowQueryLog")
+
+_WS_RE = re.compile(r"\s+")
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)")
+_EXPLAINABLE = ("select", "with")
+
+
+def normalize_sql(query: str) -> str:
+    """Одна строка, литералы -> ?, списки IN (...) схлопнуты — чтобы одинаковые запросы совпадали."""
+    sql = _WS_RE.sub(" ", query).strip()
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    return _IN_LIST_RE.sub("(...)", sql)
+
+
+def params_shape(params: Any) -> Any:
+    """Типы параметров без значений: ["int", "list[120]", ...]. Значения в буфер не попадают."""
+    def shape(value):
+        if isinstance(value, (list, tuple, set)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: shape(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [shape(v) for v in params]
+    return shape(params)
+
+
+class SlowQueryLog:
+    """
+    Кольцевой буфер медленных запросов.
+    EXPLAIN FORMAT=JSON снимается в отдельном потоке на своём соединении (не из пула),
+    не чаще раза в explain_interval для одного отпечатка запроса.
+    """
+    def __init__(self,
+                 threshold_ms: float,
+                 capacity: int = 200,
+                 connect: Optional[Callable[[], Any]] = None,
+                 explain_interval: float = 300.0):
+        self.threshold_ms = float(threshold_ms)
+        self._entries: deque = deque(maxlen=int(capacity))
+        self._lock = threading.Lock()
+        self._connect = connect
+        self._explain_interval = float(explain_interval)
+        self._explained_at: Dict[str, float] = {}
+        self._queue: "queue.Queue" = queue.Queue(maxsize=32)
+        self._side_conn = None
+        self._worker: Optional[threading.Thread] = None
+
+    def observe(self, query: str, params: Any, duration_ms: float, rowcount: Optional[int], operation: str):
+        if duration_ms < self.threshold_ms:
+            return
+
+        normalized = normalize_sql(query)
+        fingerprint = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+        entry = {"fingerprint": fingerprint,
+                 "captured_at": datetime.now().isoformat(timespec="seconds"),
+                 "operation": operation,
+                 "sql": normalized,
+                 "params_shape": params_shape(params),
+                 "rowcount": rowcount,
+                 "duration_ms": round(duration_ms, 1),
+                 "explain": None,
+                 "explain_error": None}
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning("Slow query %s: %.1f ms, rows=%s | %s", fingerprint, duration_ms, rowcount, normalized[:200])
+
+        if self._connect is not None and normalized.lower().startswith(_EXPLAINABLE):
+            self._schedule_explain(entry, query, params)
+
+    def _schedule_explain(self, entry: dict, query: str, params: Any):
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained_at.get(entry["fingerprint"])
+            if last is not None and now - last < self._explain_interval:
+                return
+            self._explained_at[entry["fingerprint"]] = now
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True, name="slow-query-explain")
+                self._worker.start()
+        try:
+            self._queue.put_nowait((entry, query, params))
+        except queue.Full:
+            logger.debug("Explain queue is full; skipping %s", entry["fingerprint"])
+
+    def _run(self):
+        while True:
+            entry, query, params = self._queue.get()
+            try:
+                entry["explain"] = self._explain(query, params)
+            except Exception as e:
+                entry["explain_error"] = str(e)
+                logger.warning("EXPLAIN failed for %s: %s", entry["fingerprint"], e)
+                self._drop_side_conn()
+
+    def _explain(self, query: str, params: Any) -> Any:
+        if self._side_conn is None:
+            self._side_conn = self._connect()
+        else:
+            self._side_conn.ping(reconnect=True)
+        with self._side_conn.cursor() as cursor:
+            cursor.execute("EXPLAIN FORMAT=JSON " + cursor.mogrify(query, params))
+            row = cursor.fetchone()
+        value = next(iter(row.values())) if isinstance(row, dict) else row[0]
+        return json.loads(value)
+
+    def _drop_side_conn(self):
+        try:
+            if self._side_conn is not None:
+                self._side_conn.close()
+        except Exception:
+            pass
+        self._side_conn = None
+
+    def entries(self, limit: Optional[int] = None) -> List[dict]:
+        """Новые сверху."""
+        with self._lock:
+            items = list(self._entries)
+        items.reverse()
+        return items[:limit] if limit else items
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._explained_at.clear()
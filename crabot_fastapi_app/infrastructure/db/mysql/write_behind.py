@@ -0,0 +1,141 @@
+# infrastructure/db/mysql/write_behind.py
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from utils.logger import get_logger
+
+logger = get_logger("WriteBehind")
+
+buffered_rows = Gauge("app_write_behind_buffered", "Updates waiting in a write-behind buffer", ["name"])
+coalesced_rows = Counter("app_write_behind_coalesced", "Updates overwritten in the buffer before reaching MySQL", ["name"])
+flushed_rows = Counter("app_write_behind_flushed", "Updates written to MySQL", ["name"])
+flush_failures = Counter("app_write_behind_flush_failures", "Failed flush batches (kept in the buffer for retry)", ["name"])
+flush_seconds = Histogram("app_write_behind_flush_seconds", "Duration of one flush batch", ["name"])
+
+
+class BufferFullError(Exception):
+    def __init__(self, name: str, retry_after: float = 1.0):
+        super().__init__(f"Write-behind buffer {name} is full")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class WriteBehindBuffer:
+    """
+    Буфер отложенной записи: ключ -> последнее значение (повторные обновления схлопываются).
+    Фоновый поток раз в interval_ms или при накоплении max_rows отдаёт накопленное в flush(dict)
+    пачками по max_rows. Неудачная пачка возвращается в буфер (если ключ не успели обновить)
+    и пишется на следующем такте. Больше max_buffered ключей — BufferFullError.
+    """
+    def __init__(self,
+                 name: str,
+                 flush: Callable[[Dict[Hashable, Any]], Any],
+                 interval_ms: float = 200,
+                 max_rows: int = 500,
+                 max_buffered: int = 100000):
+        self.name = name
+        self._flush_fn = flush
+        self.interval = float(interval_ms) / 1000
+        self.max_rows = int(max_rows)
+        self.max_buffered = int(max_buffered)
+
+        self._lock = threading.Lock()
+        # пачки пишутся строго по одной: иначе старая пачка могла бы лечь поверх более новой
+        self._flush_lock = threading.Lock()
+        self._items: Dict[Hashable, Any] = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_error: Optional[str] = None
+
+    def put_many(self, items: Dict[Hashable, Any]):
+        with self._lock:
+            new_keys = sum(1 for k in items if k not in self._items)
+            if len(self._items) + new_keys > self.max_buffered:
+                raise BufferFullError(self.name)
+            coalesced = len(items) - new_keys
+            self._items.update(items)
+            depth = len(self._items)
+        if coalesced:
+            coalesced_rows.labels(self.name).inc(coalesced)
+        buffered_rows.labels(self.name).set(depth)
+        if depth >= self.max_rows:
+            self._wakeup.set()
+
+    def put(self, key: Hashable, value: Any):
+        self.put_many({key: value})
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"write-behind-{self.name}")
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Останавливает поток и дописывает всё, что осталось в буфере (вызывается из lifespan).
+        Поток не успел выйти за timeout (висит в flush) — остаток не пишется: вторая запись
+        параллельно с ней могла бы применить пачки не по порядку.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        if self._thread is None or not self._thread.is_alive():
+            self.flush()
+        else:
+            logger.error("Write-behind %s flush thread did not stop in %.1fs, skipping final flush", self.name, timeout)
+        with self._lock:
+            left = len(self._items)
+        if left:
+            logger.error("Write-behind %s stopped with %d unflushed updates: %s", self.name, left, self._last_error)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            items, self._items = self._items, {}
+        if not items:
+            return
+        pending = list(items.items())
+        for i in range(0, len(pending), self.max_rows):
+            batch = dict(pending[i:i + self.max_rows])
+            started = time.perf_counter()
+            try:
+                self._flush_fn(batch)
+            except Exception as e:
+                self._last_error = str(e)
+                flush_failures.labels(self.name).inc()
+                logger.warning("Write-behind %s flush failed, %d updates kept for retry: %s",
+                               self.name, len(pending) - i, e)
+                with self._lock:
+                    for key, value in pending[i:]:
+                        # за время записи могло прийти более свежее значение — его не затираем
+                        self._items.setdefault(key, value)
+                break
+            flush_seconds.labels(self.name).observe(time.perf_counter() - started)
+            flushed_rows.labels(self.name).inc(len(batch))
+        else:
+            self._last_error = None
+        with self._lock:
+            buffered_rows.labels(self.name).set(len(self._items))
+
+    def status(self) -> dict:
+        with self._lock:
+            depth = len(self._items)
+        return {"buffered": depth,
+                "max_buffered": self.max_buffered,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "last_error": self._last_error}
@@ -0,0 +1,191 @@
+import asyncio
+import json
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from utils.logger import get_logger
+from utils.sync_cursor import encode_cursor
+
+logger = get_logger("TaskEvents")
+
+
+def task_event_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Снимок задания (строка get_tasks / get_task_snapshot) -> событие для клиентов."""
+    return {
+        "task_id": row["task_id"],
+        "task_status": row.get("task_status"),
+        "is_archived": row.get("is_archived"),
+        "version": row.get("version"),
+        "last_change_date": row.get("last_change_date"),
+        # SUM по пустому набору = NULL, а поллер считает 0 — приводим к одному виду
+        "positions_total": int(row.get("positions_total") or 0),
+        "quantity_total": int(row.get("quantity_total") or 0),
+        "quantity_left": int(row.get("quantity_left") or 0),
+    }
+
+
+def _sse_id(event: Dict[str, Any]) -> Optional[str]:
+    changed_at = event.get("last_change_date")
+    if isinstance(changed_at, datetime):
+        return f"id: {encode_cursor(changed_at, event['task_id'])}"
+    return None
+
+
+def format_sse(event: Dict[str, Any], event_type: str = "task", resumable: bool = True) -> str:
+    """
+    resumable — событие пришло из ленты изменений (поллер, догоняющий запрос), которая отстаёт
+    на TASK_CHANGES_SAFETY_LAG_SEC: тогда id = курсор ленты, по нему клиент переподключается
+    (Last-Event-ID). Локальная запись этого воркера уходит без id — её курсор может обогнать
+    ленту, и переподключение с ним пропустило бы чужие изменения с меньшей отметкой.
+    """
+    lines = []
+    event_id = _sse_id(event) if resumable else None
+    if event_id is not None:
+        lines.append(event_id)
+    lines.append(f"event: {event_type}")
+    lines.append("data: " + json.dumps(jsonable_encoder(event), ensure_ascii=False))
+    return "\n".join(lines) + "\n\n"
+
+
+def format_sse_id_only(event: Dict[str, Any]) -> Optional[str]:
+    """Только id: двигает Last-Event-ID клиента, не порождая события (данные уже ушли без id)."""
+    event_id = _sse_id(event)
+    return event_id + "\n\n" if event_id is not None else None
+
+
+class TaskEventBroker:
+    """
+    In-process fanout событий по заданиям: одна очередь на подписчика, в очереди — готовые
+    SSE-сообщения (форматируются один раз на все подписки). publish можно вызывать из любого
+    потока. Медленный подписчик теряет самые старые события, а не тормозит остальных.
+    resumable=True — событие из ленты изменений (см. format_sse); если то же изменение уже ушло
+    локальной публикацией, подписчикам уходит только его id.
+    """
+    def __init__(self, queue_size: int = 100, dedup_size: int = 10000):
+        self._queue_size = int(queue_size)
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # task_id -> ((last_change_date, task_status, quantity_left), ушёл ли id): одно изменение
+        # приходит и из локального publish, и из поллера — данные отдаём один раз, id — из поллера
+        self._seen: "OrderedDict[int, Tuple]" = OrderedDict()
+        self._dedup_size = int(dedup_size)
+
+    @property
+    def subscribers_count(self) -> int:
+        return len(self._subscribers)
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self) -> asyncio.Queue:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers.add(queue)
+        logger.debug("SSE subscriber added (total=%d)", len(self._subscribers))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        logger.debug("SSE subscriber removed (total=%d)", len(self._subscribers))
+
+    def publish(self, event: Dict[str, Any], resumable: bool = False):
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._fanout(event, resumable)
+        else:
+            self._loop.call_soon_threadsafe(self._fanout, event, resumable)
+
+    def _fanout(self, event: Dict[str, Any], resumable: bool):
+        task_id = event["task_id"]
+        signature = (event.get("last_change_date"), event.get("task_status"), event.get("quantity_left"))
+        seen = self._seen.get(task_id)
+        if seen is not None and seen[0] == signature:
+            if not resumable or seen[1]:
+                return
+            message = format_sse_id_only(event)
+            if message is None:
+                return
+        else:
+            message = format_sse(event, resumable=resumable)
+        self._seen[task_id] = (signature, resumable)
+        self._seen.move_to_end(task_id)
+        while len(self._seen) > self._dedup_size:
+            self._seen.popitem(last=False)
+
+        for queue in list(self._subscribers):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(message)
+
+
+class TaskChangePoller:
+    """
+    Опрашивает ленту изменений (last_change_date) и публикует события в брокер,
+    чтобы подписчики видели изменения, сделанные другими воркерами.
+    Пока подписчиков нет — БД не трогает.
+    """
+    def __init__(self, db_controller, broker: TaskEventBroker, interval: float, safety_lag_sec: int, batch_size: int = 500):
+        self._db_controller = db_controller
+        self._broker = broker
+        self._interval = float(interval)
+        self._safety_lag_sec = int(safety_lag_sec)
+        self._batch_size = int(batch_size)
+        self._after: Optional[Tuple[datetime, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._broker.bind(asyncio.get_running_loop())
+            self._task = asyncio.create_task(self._run(), name="task-change-poller")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self._broker.subscribers_count:
+                    await asyncio.to_thread(self._poll_once)
+                else:
+                    # при следующем подписчике начнём с «сейчас», а не с истории
+                    self._after = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Task change poll failed: %s", e)
+            await asyncio.sleep(self._interval)
+
+    def _poll_once(self):
+        if self._after is None:
+            now = self._db_controller.db.execute_scalar("SELECT NOW()")
+            self._after = (now, 0)
+            return
+
+        has_more = True
+        while has_more:
+            changes = self._db_controller.get_tasks_changes(after=self._after,
+                                                            limit=self._batch_size,
+                                                            safety_lag_sec=self._safety_lag_sec)
+            for task in changes["tasks"]:
+                self._broker.publish(task_event_from_row(task), resumable=True)
+            if changes["last"] is not None:
+                self._after = changes["last"]
+            has_more = changes["has_more"]
@@ -1,18 +1,42 @@
 # main.py
+import asyncio
 import logging
-import threading
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from routers.stock_transfer.stock_transfer import router as stock_transfer_router
 from routers.stock_transfer.healthcheck import router as heathcheck_routes
-from utils.system_metrics import collect_system_metrics
+from routers.admin.admin import router as admin_router
+from utils.system_metrics import GCMonitor, ResourceSampler, monitor_event_loop_lag
 from dependencies.dependencies import deps  
+from dependencies.auth import require_bearer
+from services.mysql_db_service.stock_transfer_service import DBController
+from infrastructure.events.task_events import TaskChangePoller
+from core.config import settings
+from infrastructure.db.mysql.migrations import MigrationRunner
+from core.compression import CompressionMiddleware
+from core.tracing import TracedJSONResponse, TracingMiddleware
+from core.deadline import DeadlineMiddleware
+from core.read_routing import ReadYourWritesMiddleware
+from core.load_shedding import LoadSheddingMiddleware
+from core.idempotency import IdempotencyMiddleware
+from services.mysql_db_service.idempotency_service import IdempotencyKeysController
+from utils.logger import configure_logging
 
-logging.basicConfig(level=logging.DEBUG)
+# все логгеры пишут в stdout через очередь, уровень — NEZKA_LOG_LEVEL
+configure_logging()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if settings.MIGRATIONS_AUTO_APPLY:
+        # воркеры стартуют параллельно — MigrationRunner сам разводит их блокировкой
+        conn = deps.db.connect_direct()
+        try:
+            MigrationRunner(conn).apply()
+        finally:
+            conn.close()
+
     try:
         # прогреваем пул соединений (создастся при первом обращении)
         deps.db.execute_scalar("SELECT 1")
@@ -20,29 +44,82 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logging.exception("MySQL warmup failed: %s", e)
 
-    # # системные метрики в отдельном потоке
-    # threading.Thread(target=collect_system_metrics, daemon=True).start()
+    # планы запросов горячих путей: полный просмотр большой таблицы — warning в лог
+    if settings.QUERY_PLAN_CHECK_ENABLED:
+        deps.query_plans.run_in_background(DBController(db=deps.db, references=deps.references).plan_probes())
+
+    # системные метрики: /proc и cgroup в отдельном потоке, паузы GC, задержка event loop
+    resource_sampler = ResourceSampler(interval=settings.SYSTEM_METRICS_INTERVAL_SEC)
+    gc_monitor = GCMonitor()
+    loop_lag_task = None
+    if settings.SYSTEM_METRICS_ENABLED:
+        resource_sampler.start()
+        gc_monitor.install()
+        loop_lag_task = asyncio.create_task(monitor_event_loop_lag(settings.EVENT_LOOP_LAG_PROBE_SEC))
+
+    # изменения заданий из других воркеров -> SSE-подписчики этого воркера
+    task_change_poller = TaskChangePoller(db_controller=DBController(db=deps.db, references=deps.references),
+                                          broker=deps.task_events,
+                                          interval=settings.TASK_EVENTS_POLL_INTERVAL_SEC,
+                                          safety_lag_sec=settings.TASK_CHANGES_SAFETY_LAG_SEC)
+    task_change_poller.start()
+
+    # прогресс отгрузки пишется пачками; при остановке буфер дописывается до закрытия пула
+    deps.task_progress.start()
+
+    # старые версии товаров и давно закрытые задания уезжают в *_archive фоновыми пачками
+    if settings.ARCHIVE_ENABLED:
+        deps.archive_mover.start()
 
     try:
         yield
     finally:
         # --- shutdown ---
-        try:
-            deps.db.close()  # закрываем свободные подключения
-            logging.info("MySQL pool closed.")
-        except Exception as e:
-            logging.warning("MySQL pool close failed: %s", e)
+        await task_change_poller.stop()
+        deps.task_progress.stop()
+        if settings.ARCHIVE_ENABLED:
+            deps.archive_mover.stop()
+        resource_sampler.stop()
+        gc_monitor.uninstall()
+        if loop_lag_task is not None:
+            loop_lag_task.cancel()
+        # пул потоков БД, затем свободные подключения
+        deps.close()
 
 app = FastAPI(title="Stock Transfer",
                 lifespan=lifespan,
                 docs_url=None,
                 redoc_url=None,
-                openapi_url=None)
+                openapi_url=None,
+                default_response_class=TracedJSONResponse)
+
+# первой -> самой внутренней: хранится несжатый ответ, а занятие ключа видит срок запроса
+if settings.IDEMPOTENCY_ENABLED:
+    app.add_middleware(IdempotencyMiddleware,
+                       store=IdempotencyKeysController(db=deps.db),
+                       executor=deps.db_executor,
+                       routes=settings.IDEMPOTENCY_ROUTES,
+                       ttl=settings.IDEMPOTENCY_TTL_SEC,
+                       lease=settings.IDEMPOTENCY_LEASE_SEC,
+                       cache_size=settings.IDEMPOTENCY_CACHE_SIZE)
+app.add_middleware(CompressionMiddleware, min_size=settings.COMPRESSION_MIN_SIZE)
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(ReadYourWritesMiddleware, window=settings.READ_YOUR_WRITES_SEC)
+if settings.LOAD_SHED_ENABLED:
+    app.add_middleware(LoadSheddingMiddleware, limiter=deps.concurrency_limiter, routes=settings.LOAD_SHED_ROUTES)
+# последней -> самой внешней: в Server-Timing попадает и сжатие
+app.add_middleware(TracingMiddleware,
+                   server_timing=settings.TRACING_SERVER_TIMING,
+                   export=settings.TRACING_EXPORT)
 
 app.include_router(stock_transfer_router)
 app.include_router(heathcheck_routes)
+app.include_router(admin_router)
 
 # from prometheus_fastapi_instrumentator import Instrumentator
-# from prometheus_client import make_asgi_app
 # Instrumentator().instrument(app).expose(app)
-# app.mount("/metrics", make_asgi_app())
+
+# метрики процесса, GC и маршрутов — под тем же токеном, что и API
+@app.get("/metrics", dependencies=[Depends(require_bearer)], include_in_schema=False)
+def metrics() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
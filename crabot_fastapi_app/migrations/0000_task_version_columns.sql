@@ -0,0 +1,33 @@
+-- Колонка version для оптимистичных блокировок (If-Match / ETag, VersionConflictError) на таблицах,
+-- заведённых до миграций. Номер 0000: колонка нужна раньше индекса idx_archived_version из 0004.
+-- На чистой базе таблиц ещё нет (их создаёт 0001 уже с version), где колонка есть — тоже ничего
+-- не делает: ALTER собирается только для существующей таблицы без колонки.
+SET @ddl = (
+    SELECT IF(COUNT(*) = 0, 'DO 0',
+              'ALTER TABLE mp_data.a_wb_stock_transfer_one_time_tasks ADD COLUMN version INT NOT NULL DEFAULT 0')
+      FROM information_schema.tables t
+     WHERE t.table_schema = 'mp_data'
+       AND t.table_name = 'a_wb_stock_transfer_one_time_tasks'
+       AND NOT EXISTS (SELECT 1 FROM information_schema.columns c
+                        WHERE c.table_schema = t.table_schema
+                          AND c.table_name = t.table_name
+                          AND c.column_name = 'version')
+);
+PREPARE add_version FROM @ddl;
+EXECUTE add_version;
+DEALLOCATE PREPARE add_version;
+
+SET @ddl = (
+    SELECT IF(COUNT(*) = 0, 'DO 0',
+              'ALTER TABLE mp_data.a_wb_stock_transfer_regular_tasks ADD COLUMN version INT NOT NULL DEFAULT 0')
+      FROM information_schema.tables t
+     WHERE t.table_schema = 'mp_data'
+       AND t.table_name = 'a_wb_stock_transfer_regular_tasks'
+       AND NOT EXISTS (SELECT 1 FROM information_schema.columns c
+                        WHERE c.table_schema = t.table_schema
+                          AND c.table_name = t.table_name
+                          AND c.column_name = 'version')
+);
+PREPARE add_version FROM @ddl;
+EXECUTE add_version;
+DEALLOCATE PREPARE add_version;
@@ -0,0 +1,76 @@
+-- Таблицы, которые читает/пишет DBController, в том виде, в каком они уже есть в mp_data.
+-- IF NOT EXISTS: на рабочей базе миграция только записывается в журнал.
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_izd_size (
+    size_id INT PRIMARY KEY,
+    size    VARCHAR(32) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_article (
+    wb_article_id BIGINT PRIMARY KEY,
+    article_name  VARCHAR(255)
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_warehouseName (
+    warehouse_id   INT PRIMARY KEY,
+    warehouse_name VARCHAR(255)
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_catalog_stocks (
+    id            BIGINT AUTO_INCREMENT PRIMARY KEY,
+    wb_article_id BIGINT   NOT NULL,
+    size_id       INT      NOT NULL,
+    warehouse_id  INT      NOT NULL,
+    qty           INT      NOT NULL,
+    time_end      DATETIME NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_stock_transfer_wb_regions (
+    region_id   INT PRIMARY KEY,
+    region_name VARCHAR(64) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_stock_transfer_wb_warehourses (
+    id             INT AUTO_INCREMENT PRIMARY KEY,
+    wb_office_id   INT,
+    warehouse_name VARCHAR(255),
+    region_id      INT
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_stock_transfer_one_time_tasks (
+    task_id             INT AUTO_INCREMENT PRIMARY KEY,
+    warehouses_from_ids JSON,
+    warehouses_to_ids   JSON,
+    task_status         TINYINT  NOT NULL DEFAULT 0,
+    is_archived         TINYINT  NOT NULL DEFAULT 0,
+    version             INT      NOT NULL DEFAULT 0,
+    task_creation_date  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    task_archiving_date DATETIME NULL,
+    last_change_date    DATETIME NULL
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_stock_transfer_products_to_one_time_tasks (
+    id                BIGINT AUTO_INCREMENT PRIMARY KEY,
+    task_id           INT     NOT NULL,
+    product_wb_id     BIGINT  NOT NULL,
+    size_id           INT     NOT NULL,
+    transfer_qty      INT     NOT NULL,
+    transfer_qty_left INT     NOT NULL,
+    is_archived       TINYINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_stock_transfer_regular_tasks (
+    task_id              INT AUTO_INCREMENT PRIMARY KEY,
+    task_creation_date   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    task_archiving_date  DATETIME NULL,
+    is_archived          TINYINT  NOT NULL DEFAULT 0,
+    version              INT      NOT NULL DEFAULT 0,
+    target_central        DECIMAL(6,4), min_central        DECIMAL(6,4),
+    target_north_west     DECIMAL(6,4), min_north_west     DECIMAL(6,4),
+    target_volga          DECIMAL(6,4), min_volga          DECIMAL(6,4),
+    target_south          DECIMAL(6,4), min_south          DECIMAL(6,4),
+    target_urals          DECIMAL(6,4), min_urals          DECIMAL(6,4),
+    target_siberia        DECIMAL(6,4), min_siberia        DECIMAL(6,4),
+    target_north_caucasus DECIMAL(6,4), min_north_caucasus DECIMAL(6,4),
+    target_far_east       DECIMAL(6,4), min_far_east       DECIMAL(6,4)
+);
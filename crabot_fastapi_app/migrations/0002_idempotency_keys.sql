@@ -0,0 +1,12 @@
+-- Ключи Idempotency-Key (IdempotencyKeysController), общие для всех воркеров.
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_stock_transfer_idempotency_keys (
+    idem_key         CHAR(64)     NOT NULL PRIMARY KEY,
+    endpoint         VARCHAR(255) NOT NULL,
+    request_hash     CHAR(64)     NOT NULL,
+    status_code      SMALLINT     NULL,
+    response_headers JSON         NULL,
+    response_body    MEDIUMBLOB   NULL,
+    locked_until     DATETIME     NOT NULL,
+    expires_at       DATETIME     NOT NULL,
+    KEY idx_expires_at (expires_at)
+);
@@ -0,0 +1,43 @@
+-- Архивные таблицы: строки, которые ArchiveMover переносит из горячих таблиц (те же колонки + archived_at)
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_stock_transfer_one_time_tasks_archive (
+    task_id             INT      NOT NULL PRIMARY KEY,
+    warehouses_from_ids JSON,
+    warehouses_to_ids   JSON,
+    task_status         TINYINT  NOT NULL,
+    is_archived         TINYINT  NOT NULL,
+    version             INT      NOT NULL,
+    task_creation_date  DATETIME NOT NULL,
+    task_archiving_date DATETIME NULL,
+    last_change_date    DATETIME NULL,
+    archived_at         DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_task_creation_date (task_creation_date)
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_stock_transfer_products_to_one_time_tasks_archive (
+    id                BIGINT  NOT NULL PRIMARY KEY,
+    task_id           INT     NOT NULL,
+    product_wb_id     BIGINT  NOT NULL,
+    size_id           INT     NOT NULL,
+    transfer_qty      INT     NOT NULL,
+    transfer_qty_left INT     NOT NULL,
+    is_archived       TINYINT NOT NULL,
+    archived_at       DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_task_archived (task_id, is_archived)
+);
+
+CREATE TABLE IF NOT EXISTS mp_data.a_wb_stock_transfer_regular_tasks_archive (
+    task_id              INT      NOT NULL PRIMARY KEY,
+    task_creation_date   DATETIME NOT NULL,
+    task_archiving_date  DATETIME NULL,
+    is_archived          TINYINT  NOT NULL,
+    version              INT      NOT NULL,
+    target_central        DECIMAL(6,4), min_central        DECIMAL(6,4),
+    target_north_west     DECIMAL(6,4), min_north_west     DECIMAL(6,4),
+    target_volga          DECIMAL(6,4), min_volga          DECIMAL(6,4),
+    target_south          DECIMAL(6,4), min_south          DECIMAL(6,4),
+    target_urals          DECIMAL(6,4), min_urals          DECIMAL(6,4),
+    target_siberia        DECIMAL(6,4), min_siberia        DECIMAL(6,4),
+    target_north_caucasus DECIMAL(6,4), min_north_caucasus DECIMAL(6,4),
+    target_far_east       DECIMAL(6,4), min_far_east       DECIMAL(6,4),
+    archived_at          DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
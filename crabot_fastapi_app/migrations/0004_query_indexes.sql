@@ -0,0 +1,41 @@
+-- Индексы под запросы DBController. ALGORITHM=INPLACE, LOCK=NONE: таблица не блокируется на запись,
+-- пока индекс строится. По одному индексу на оператор: уже заведённый вручную индекс пропускается,
+-- остальные всё равно создаются. Планы сверяет проверка при старте (QUERY_PLAN_CHECK_ENABLED).
+
+-- get_current_stocks: MAX(time_end) по артикулу и join обратно на (артикул, time_end);
+-- склад, размер и количество в индексе — строки остатков читаются без обращения к таблице
+ALTER TABLE mp_data.a_wb_catalog_stocks
+    ADD INDEX idx_article_time (wb_article_id, time_end, warehouse_id, size_id, qty),
+    ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE mp_data.a_wb_catalog_stocks
+    ADD INDEX idx_warehouse_article_time (warehouse_id, wb_article_id, time_end),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- товары задания и агрегаты get_tasks / снапшота — покрывающий индекс
+ALTER TABLE mp_data.a_wb_stock_transfer_products_to_one_time_tasks
+    ADD INDEX idx_task_archived (task_id, is_archived, transfer_qty, transfer_qty_left),
+    ALGORITHM=INPLACE, LOCK=NONE;
+-- старые версии наборов для ArchiveMover
+ALTER TABLE mp_data.a_wb_stock_transfer_products_to_one_time_tasks
+    ADD INDEX idx_archived (is_archived),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- get_tasks: only_active и диапазон дат
+ALTER TABLE mp_data.a_wb_stock_transfer_one_time_tasks
+    ADD INDEX idx_archived_created (is_archived, task_creation_date),
+    ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE mp_data.a_wb_stock_transfer_one_time_tasks
+    ADD INDEX idx_created (task_creation_date),
+    ALGORITHM=INPLACE, LOCK=NONE;
+-- лента изменений: keyset по (last_change_date, task_id)
+ALTER TABLE mp_data.a_wb_stock_transfer_one_time_tasks
+    ADD INDEX idx_last_change (last_change_date, task_id),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- активная регулярная запись и CAS по (is_archived, version)
+ALTER TABLE mp_data.a_wb_stock_transfer_regular_tasks
+    ADD INDEX idx_archived_created (is_archived, task_creation_date, task_id),
+    ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE mp_data.a_wb_stock_transfer_regular_tasks
+    ADD INDEX idx_archived_version (is_archived, version),
+    ALGORITHM=INPLACE, LOCK=NONE;
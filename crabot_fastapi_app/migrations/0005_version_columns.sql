@@ -0,0 +1,13 @@
+-- Колонка version для оптимистичных блокировок (If-Match / ETag, VersionConflictError).
+-- В 0001 она есть только у вновь созданных таблиц: на существующих CREATE TABLE IF NOT EXISTS
+-- ничего не меняет. Колонка в конце таблицы — MySQL 8 добавляет её без копирования (INSTANT).
+-- Где колонка уже заведена, ADD COLUMN (1060) и ADD INDEX (1061) пропускаются.
+ALTER TABLE mp_data.a_wb_stock_transfer_one_time_tasks
+    ADD COLUMN version INT NOT NULL DEFAULT 0;
+ALTER TABLE mp_data.a_wb_stock_transfer_regular_tasks
+    ADD COLUMN version INT NOT NULL DEFAULT 0;
+
+-- CAS по (is_archived, version) для регулярной записи
+ALTER TABLE mp_data.a_wb_stock_transfer_regular_tasks
+    ADD INDEX idx_archived_version (is_archived, version),
+    ALGORITHM=INPLACE, LOCK=NONE;
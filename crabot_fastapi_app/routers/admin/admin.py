@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+
+from dependencies.dependencies import deps
+from dependencies.auth import require_bearer
+from services.mysql_db_service.stock_transfer_service import DBController
+from utils.profiler import ProfilerBusyError, memory_tracker, stack_sampler
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin",
+                   tags=["Admin"],
+                   dependencies=[Depends(require_bearer)])
+
+
+# region Медленные запросы
+
+@router.get("/slow_queries")
+async def get_slow_queries(limit: Optional[int] = Query(50, ge=1, le=1000)):
+    """Последние медленные запросы (новые сверху) с EXPLAIN, если он уже снят."""
+    slow_queries = deps.db.slow_queries
+    return {"threshold_ms": slow_queries.threshold_ms,
+            "items": slow_queries.entries(limit)}
+
+
+@router.delete("/slow_queries")
+async def clear_slow_queries():
+    deps.db.slow_queries.clear()
+    logger.info("Slow query buffer cleared.")
+    return {"status": "success"}
+
+
+@router.get("/query_plans")
+async def get_query_plans():
+    """Результат последней проверки планов: запросы, которые читают большие таблицы целиком."""
+    return deps.query_plans.status()
+
+
+@router.post("/query_plans/check")
+async def run_query_plans_check():
+    results = await asyncio.to_thread(deps.query_plans.run, DBController(db=deps.db, references=deps.references).plan_probes())
+    return {"results": results}
+
+# endregion
+
+
+# region Предохранители и бакхеды
+
+@router.get("/resilience")
+async def get_resilience_status():
+    return {"mysql": deps.db.breaker.status(),
+            "mysql_replica": deps.db.replica_status(),
+            "db_executor": deps.db_executor.status(),
+            "concurrency_limit": deps.concurrency_limiter.status(),
+            "write_behind": deps.task_progress.status(),
+            "archive": deps.archive_mover.status(),
+            "reference_dictionaries": deps.references.status() if deps.references else None,
+            "bulkheads": deps.bulkheads.status()}
+
+# endregion
+
+# region Профилирование
+
+@router.post("/profiler/start")
+async def start_profiler(seconds: float = Query(30, gt=0, le=120),
+                         interval_ms: float = Query(10, ge=5, le=1000)):
+    """Запускает сэмплирующий профайлер на seconds секунд; по истечении он останавливается сам."""
+    try:
+        stack_sampler.start(seconds=seconds, interval=interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return stack_sampler.status()
+
+
+@router.get("/profiler/status")
+async def get_profiler_status():
+    return stack_sampler.status()
+
+
+@router.post("/profiler/stop", response_class=PlainTextResponse)
+async def stop_profiler():
+    """Останавливает профайлер и отдаёт collapsed stacks (flamegraph.pl, speedscope)."""
+    await asyncio.to_thread(stack_sampler.stop)
+    return PlainTextResponse(stack_sampler.collapsed(), headers={"Content-Disposition": "attachment; filename=profile.folded"})
+
+
+@router.get("/profiler/result", response_class=PlainTextResponse)
+async def get_profiler_result():
+    if stack_sampler.running:
+        raise HTTPException(status_code=409, detail="Profiler is still running")
+    if not stack_sampler.status()["samples"]:
+        raise HTTPException(status_code=404, detail="No profile recorded")
+    return PlainTextResponse(stack_sampler.collapsed(), headers={"Content-Disposition": "attachment; filename=profile.folded"})
+
+
+@router.post("/memory/start")
+async def start_memory_tracking(frames: int = Query(10, ge=1, le=50)):
+    """Включает tracemalloc и запоминает первый снимок. Замедляет аллокации — не оставлять включённым."""
+    try:
+        await asyncio.to_thread(memory_tracker.start, frames)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "success", "frames": frames}
+
+
+@router.get("/memory/diff")
+async def get_memory_diff(top: int = Query(30, ge=1, le=500),
+                          group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+                          reset: bool = Query(True)):
+    """Рост памяти по местам аллокации с предыдущего снимка."""
+    try:
+        return await asyncio.to_thread(memory_tracker.diff, top, group_by, reset)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/memory/stop")
+async def stop_memory_tracking():
+    await asyncio.to_thread(memory_tracker.stop)
+    return {"status": "success"}
+
+# endregion
@@ -1,17 +1,21 @@
+import asyncio
 import logging
+import math
 import traceback
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Header, Request, Response
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from pydantic import BaseModel
 from typing import List
 
 from schemas.requests.stock_transfer import (
     CreateFullTaskRequest, CreateFullTaskResponse, UpdateTaskStatusRequest,
-    TaskProductRequest, TaskProductUpdate, TaskProductUpdateRequest,
-    SwitchUserModeRequest, DistributionTargetRow, DistributionImportRequest,
-    RegularTaskUpsertRequest, RegularTaskResponse)
+    TaskProductRequest, TaskProductUpdate,
+    SwitchUserModeRequest, DistributionTargetRow,
+    RegularTaskUpsertRequest, RegularTaskResponse, TaskProgressRequest,
+    task_product_update_adapter, distribution_import_adapter)
 
-from services.mysql_db_service.stock_transfer_service import DBController
+from services.mysql_db_service.stock_transfer_service import DBController, TaskNotFoundError, VersionConflictError
 from infrastructure.api.sync_controller import SyncAPIController
 from dependencies.dependencies import deps
 from core.base_request_processor import BaseRequestProcessor
@@ -21,18 +25,53 @@ from routers.stock_transfer.mock_responses import get_task_mock, cancel_task_moc
                                                     update_task_products_mock, get_transferrable_products_mock, \
                                                     get_regions_mock, get_transfer_mode_mock, get_warehouses_mock
 from dependencies.auth import require_bearer
+from dependencies.bulkhead import limit_concurrency
+from core.resilience import CircuitOpenError
+from core.deadline import DeadlineExceededError
+from core.executor import ExecutorSaturatedError
+from infrastructure.db.mysql.write_behind import BufferFullError
+from dependencies.deadline import apply_route_deadline
+from core.config import settings
+from utils.sync_cursor import InvalidCursorError, decode_cursor, encode_cursor, resolve_cursor
+from infrastructure.events.task_events import format_sse, task_event_from_row
+from utils.etag import format_etag, parse_if_match
+from core.response_cache import ResponseCache
+from core.tabular import NotAcceptableError, choose_format, tabular_response
+from utils.fields import InvalidFieldsError, parse_fields
+from utils.logger import summarize
+from utils.bulk_body import validate_body
 
 # Logging setup
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 router = APIRouter(tags=["Stock Transfer"],
-                   dependencies=[Depends(require_bearer)])
+                   dependencies=[Depends(require_bearer), Depends(limit_concurrency), Depends(apply_route_deadline)])
 
 # ------- SETTINGS
 CACHE_LIFESPAN = 5
 BASE_URL = ""
-db_controller = DBController(db=deps.db)
+db_controller = DBController(db=deps.db, references=deps.references)
+# вызовы DBController из обработчиков: await db_calls.method(...) — в пуле потоков БД, не в event loop
+db_calls = deps.db_executor.bind(db_controller)
+# справочники: тело ответа и его сжатые варианты считаются один раз на TTL
+reference_cache = ResponseCache(ttl=settings.REFERENCE_CACHE_TTL_SEC)
+
+def _tabular_format(request: Request) -> Optional[str]:
+    """Табличный формат ответа по Accept; None — обычный JSON массивом объектов."""
+    try:
+        return choose_format(request.headers.get("accept"))
+    except NotAcceptableError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+def _resource_unavailable(e: Exception) -> HTTPException:
+    if isinstance(e, DeadlineExceededError):
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+def _precondition_failed(e: VersionConflictError) -> HTTPException:
+    headers = {"ETag": format_etag(e.current_version)} if e.current_version is not None else None
+    return HTTPException(status_code=412, detail=str(e), headers=headers)
+
 
 class CreateFullTaskRequest(BaseModel):
     supplier_id: int
@@ -44,7 +83,7 @@ class CreateFullTaskRequest(BaseModel):
 
 @router.post("/stock_transfer/create_full_task")
 async def create_full_task(request: CreateFullTaskRequest):
-    logger.info("POST /stock_transfer/create_full_task | Request: %s", request.model_dump_json())
+    logger.info("POST /stock_transfer/create_full_task | Request: %s", summarize(request))
 
     try:
         task_data = {
@@ -53,11 +92,13 @@ async def create_full_task(request: CreateFullTaskRequest):
             "warehouse_to_ids": request.warehouse_to_ids
         }
 
-        result = db_controller.create_new_task(task_data)
+        result = await db_calls.create_new_task(task_data)
 
-        logger.info(f"Full task created successfully. task_id:{result}")
+        logger.info("Full task created successfully. task_id:%s", result)
         return {"status": "success", "task_id": result}
 
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in create_full_task: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
@@ -66,80 +107,248 @@ async def create_full_task(request: CreateFullTaskRequest):
 
 @router.get("/stock_transfer/get_tasks")
 async def get_tasks(
+    request: Request,
+    response: Response,
     start_date: str = Query(...),  # ISO format: '2024-01-01'
     end_date: str = Query(...),
-    only_active: bool = Query(...)):
+    only_active: bool = Query(...),
+    fields: Optional[str] = Query(None),  # 'task_id,task_status,quantity_left'
+    include_archive: bool = Query(False)):  # история: задания, перенесённые в архив
     logger.info(
-        "GET /stock_transfer/get_tasks | Params: start_date=%s, end_date=%s, only_active=%s",
-        start_date, end_date, only_active)
+        "GET /stock_transfer/get_tasks | Params: start_date=%s, end_date=%s, only_active=%s, fields=%s, "
+        "include_archive=%s", start_date, end_date, only_active, fields, include_archive)
 
     try:
-        tasks = db_controller.get_tasks(start_date, end_date, only_active)
+        selected_fields = parse_fields(fields, DBController.TASK_FIELDS)
+    except InvalidFieldsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # колоночный JSON / MessagePack / Arrow для выгрузок — по Accept
+    media_type = _tabular_format(request)
+    response.headers["Vary"] = "Accept"
+
+    try:
+        if media_type is not None:
+            table = await db_calls.get_tasks_columns(start_date, end_date, only_active, fields=selected_fields,
+                                                     include_archive=include_archive)
+            return await asyncio.to_thread(tabular_response, table, media_type)
+
+        tasks = await db_calls.get_tasks(start_date, end_date, only_active, fields=selected_fields,
+                                         include_archive=include_archive)
 
         logger.info("Tasks retrieved successfully.")
         return tasks
 
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in get_tasks: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/stock_transfer/tasks/changes")
+async def get_tasks_changes(
+    cursor: Optional[str] = Query(None),  # непрозрачный курсор из предыдущего ответа
+    since: Optional[str] = Query(None),   # ISO-дата, если курсора ещё нет
+    limit: int = Query(500, ge=1)):
+    logger.info(
+        "GET /stock_transfer/tasks/changes | Params: cursor=%s, since=%s, limit=%s",
+        cursor, since, limit)
+
+    try:
+        after = resolve_cursor(cursor, since)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        changes = await db_calls.get_tasks_changes(
+            after=after,
+            limit=min(limit, settings.TASK_CHANGES_MAX_LIMIT),
+            safety_lag_sec=settings.TASK_CHANGES_SAFETY_LAG_SEC)
+
+        last = changes["last"]
+        next_cursor = encode_cursor(*last) if last else cursor
+        logger.info("Tasks changes retrieved successfully. tasks=%d", len(changes["tasks"]))
+        return {"tasks": changes["tasks"],
+                "products": changes["products"],
+                "next_cursor": next_cursor,
+                "has_more": changes["has_more"]}
+
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
+    except Exception as e:
+        logger.error("Error in get_tasks_changes: %s", traceback.format_exc())
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.put("/stock_transfer/update_task_status")
-async def update_task_status(request: UpdateTaskStatusRequest):
-    logger.info("PUT /stock_transfer/update_task_status | Request: %s", request.model_dump_json())
+async def update_task_status(request: UpdateTaskStatusRequest,
+                             response: Response,
+                             if_match: Optional[str] = Header(None)):
+    logger.info("PUT /stock_transfer/update_task_status | Request: %s", summarize(request))
     try:
-        # result = ...
+        snapshot = await db_calls.update_task_status(request.task_id,
+                                                     request.new_status,
+                                                     expected_version=parse_if_match(if_match))
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail=f"Task {request.task_id} not found")
+
+        result = task_event_from_row(snapshot)
+        deps.task_events.publish(result)
+        response.headers["ETag"] = format_etag(snapshot["version"])
         logger.info("Task status updated successfully.")
-        
-        result = {}
-        
+
         return result
+    except HTTPException:
+        raise
+    except VersionConflictError as e:
+        raise _precondition_failed(e)
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in update_task_status: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
 
 
+async def _task_events_stream(last_event_id: Optional[str]):
+    queue = deps.task_events.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+
+        # переподключение: догоняем пропущенное по ленте изменений, дальше — живые события
+        after = None
+        if last_event_id:
+            try:
+                after = decode_cursor(last_event_id)
+            except InvalidCursorError:
+                logger.warning("Ignoring invalid Last-Event-ID: %s", last_event_id)
+        has_more = after is not None
+        while has_more:
+            changes = await db_calls.get_tasks_changes(after=after,
+                                                       limit=settings.TASK_CHANGES_MAX_LIMIT,
+                                                       safety_lag_sec=settings.TASK_CHANGES_SAFETY_LAG_SEC)
+            for task in changes["tasks"]:
+                yield format_sse(task_event_from_row(task))
+            after = changes["last"]
+            has_more = changes["has_more"]
+
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=settings.TASK_EVENTS_HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                # комментарий-пинг держит соединение через прокси
+                yield ": ping\n\n"
+                continue
+            yield message
+    finally:
+        deps.task_events.unsubscribe(queue)
+
+
+@router.get("/stock_transfer/tasks/events")
+async def task_events(last_event_id: Optional[str] = Header(None)):
+    logger.info("GET /stock_transfer/tasks/events | Last-Event-ID: %s", last_event_id)
+    return StreamingResponse(_task_events_stream(last_event_id),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+
+
 @router.get("/stock_transfer/get_task_products")
-async def get_task_products(task_id: int = Query(...)):
-    logger.info("GET /stock_transfer/get_task_products | task_id: %s", task_id)
+async def get_task_products(response: Response,
+                            task_id: int = Query(...),
+                            include_archive: bool = Query(False)):
+    logger.info("GET /stock_transfer/get_task_products | task_id: %s, include_archive: %s", task_id, include_archive)
     try:
-        result = db_controller.get_task_products_by_task_id(task_id)
+        # версию читаем до товаров: если между запросами товары поменяли,
+        # клиент получит устаревший ETag и правка упадёт с 412, а не затрёт чужое
+        version = await db_calls.get_task_version(task_id)
+        result = await db_calls.get_task_products_by_task_id(task_id, include_archive=include_archive)
+        if version is not None:
+            response.headers["ETag"] = format_etag(version)
         return result
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in get_task_products: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/stock_transfer/update_task_products")
-async def update_task_products(request: TaskProductUpdateRequest):
-    logger.info("POST /stock_transfer/update_task_products | Request: %s", request.model_dump_json())
+async def update_task_products(request: Request,
+                               response: Response,
+                               if_match: Optional[str] = Header(None)):
+    # десятки тысяч строк: тело проверяется TypeAdapter'ом целиком, без модели на строку
+    payload = await validate_body(request, task_product_update_adapter)
+    logger.info("POST /stock_transfer/update_task_products | Request: %s", summarize(payload))
     try:
-        db_controller.update_task_products(
-            task_id=request.task_id,
-            products=[p.model_dump() for p in request.products])
+        new_version = await db_calls.update_task_products(
+            task_id=payload["task_id"],
+            products=payload["products"],
+            expected_version=parse_if_match(if_match))
+        response.headers["ETag"] = format_etag(new_version)
         logger.info("Task products updated successfully.")
-        return {"status": "success", "message": "Task products updated."}
-
+        return {"status": "success", "message": "Task products updated.", "version": new_version}
+
+    except TaskNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except VersionConflictError as e:
+        raise _precondition_failed(e)
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in update_task_products: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
 
+
+@router.post("/stock_transfer/task_progress", status_code=202)
+async def report_task_progress(request: TaskProgressRequest):
+    """
+    Прогресс отгрузки: остатки к перемещению и статусы заданий.
+    Принимается в буфер и пишется в БД пачками (через ~WRITE_BEHIND_FLUSH_MS мс);
+    повторные обновления одного товара до записи схлопываются до последнего.
+    """
+    logger.info("POST /stock_transfer/task_progress | Request: %s", summarize(request), extra={"sample_every": 100})
+    try:
+        accepted = deps.task_progress.submit(products=[p.model_dump() for p in request.products],
+                                             statuses=[s.model_dump() for s in request.statuses])
+        return {"status": "accepted", "accepted": accepted}
+    except BufferFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except Exception as e:
+        logger.error("Error in report_task_progress: %s", traceback.format_exc())
+        raise HTTPException(status_code=400, detail=str(e))
+
 # endregion
 
 # region Доступные товары
 
 @router.get("/stock_transfer/get_transferable_products")
 async def get_transferable_products(
-    warehouse_from_ids: Optional[list[int]] = Query(None)):
+    request: Request,
+    response: Response,
+    warehouse_from_ids: Optional[list[int]] = Query(None),
+    fields: Optional[str] = Query(None)):  # 'wb_article_id,stock_total'
     logger.info("GET /stock_transfer/get_transferable_products | Params: %s", {
-        "warehouse_from_ids": warehouse_from_ids})
-    
+        "warehouse_from_ids": warehouse_from_ids, "fields": fields})
+
+    try:
+        selected_fields = parse_fields(fields, DBController.STOCK_FIELDS)
+    except InvalidFieldsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type = _tabular_format(request)
+    response.headers["Vary"] = "Accept"
+
     try:
+        if media_type is not None:
+            # плоская таблица артикул x размер, без группировки в словари
+            table = await db_calls.get_current_stocks_columns(warehouse_from_ids, fields=selected_fields)
+            return await asyncio.to_thread(tabular_response, table, media_type)
+
         # result = ...
         # result = get_transferrable_products_mock
 
-        result = db_controller.get_current_stocks(warehouse_from_ids)
+        result = await db_calls.get_current_stocks(warehouse_from_ids, fields=selected_fields)
 
         return result
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in get_transferable_products: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
@@ -149,21 +358,26 @@ async def get_transferable_products(
 # region Справочники
 
 @router.get("/stock_transfer/get_warehouses")
-async def get_warehouses():
+async def get_warehouses(request: Request):
     logger.info("GET /stock_transfer/get_warehouses")
     try:
         # result = ...
         logger.info("Warehouses retrieved successfully.")
 
-        result = db_controller.get_all_warehouses()
+        cached = reference_cache.get("warehouses") or \
+            await deps.db_executor.run(reference_cache.get_or_load, "warehouses", db_controller.get_all_warehouses)
+        if cached is None:
+            return None
 
-        return result
+        return cached.to_response(request)
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in get_warehouses: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/stock_transfer/get_regions")
-async def get_regions():
+async def get_regions(request: Request):
     logger.info("GET /stock_transfer/get_regions")
     try:
         # result = ...
@@ -171,9 +385,14 @@ async def get_regions():
         
         # result = get_regions_mock
 
-        result = db_controller.get_all_regions()
+        cached = reference_cache.get("regions") or \
+            await deps.db_executor.run(reference_cache.get_or_load, "regions", db_controller.get_all_regions)
+        if cached is None:
+            return None
 
-        return result
+        return cached.to_response(request)
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in get_regions: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
@@ -198,7 +417,7 @@ async def get_transfer_mode(supplier_id: int):
 
 @router.post("/stock_transfer/switch_store_mode")
 async def switch_store_mode(request: SwitchUserModeRequest):
-    logger.info("POST /stock_transfer/switch_store_mode | Request: %s", request.model_dump_json())
+    logger.info("POST /stock_transfer/switch_store_mode | Request: %s", summarize(request))
     try:
         # result = ...
         logger.info("Store mode switched successfully.")
@@ -223,8 +442,9 @@ async def get_distribution_targets(supplier_id: int = Query(...)):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/stock_transfer/import_distribution_targets")
-async def upload_distribution_targets(request: DistributionImportRequest):
-    logger.info("POST /stock_transfer/import_distribution_targets | Request: %s", request.model_dump_json())
+async def upload_distribution_targets(request: Request):
+    payload = await validate_body(request, distribution_import_adapter)
+    logger.info("POST /stock_transfer/import_distribution_targets | Request: %s", summarize(payload))
     try:
         # result = ...
         logger.info("Distribution targets imported successfully.")
@@ -239,44 +459,56 @@ async def upload_distribution_targets(request: DistributionImportRequest):
 # ======== ЭНДПОЙНТЫ РЕГУЛЯРОК ========
 
 @router.post("/stock_transfer/regular_tasks")
-async def save_regular_task(request: RegularTaskUpsertRequest):
+async def save_regular_task(request: RegularTaskUpsertRequest,
+                            response: Response,
+                            if_match: Optional[str] = Header(None)):
     """
     Архивирует старые регулярные задания и создаёт новое.
-    Возвращает task_id.
+    Возвращает task_id и версию (If-Match — версия из GET).
     """
-    logger.info("POST /stock_transfer/regular_tasks | Request: %s", request.model_dump_json())
+    logger.info("POST /stock_transfer/regular_tasks | Request: %s", summarize(request))
     try:
-        new_task_id = db_controller.save_regular_task(
+        saved = await db_calls.save_regular_task(
             supplier_id=request.supplier_id,
             target=request.target,
-            minimum=request.minimum
+            minimum=request.minimum,
+            expected_version=parse_if_match(if_match)
         )
-        logger.info("Regular task saved successfully. task_id=%s", new_task_id)
-        return {"status": "success", "task_id": new_task_id}
+        response.headers["ETag"] = format_etag(saved["version"])
+        logger.info("Regular task saved successfully. task_id=%s", saved["task_id"])
+        return {"status": "success", "task_id": saved["task_id"], "version": saved["version"]}
+    except VersionConflictError as e:
+        raise _precondition_failed(e)
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in save_regular_task: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/stock_transfer/regular_tasks", response_model=RegularTaskResponse)
-async def get_active_regular_task():
+async def get_active_regular_task(response: Response):
     """
     Возвращает только одно активное (неархивированное) регулярное задание.
     """
     logger.info("GET /stock_transfer/regular_tasks")
     try:
-        row = db_controller.get_active_regular_task()
+        row = await db_calls.get_active_regular_task()
         if not row:
             raise HTTPException(status_code=404, detail="No active regular task found")
 
+        response.headers["ETag"] = format_etag(row["version"])
         return RegularTaskResponse(
             task_id=row["task_id"],
+            version=row["version"],
             target=row["target"],
             minimum=row["minimum"],
             created_at=row.get("task_creation_date")
         )
     except HTTPException:
         raise
+    except (CircuitOpenError, DeadlineExceededError, ExecutorSaturatedError) as e:
+        raise _resource_unavailable(e)
     except Exception as e:
         logger.error("Error in get_active_regular_task: %s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
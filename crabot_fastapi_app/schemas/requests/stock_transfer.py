@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
+from typing_extensions import NotRequired, TypedDict
 from uuid import UUID
 from typing import Dict, Any, List, Union, Optional
 
@@ -33,6 +34,35 @@ class TaskProductUpdateRequest(BaseModel):
     task_id: int
     products: List[TaskProductUpdate]
 
+# Быстрый путь для больших тел: TypeAdapter над TypedDict проверяет JSON целиком в pydantic-core,
+# без модели и model_dump() на строку — строки сразу идут в executemany.
+# (typing_extensions.TypedDict: pydantic не принимает typing.TypedDict до Python 3.12)
+class TaskProductRow(TypedDict):
+    product_id: int
+    size: NotRequired[int]       # size_id; строка "42" приводится к числу
+    size_name: NotRequired[str]  # или подпись размера ("M", "42-44") — в size_id по справочнику
+    quantity: int
+
+class TaskProductUpdatePayload(TypedDict):
+    task_id: int
+    products: List[TaskProductRow]
+
+task_product_update_adapter = TypeAdapter(TaskProductUpdatePayload)
+
+class TaskProductProgress(BaseModel):
+    task_id: int
+    product_id: int
+    size: str            # size_id, как в TaskProductUpdate
+    quantity_left: int = Field(..., ge=0)
+
+class TaskStatusProgress(BaseModel):
+    task_id: int
+    new_status: str
+
+class TaskProgressRequest(BaseModel):
+    products: List[TaskProductProgress] = []
+    statuses: List[TaskStatusProgress] = []
+
 class SwitchUserModeRequest(BaseModel):
     supplier_id: int
     new_mode: str
@@ -48,6 +78,19 @@ class DistributionImportRequest(BaseModel):
     supplier_id: int
     rows: List[DistributionTargetRow]
 
+class DistributionTargetRowDict(TypedDict):
+    region_id: int
+    warehouse_id: int
+    article: str
+    size: str
+    target_percent: float
+
+class DistributionImportPayload(TypedDict):
+    supplier_id: int
+    rows: List[DistributionTargetRowDict]
+
+distribution_import_adapter = TypeAdapter(DistributionImportPayload)
+
 
 RuRegionName = str  # "Центральный", "Северо-Западный", ...
 
@@ -58,6 +101,7 @@ class RegularTaskUpsertRequest(BaseModel):
 
 class RegularTaskResponse(BaseModel):
     task_id: int
+    version: Optional[int] = None
     target: Dict[RuRegionName, float]
     minimum: Dict[RuRegionName, float]
     created_at: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,229 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Histogram
+
+from infrastructure.db.mysql.base import SyncDatabase
+from services.mysql_db_service.stock_transfer_service import DBController
+from utils.logger import get_logger
+
+logger = get_logger("ArchiveMover")
+
+archive_moved_rows = Counter("app_archive_moved_rows", "Rows moved from hot tables to archive tables", ["table"])
+archive_batch_seconds = Histogram("app_archive_batch_seconds", "Duration of one archive batch transaction", ["kind"])
+archive_paused = Counter("app_archive_paused", "Archive runs cut short because the database is busy")
+
+TASKS_TABLE = "mp_data.a_wb_stock_transfer_one_time_tasks"
+PRODUCTS_TABLE = "mp_data.a_wb_stock_transfer_products_to_one_time_tasks"
+REGULAR_TASKS_TABLE = "mp_data.a_wb_stock_transfer_regular_tasks"
+TASKS_ARCHIVE = TASKS_TABLE + "_archive"
+PRODUCTS_ARCHIVE = PRODUCTS_TABLE + "_archive"
+REGULAR_TASKS_ARCHIVE = REGULAR_TASKS_TABLE + "_archive"
+
+# колонки архивов совпадают с горячими таблицами (плюс archived_at с DEFAULT)
+_TASK_COLS = DBController.TASK_COLUMNS
+_PRODUCT_COLS = "id, task_id, product_wb_id, size_id, transfer_qty, transfer_qty_left, is_archived"
+_REGULAR_TASK_COLS = ", ".join(["task_id", "task_creation_date", "task_archiving_date", "is_archived", "version"]
+                               + [c for pair in DBController._REGION_COLS.values() for c in pair])
+
+
+class ArchiveController:
+    """
+    Перенос мёртвых строк из горячих таблиц в *_archive.
+    Каждая пачка — одна короткая транзакция: SELECT ключей FOR UPDATE SKIP LOCKED,
+    INSERT ... SELECT в архив, DELETE из горячей таблицы. SKIP LOCKED разводит воркеры
+    по разным строкам и не ждёт строк, которые сейчас правит приложение.
+    """
+    def __init__(self, db: SyncDatabase):
+        self.db = db
+
+    @staticmethod
+    def _placeholders(ids: List[Any]) -> str:
+        return ",".join(["%s"] * len(ids))
+
+    def move_archived_products(self, batch_size: int) -> int:
+        """Старые версии наборов товаров (is_archived = 1) — их не читает ни один горячий запрос."""
+        def _move(cursor):
+            cursor.execute(f"""
+                SELECT id FROM {PRODUCTS_TABLE}
+                WHERE is_archived = 1
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (batch_size,))
+            ids = [row["id"] for row in cursor.fetchall()]
+            if not ids:
+                return 0
+            placeholders = self._placeholders(ids)
+            cursor.execute(f"""
+                INSERT INTO {PRODUCTS_ARCHIVE} ({_PRODUCT_COLS})
+                SELECT {_PRODUCT_COLS} FROM {PRODUCTS_TABLE} WHERE id IN ({placeholders})
+            """, ids)
+            cursor.execute(f"DELETE FROM {PRODUCTS_TABLE} WHERE id IN ({placeholders})", ids)
+            return len(ids)
+
+        try:
+            moved = self.db.execute_transaction(_move)
+            archive_moved_rows.labels(PRODUCTS_TABLE).inc(moved)
+            return moved
+        except Exception as e:
+            logging.error(f"Failed to move archived task products: {e}")
+            raise
+
+    def move_archived_tasks(self, batch_size: int, retention_days: int) -> int:
+        """Архивные задания старше retention_days — вместе со всеми их товарами."""
+        def _move(cursor):
+            cursor.execute(f"""
+                SELECT task_id FROM {TASKS_TABLE}
+                WHERE is_archived = 1
+                  AND COALESCE(task_archiving_date, last_change_date, task_creation_date) < NOW() - INTERVAL %s DAY
+                ORDER BY task_id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (retention_days, batch_size))
+            ids = [row["task_id"] for row in cursor.fetchall()]
+            if not ids:
+                return 0
+            placeholders = self._placeholders(ids)
+            cursor.execute(f"""
+                INSERT INTO {PRODUCTS_ARCHIVE} ({_PRODUCT_COLS})
+                SELECT {_PRODUCT_COLS} FROM {PRODUCTS_TABLE} WHERE task_id IN ({placeholders})
+            """, ids)
+            products = cursor.execute(f"DELETE FROM {PRODUCTS_TABLE} WHERE task_id IN ({placeholders})", ids)
+            cursor.execute(f"""
+                INSERT INTO {TASKS_ARCHIVE} ({_TASK_COLS})
+                SELECT {_TASK_COLS} FROM {TASKS_TABLE} WHERE task_id IN ({placeholders})
+            """, ids)
+            cursor.execute(f"DELETE FROM {TASKS_TABLE} WHERE task_id IN ({placeholders})", ids)
+            return len(ids), products
+
+        try:
+            moved = self.db.execute_transaction(_move)
+            if not moved:
+                return 0
+            tasks, products = moved
+            archive_moved_rows.labels(TASKS_TABLE).inc(tasks)
+            archive_moved_rows.labels(PRODUCTS_TABLE).inc(products)
+            return tasks
+        except Exception as e:
+            logging.error(f"Failed to move archived tasks: {e}")
+            raise
+
+    def move_archived_regular_tasks(self, batch_size: int, retention_days: int) -> int:
+        """Прежние версии регулярного задания; активная (is_archived = 0) не трогается."""
+        def _move(cursor):
+            cursor.execute(f"""
+                SELECT task_id FROM {REGULAR_TASKS_TABLE}
+                WHERE is_archived = 1
+                  AND COALESCE(task_archiving_date, task_creation_date) < NOW() - INTERVAL %s DAY
+                ORDER BY task_id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (retention_days, batch_size))
+            ids = [row["task_id"] for row in cursor.fetchall()]
+            if not ids:
+                return 0
+            placeholders = self._placeholders(ids)
+            cursor.execute(f"""
+                INSERT INTO {REGULAR_TASKS_ARCHIVE} ({_REGULAR_TASK_COLS})
+                SELECT {_REGULAR_TASK_COLS} FROM {REGULAR_TASKS_TABLE} WHERE task_id IN ({placeholders})
+            """, ids)
+            cursor.execute(f"DELETE FROM {REGULAR_TASKS_TABLE} WHERE task_id IN ({placeholders})", ids)
+            return len(ids)
+
+        try:
+            moved = self.db.execute_transaction(_move)
+            archive_moved_rows.labels(REGULAR_TASKS_TABLE).inc(moved)
+            return moved
+        except Exception as e:
+            logging.error(f"Failed to move archived regular tasks: {e}")
+            raise
+
+
+class ArchiveMover:
+    """
+    Фоновый перенос в архив: раз в interval проходит по всем видам строк пачками по batch_size
+    с паузой pause_ms между пачками. Пока busy() говорит, что БД занята (ожидающие в пуле,
+    отставание реплики), проход прерывается до следующего такта — архив подождёт, запросы нет.
+    За проход переносится не больше max_batches пачек.
+    """
+    def __init__(self,
+                 controller: ArchiveController,
+                 batch_size: int = 500,
+                 pause_ms: float = 200,
+                 interval: float = 300,
+                 retention_days: int = 30,
+                 max_batches: int = 100,
+                 busy: Optional[Callable[[], bool]] = None):
+        self.controller = controller
+        self.batch_size = int(batch_size)
+        self.pause = float(pause_ms) / 1000
+        self.interval = float(interval)
+        self.retention_days = int(retention_days)
+        self.max_batches = int(max_batches)
+        self.busy = busy or (lambda: False)
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_run: Optional[float] = None
+        self._last_moved: Dict[str, int] = {}
+        self._last_error: Optional[str] = None
+
+    def _jobs(self) -> Dict[str, Callable[[], int]]:
+        return {"products": lambda: self.controller.move_archived_products(self.batch_size),
+                "tasks": lambda: self.controller.move_archived_tasks(self.batch_size, self.retention_days),
+                "regular_tasks": lambda: self.controller.move_archived_regular_tasks(self.batch_size,
+                                                                                     self.retention_days)}
+
+    def run_once(self) -> Dict[str, int]:
+        moved: Dict[str, int] = {}
+        batches = 0
+        for kind, job in self._jobs().items():
+            moved[kind] = 0
+            while batches < self.max_batches and not self._stop.is_set():
+                if self.busy():
+                    archive_paused.inc()
+                    logger.info("Archive run paused: database is busy")
+                    return moved
+                started = time.perf_counter()
+                count = job()
+                archive_batch_seconds.labels(kind).observe(time.perf_counter() - started)
+                batches += 1
+                moved[kind] += count
+                if count < self.batch_size:
+                    break
+                self._stop.wait(self.pause)
+        return moved
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._last_moved = self.run_once()
+                self._last_error = None
+                if any(self._last_moved.values()):
+                    logger.info("Archive run moved %s", self._last_moved)
+            except Exception as e:
+                self._last_error = str(e)
+                logger.warning("Archive run failed: %s", e)
+            self._last_run = time.time()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="archive-mover")
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def status(self) -> dict:
+        return {"running": self._thread is not None and self._thread.is_alive(),
+                "last_run": self._last_run,
+                "last_moved": self._last_moved,
+                "last_error": self._last_error}
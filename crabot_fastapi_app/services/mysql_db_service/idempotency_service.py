@@ -0,0 +1,109 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from infrastructure.db.mysql.base import SyncDatabase
+from core.read_routing import use_primary
+
+
+class IdempotencyKeysController:
+    """
+    Таблица ключей идемпотентности: общая для всех воркеров.
+    Строка без status_code — запрос выполняется (аренда до locked_until);
+    со status_code — сохранённый ответ, который отдаётся повторам до expires_at.
+    """
+    _TABLE = "mp_data.a_wb_stock_transfer_idempotency_keys"
+
+    def __init__(self, db: SyncDatabase):
+        self.db = db
+
+    def claim(self, key: str, endpoint: str, request_hash: str,
+              lease_sec: int, ttl_sec: int) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Пытается занять ключ. Возвращает:
+        ("claimed", None) — ключ наш, выполняем запрос;
+        ("stored", row)   — ответ уже сохранён;
+        ("busy", row)     — запрос с этим ключом сейчас выполняет другой воркер.
+        """
+        try:
+            inserted = self.db.execute_non_query(f"""
+                INSERT IGNORE INTO {self._TABLE}
+                    (idem_key, endpoint, request_hash, locked_until, expires_at)
+                VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND, NOW() + INTERVAL %s SECOND)
+            """, (key, endpoint, request_hash, lease_sec, ttl_sec))
+            if inserted["rowcount"]:
+                return "claimed", None
+
+            # просроченный ответ или брошенная аренда (воркер упал посреди запроса) — забираем ключ
+            taken = self.db.execute_non_query(f"""
+                UPDATE {self._TABLE}
+                   SET endpoint = %s,
+                       request_hash = %s,
+                       status_code = NULL,
+                       response_headers = NULL,
+                       response_body = NULL,
+                       locked_until = NOW() + INTERVAL %s SECOND,
+                       expires_at = NOW() + INTERVAL %s SECOND
+                 WHERE idem_key = %s
+                   AND (expires_at < NOW() OR (status_code IS NULL AND locked_until < NOW()))
+            """, (endpoint, request_hash, lease_sec, ttl_sec, key))
+            if taken["rowcount"]:
+                return "claimed", None
+
+            row = self.get(key)
+            if row is None:
+                # строку успели удалить между запросами — пусть клиент повторит
+                return "busy", None
+            return ("stored" if row["status_code"] is not None else "busy"), row
+        except Exception as e:
+            logging.error(f"Failed to claim idempotency key: {e}")
+            raise
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with use_primary():
+                rows = self.db.execute_query(f"""
+                    SELECT request_hash, status_code, response_headers, response_body
+                    FROM {self._TABLE}
+                    WHERE idem_key = %s
+                """, (key,))
+            if not rows:
+                return None
+            row = rows[0]
+            if isinstance(row["response_headers"], (str, bytes)):
+                row["response_headers"] = json.loads(row["response_headers"])
+            return row
+        except Exception as e:
+            logging.error(f"Failed to read idempotency key: {e}")
+            raise
+
+    def complete(self, key: str, status_code: int, headers: List[Tuple[str, str]], body: bytes):
+        try:
+            self.db.execute_non_query(f"""
+                UPDATE {self._TABLE}
+                   SET status_code = %s,
+                       response_headers = %s,
+                       response_body = %s
+                 WHERE idem_key = %s
+            """, (status_code, json.dumps(headers), body, key))
+        except Exception as e:
+            logging.error(f"Failed to store idempotent response: {e}")
+            raise
+
+    def release(self, key: str):
+        """Ответ не сохраняем (5xx, обрыв) — снимаем аренду, чтобы повтор выполнился заново."""
+        try:
+            self.db.execute_non_query(
+                f"DELETE FROM {self._TABLE} WHERE idem_key = %s AND status_code IS NULL", (key,))
+        except Exception as e:
+            logging.error(f"Failed to release idempotency key: {e}")
+            raise
+
+    def purge_expired(self, limit: int = 1000) -> int:
+        try:
+            result = self.db.execute_non_query(
+                f"DELETE FROM {self._TABLE} WHERE expires_at < NOW() LIMIT %s", (limit,))
+            return result["rowcount"]
+        except Exception as e:
+            logging.error(f"Failed to purge expired idempotency keys: {e}")
+            raise
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+from prometheus_client import Counter
+
+from infrastructure.db.mysql.base import SyncDatabase
+
+reference_misses = Counter("app_reference_dictionary_misses", "Lookups that had to query MySQL", ["dictionary"])
+
+
+class UnknownSizeError(ValueError):
+    def __init__(self, labels: Iterable[str]):
+        self.labels = sorted(labels)
+        super().__init__(f"Unknown sizes: {', '.join(self.labels)}")
+
+
+class ReferenceDictionaries:
+    """
+    Справочники в памяти воркера: размеры (size_id <-> size) и артикулы (wb_article_id -> article_name).
+    Загружаются целиком при первом обращении; раз в full_reload_sec перечитываются целиком — так
+    подхватываются переименования. Чего нет в памяти, добирается одним запросом на всю пачку.
+    Раз в refresh_sec дочитываются новые размеры (size_id — наш автоинкремент, новые id больше
+    известного максимума) и забываются промахи по артикулам: wb_article_id приходят от WB не по
+    порядку, поэтому новый артикул находится только запросом по id, а отсутствующий артикул
+    перепроверяется не реже раза в refresh_sec.
+    Обновление делает один поток, остальные в это время читают прежние словари.
+    """
+    def __init__(self, db: SyncDatabase, refresh_sec: float = 60, full_reload_sec: float = 3600):
+        self.db = db
+        self.refresh_sec = float(refresh_sec)
+        self.full_reload_sec = float(full_reload_sec)
+
+        self._lock = threading.Lock()
+        self._sizes: Dict[int, str] = {}
+        self._size_ids: Dict[str, int] = {}
+        self._articles: Dict[int, Optional[str]] = {}
+        self._missing_articles: Set[int] = set()
+        self._loaded_at: Optional[float] = None
+        self._refreshed_at = 0.0
+
+    # ---------- загрузка
+    def _fetch_sizes(self, where: str = "", params: Any = None) -> Dict[int, str]:
+        _, rows = self.db.execute_query_rows(
+            f"SELECT size_id, size FROM mp_data.a_wb_izd_size {where} ORDER BY size_id", params)
+        return dict(rows)
+
+    def _fetch_articles(self, where: str = "", params: Any = None) -> Dict[int, Optional[str]]:
+        _, rows = self.db.execute_query_rows(
+            f"SELECT wb_article_id, article_name FROM mp_data.a_wb_article {where}", params)
+        return dict(rows)
+
+    def _add_sizes(self, sizes: Dict[int, str]):
+        self._sizes.update(sizes)
+        for size_id, size in sorted(sizes.items()):
+            # одинаковые подписи у разных id: берём меньший id, как и при полной загрузке
+            current = self._size_ids.get(size)
+            if current is None or size_id < current:
+                self._size_ids[size] = size_id
+
+    def _full_reload(self):
+        sizes = self._fetch_sizes()
+        articles = self._fetch_articles()
+        size_ids: Dict[str, int] = {}
+        for size_id, size in sizes.items():
+            size_ids.setdefault(size, size_id)
+        self._sizes, self._size_ids, self._articles = sizes, size_ids, articles
+        self._missing_articles = set()
+        self._loaded_at = self._refreshed_at = time.monotonic()
+        logging.info(f"Reference dictionaries loaded: sizes={len(sizes)}, articles={len(articles)}")
+
+    def _incremental_refresh(self):
+        max_size = max(self._sizes, default=0)
+        self._add_sizes(self._fetch_sizes("WHERE size_id > %s", (max_size,)))
+        self._missing_articles = set()
+        self._refreshed_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._refreshed_at < self.refresh_sec:
+            return
+        # первая загрузка ждёт; обновление — только один поток, остальные идут со старыми словарями
+        if not self._lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._loaded_at is None or now - self._loaded_at >= self.full_reload_sec:
+                self._full_reload()
+            elif now - self._refreshed_at >= self.refresh_sec:
+                self._incremental_refresh()
+        except Exception as e:
+            if self._loaded_at is None:
+                raise
+            # старые словари лучше, чем отказ запроса; попробуем на следующем обращении
+            logging.error(f"Failed to refresh reference dictionaries: {e}")
+        finally:
+            self._lock.release()
+
+    # ---------- поиск
+    def size_names(self, size_ids: Iterable[Any]) -> Dict[int, str]:
+        """size_id -> подпись для переданных id; неизвестные дочитываются одним запросом."""
+        self._ensure_fresh()
+        sizes = self._sizes
+        missing = [i for i in set(size_ids) if i is not None and i not in sizes]
+        if missing:
+            reference_misses.labels("sizes").inc()
+            placeholders = ",".join(["%s"] * len(missing))
+            found = self._fetch_sizes(f"WHERE size_id IN ({placeholders})", missing)
+            with self._lock:
+                self._add_sizes(found)
+            sizes = self._sizes
+        return sizes
+
+    def size_ids(self, labels: Iterable[str]) -> Dict[str, int]:
+        """Подписи размеров -> size_id пачкой; подписи, которых нет и в БД, — UnknownSizeError."""
+        self._ensure_fresh()
+        labels = set(labels)
+        missing = [l for l in labels if l not in self._size_ids]
+        if missing:
+            reference_misses.labels("sizes").inc()
+            placeholders = ",".join(["%s"] * len(missing))
+            found = self._fetch_sizes(f"WHERE size IN ({placeholders})", missing)
+            with self._lock:
+                self._add_sizes(found)
+            unknown = [l for l in missing if l not in self._size_ids]
+            if unknown:
+                raise UnknownSizeError(unknown)
+        size_ids = self._size_ids
+        return {label: size_ids[label] for label in labels}
+
+    def article_names(self, article_ids: Iterable[Any]) -> Dict[int, Optional[str]]:
+        """wb_article_id -> article_name; артикула нет в справочнике — None (как LEFT JOIN)."""
+        self._ensure_fresh()
+        articles = self._articles
+        missing = [i for i in set(article_ids)
+                   if i is not None and i not in articles and i not in self._missing_articles]
+        if missing:
+            reference_misses.labels("articles").inc()
+            placeholders = ",".join(["%s"] * len(missing))
+            found = self._fetch_articles(f"WHERE wb_article_id IN ({placeholders})", missing)
+            with self._lock:
+                self._articles.update(found)
+                self._missing_articles.update(i for i in missing if i not in found)
+            articles = self._articles
+        return articles
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        return {"sizes": len(self._sizes),
+                "articles": len(self._articles),
+                "loaded_sec_ago": round(now - self._loaded_at, 1) if self._loaded_at is not None else None,
+                "refreshed_sec_ago": round(now - self._refreshed_at, 1) if self._loaded_at is not None else None}
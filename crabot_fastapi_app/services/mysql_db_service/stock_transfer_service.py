@@ -1,19 +1,40 @@
-from typing import Optional, Any, List, Dict, Tuple
+from typing import Optional, Any, List, Dict, Sequence, Tuple
 from enum import Enum
 import json
 import logging
 from collections import defaultdict
+from datetime import datetime, timedelta
 
 from infrastructure.db.mysql.base import SyncDatabase
+from core.resilience import CircuitOpenError
+from core.deadline import DeadlineExceededError
+from core.read_routing import use_primary
+from services.mysql_db_service.reference_service import ReferenceDictionaries
 
 
 class DBSchema(str, Enum):
     ADVERT_API = "advert_api"
 
 
+class TaskNotFoundError(LookupError):
+    pass
+
+
+# Оптимистичные блокировки держатся на колонке version INT NOT NULL DEFAULT 0
+# в a_wb_stock_transfer_one_time_tasks и a_wb_stock_transfer_regular_tasks.
+class VersionConflictError(Exception):
+    """CAS по версии не прошёл: запись уже изменил кто-то другой."""
+    def __init__(self, current_version: Optional[int]):
+        super().__init__(f"Version conflict, current version is {current_version}")
+        self.current_version = current_version
+
+
 class DBController:
-    def __init__(self, db: SyncDatabase):
+    def __init__(self, db: SyncDatabase, references: Optional[ReferenceDictionaries] = None):
         self.db = db
+        # справочники размеров/артикулов в памяти: чтения идут без join-ов, подписи подставляются в Python;
+        # без них — прежние LEFT JOIN в SQL
+        self.references = references
 
     
     # ---------- МАППИНГ РЕГИОНОВ -> КОЛОНКИ ----------
@@ -29,15 +50,41 @@ class DBController:
         "Дальневосточный":    ("target_far_east",      "min_far_east"),
     }
 
-    # -------- Текущие остатки
-    def get_current_stocks(self, warehouse_from_ids: List[int]) -> Optional[Any]:
-        """Возвращает актуальные остатки по списку складов."""
-        try:
-            if not warehouse_from_ids:
-                return []
+    # коды task_status в БД
+    _TASK_STATUSES: Dict[str, int] = {
+        "new":         0,
+        "in_progress": 1,
+        "done":        2,
+    }
 
-            placeholders = ",".join(["%s"] * len(warehouse_from_ids))
-            query = f"""
+    # поля ответов для ?fields= (проекция): имя в ответе -> выражение в SELECT
+    TASK_FIELDS: Dict[str, str] = {
+        "task_id":             "tasks.task_id",
+        "warehouses_from_ids": "warehouses_from_ids",
+        "warehouses_to_ids":   "warehouses_to_ids",
+        "task_status":         "task_status",
+        "is_archived":         "is_archived",
+        "version":             "version",
+        "task_creation_date":  "task_creation_date",
+        "task_archiving_date": "task_archiving_date",
+        "last_change_date":    "last_change_date",
+        "positions_total":     "tpq.positions_total",
+        "quantity_total":      "tpq.quantity_total",
+        "quantity_left":       "tpq.quantity_left",
+    }
+    _TASK_AGGREGATE_FIELDS = ("positions_total", "quantity_total", "quantity_left")
+    # колонки заданий, общие для горячей таблицы и архива
+    TASK_COLUMNS = ("task_id, warehouses_from_ids, warehouses_to_ids, task_status, is_archived, version, "
+                    "task_creation_date, task_archiving_date, last_change_date")
+
+    # stock_total не входит в ответ по умолчанию — только по явному запросу
+    STOCK_FIELDS = ("article_name", "wb_article_id", "sizes", "stock_total")
+    _STOCK_DEFAULT_FIELDS = ["article_name", "wb_article_id", "sizes"]
+    # в табличных форматах sizes разворачивается в колонки: строка на артикул x размер
+    _STOCK_SIZE_COLUMNS = ("size", "stock_from", "stock_to", "on_the_way")
+
+    # -------- Текущие остатки
+    _LATEST_STOCK_CTE = """
                 WITH latest_stock AS (
                     SELECT s.*
                     FROM mp_data.a_wb_catalog_stocks s
@@ -49,52 +96,174 @@ class DBController:
                     ON s.wb_article_id = latest.wb_article_id
                     AND s.time_end = latest.max_time_end
                 )
+    """
+
+    def _size_column(self, alias: str) -> Tuple[str, str]:
+        """Колонка size и её join; со справочниками — голый size_id, подпись подставит _attach_size_names."""
+        if self.references is not None:
+            return f"{alias}.size_id AS size", ""
+        return "sz.size", f"LEFT JOIN mp_data.a_wb_izd_size sz ON sz.size_id = {alias}.size_id"
+
+    def _attach_size_names(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.references is not None and rows:
+            names = self.references.size_names(row["size"] for row in rows)
+            for row in rows:
+                row["size"] = names.get(row["size"])
+        return rows
+
+    def _stocks_query(self, warehouses_count: int, fields: List[str]) -> str:
+        """SQL остатков: без sizes — итоги по артикулу прямо в SQL, иначе строки артикул x размер."""
+        # названия артикулов со справочниками в памяти подставляются после запроса
+        with_name = "article_name" in fields and self.references is None
+        size_column, size_join = self._size_column("s")
+        placeholders = ",".join(["%s"] * warehouses_count)
+        name_join = "LEFT JOIN mp_data.a_wb_article a ON a.wb_article_id = s.wb_article_id" if with_name else ""
+        where = f"""
+                WHERE s.time_end > DATE_SUB(CURRENT_DATE(), INTERVAL 1 HOUR)
+                  AND s.warehouse_id IN ({placeholders})
+            """
+
+        if "sizes" not in fields:
+            # только итоги: одна строка на артикул прямо из БД
+            return self._LATEST_STOCK_CTE + f"""
                 SELECT
-                    a.article_name,
+                    {"a.article_name," if with_name else ""}
                     s.wb_article_id AS wb_article_id,
-                    sz.size,
+                    SUM(s.qty) AS stock_total
+                FROM latest_stock s
+                {name_join}
+                {where}
+                GROUP BY s.wb_article_id{", a.article_name" if with_name else ""};
+                """
+
+        return self._LATEST_STOCK_CTE + f"""
+                SELECT
+                    {"a.article_name," if with_name else "NULL AS article_name,"}
+                    s.wb_article_id AS wb_article_id,
+                    {size_column},
                     s.qty AS stock_from,
                     0 AS stock_to,
                     0 AS on_the_way
                 FROM latest_stock s
-                LEFT JOIN mp_data.a_wb_article a ON a.wb_article_id = s.wb_article_id
-                LEFT JOIN mp_data.a_wb_izd_size sz ON sz.size_id = s.size_id
-                LEFT JOIN mp_data.a_wb_warehouseName awwn ON s.warehouse_id = awwn.warehouse_id
-                WHERE s.time_end > DATE_SUB(CURRENT_DATE(), INTERVAL 1 HOUR)
-                  AND s.warehouse_id IN ({placeholders});
+                {name_join}
+                {size_join}
+                {where};
             """
 
-            rows = self.db.execute_query(query, tuple(warehouse_from_ids))
-
-            grouped = defaultdict(lambda: {"sizes": []})
-            for row in rows:
-                key = (row["article_name"], row["wb_article_id"])
-                grouped[key]["sizes"].append({
-                    "size": row["size"],
-                    "stock_from": row["stock_from"],
-                    "stock_to": row["stock_to"],
-                    "on_the_way": row["on_the_way"],
-                })
-
-            result = []
-            for (article_name, wb_article_id), data in grouped.items():
-                result.append({
-                    "article_name": article_name,
-                    "wb_article_id": wb_article_id,
-                    "sizes": data["sizes"],
-                })
-
-            return result
+    def get_current_stocks(self, warehouse_from_ids: List[int], fields: Optional[List[str]] = None) -> Optional[Any]:
+        """
+        Возвращает актуальные остатки по списку складов.
+        fields — проекция: без sizes остатки суммируются в SQL и размеры не выбираются вовсе.
+        """
+        try:
+            if not warehouse_from_ids:
+                return []
 
+            fields = fields or self._STOCK_DEFAULT_FIELDS
+            query = self._stocks_query(len(warehouse_from_ids), fields)
+
+            if "sizes" not in fields:
+                rows = self.db.execute_query(query, tuple(warehouse_from_ids))
+                if "stock_total" in fields:
+                    for row in rows:
+                        row["stock_total"] = int(row["stock_total"] or 0)
+                if "article_name" in fields and self.references is not None:
+                    names = self.references.article_names(row["wb_article_id"] for row in rows)
+                    for row in rows:
+                        row["article_name"] = names.get(row["wb_article_id"])
+                return [{f: row[f] for f in fields} for row in rows]
+
+            # строк здесь на порядок больше, чем артикулов в ответе: читаем кортежами, без dict на строку
+            columns, rows = self.db.execute_query_rows(query, tuple(warehouse_from_ids))
+            return self._group_stock_rows(columns, rows, fields)
+
+        except (CircuitOpenError, DeadlineExceededError):
+            raise
         except Exception as e:
             logging.error(f"Failed to fetch current stocks: {e}")
             return None
 
+    def _group_stock_rows(self, columns: List[str], rows: Sequence[tuple], fields: List[str]) -> List[Dict[str, Any]]:
+        """Построчные остатки (артикул x размер), кортежами -> артикулы со списком размеров."""
+        i_name, i_article, i_size, i_from, i_to, i_way = (
+            columns.index(c) for c in ("article_name", "wb_article_id", "size", "stock_from", "stock_to", "on_the_way"))
+        # со справочниками в SQL нет join-ов: size — это size_id, article_name — NULL
+        size_names = self.references.size_names({row[i_size] for row in rows}) if self.references else None
+        grouped: Dict[Tuple[Any, Any], List[Dict[str, Any]]] = {}
+        for row in rows:
+            key = (row[i_name], row[i_article])
+            sizes = grouped.get(key)
+            if sizes is None:
+                sizes = grouped[key] = []
+            sizes.append({
+                "size": size_names.get(row[i_size]) if size_names is not None else row[i_size],
+                "stock_from": row[i_from],
+                "stock_to": row[i_to],
+                "on_the_way": row[i_way],
+            })
+
+        article_names = (self.references.article_names(article for _, article in grouped)
+                         if self.references and "article_name" in fields else None)
+        result = []
+        for (article_name, wb_article_id), sizes in grouped.items():
+            item = {
+                "article_name": article_names.get(wb_article_id) if article_names is not None else article_name,
+                "wb_article_id": wb_article_id,
+                "sizes": sizes,
+            }
+            if "stock_total" in fields:
+                item["stock_total"] = sum(sz["stock_from"] or 0 for sz in sizes)
+            result.append(item if fields is self._STOCK_DEFAULT_FIELDS else {f: item[f] for f in fields})
+
+        return result
+
+    @staticmethod
+    def _to_columns(columns: List[str], rows: Sequence[tuple]) -> Dict[str, List[Any]]:
+        """Кортежи курсора -> колонки списками (транспонирование в C, без dict на строку)."""
+        if not rows:
+            return {c: [] for c in columns}
+        return dict(zip(columns, map(list, zip(*rows))))
+
+    def get_current_stocks_columns(self, warehouse_from_ids: List[int],
+                                   fields: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        """
+        Остатки для табличных форматов (колоночный JSON, MessagePack, Arrow): колонки прямо из кортежей курсора.
+        С sizes — плоская таблица артикул x размер; stock_total тогда не считается (это сумма stock_from).
+        """
+        fields = fields or self._STOCK_DEFAULT_FIELDS
+        if "sizes" in fields and "stock_total" in fields:
+            raise ValueError("stock_total is not available together with sizes in tabular formats")
+        out_columns = [c for f in fields for c in (self._STOCK_SIZE_COLUMNS if f == "sizes" else (f,))]
+        if not warehouse_from_ids:
+            return {c: [] for c in out_columns}
+
+        try:
+            query = self._stocks_query(len(warehouse_from_ids), fields)
+            table = self._to_columns(*self.db.execute_query_rows(query, tuple(warehouse_from_ids)))
+        except (CircuitOpenError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            logging.error(f"Failed to fetch current stocks columns: {e}")
+            raise
+
+        if self.references is not None:
+            if "article_name" in fields:
+                names = self.references.article_names(table["wb_article_id"])
+                table["article_name"] = [names.get(a) for a in table["wb_article_id"]]
+            if "sizes" in fields:
+                size_names = self.references.size_names(table["size"])
+                table["size"] = [size_names.get(sz) for sz in table["size"]]
+        if "stock_total" in table:
+            table["stock_total"] = [int(v or 0) for v in table["stock_total"]]
+        return {c: table[c] for c in out_columns}
+
     # -------- Справочники
     def get_all_regions(self):
         try:
             query = "SELECT region_id, region_name AS name FROM mp_data.a_wb_stock_transfer_wb_regions"
             return self.db.execute_query(query)
+        except (CircuitOpenError, DeadlineExceededError):
+            raise
         except Exception as e:
             logging.error(f"Failed to get regions: {e}")
             return None
@@ -109,6 +278,8 @@ class DBController:
                 WHERE wb_office_id IS NOT NULL
             """
             return self.db.execute_query(query)
+        except (CircuitOpenError, DeadlineExceededError):
+            raise
         except Exception as e:
             logging.error(f"Failed to get warehouses: {e}")
             return None
@@ -118,196 +289,658 @@ class DBController:
         try:
             insert_query = """
                 INSERT INTO mp_data.a_wb_stock_transfer_one_time_tasks
-                (warehouses_from_ids, warehouses_to_ids, task_status, is_archived)
-                VALUES (%s, %s, %s, %s)
+                (warehouses_from_ids, warehouses_to_ids, task_status, is_archived, last_change_date)
+                VALUES (%s, %s, %s, %s, NOW())
             """
             warehouses_from_json = json.dumps(new_task_data["warehouse_from_ids"])
             warehouses_to_json = json.dumps(new_task_data["warehouse_to_ids"])
             params = (warehouses_from_json, warehouses_to_json, 0, 0)
 
-            # вставка
-            self.db.execute_non_query(insert_query, params)
-            # получить id
-            task_id = self.db.execute_scalar("SELECT LAST_INSERT_ID()")
-            return task_id
+            # id берём с того же соединения, что делало вставку: отдельный SELECT LAST_INSERT_ID()
+            # мог уйти на другое соединение пула
+            return self.db.execute_non_query(insert_query, params)["lastrowid"]
         except Exception as e:
             logging.error(f"Failed to create new task: {e}")
             raise
 
-    def get_tasks(self, start_date: str, end_date: str, only_active: bool):
-        try:
-            base_query = """
-                WITH task_product_qty AS (
-                    SELECT p.task_id,
-                           COUNT(p.transfer_qty) AS positions_total,
-                           SUM(p.transfer_qty)   AS quantity_total,
-                           SUM(p.transfer_qty_left) AS quantity_left
-                    FROM mp_data.a_wb_stock_transfer_products_to_one_time_tasks p
-                    GROUP BY p.task_id
-                )
-                SELECT
-                    tasks.task_id,
-                    warehouses_from_ids,
-                    warehouses_to_ids,
-                    task_status,
-                    is_archived,
-                    task_creation_date,
-                    task_archiving_date,
-                    last_change_date,
-                    tpq.positions_total,
-                    tpq.quantity_total,
-                    tpq.quantity_left
-                FROM mp_data.a_wb_stock_transfer_one_time_tasks tasks
-                LEFT JOIN task_product_qty tpq
-                  ON tpq.task_id = tasks.task_id
-                WHERE task_creation_date BETWEEN %s AND %s
+    def _tasks_query(self, start_date: str, end_date: str, only_active: bool, fields: List[str],
+                     include_archive: bool = False) -> Tuple[str, List[Any]]:
+        with_totals = any(f in self._TASK_AGGREGATE_FIELDS for f in fields)
+        # в архиве только архивные задания — активным там взяться неоткуда
+        with_archive = include_archive and not only_active
+        select_list = ",\n                ".join(
+            f"{self.TASK_FIELDS[f]} AS {f}" if "." in self.TASK_FIELDS[f] else f for f in fields)
+
+        tasks_source = "mp_data.a_wb_stock_transfer_one_time_tasks"
+        products_source = "mp_data.a_wb_stock_transfer_products_to_one_time_tasks"
+        if with_archive:
+            tasks_source = f"""(
+                SELECT {self.TASK_COLUMNS} FROM mp_data.a_wb_stock_transfer_one_time_tasks
+                UNION ALL
+                SELECT {self.TASK_COLUMNS} FROM mp_data.a_wb_stock_transfer_one_time_tasks_archive
+            )"""
+            products_source = """(
+                SELECT task_id, transfer_qty, transfer_qty_left, is_archived
+                FROM mp_data.a_wb_stock_transfer_products_to_one_time_tasks
+                UNION ALL
+                SELECT task_id, transfer_qty, transfer_qty_left, is_archived
+                FROM mp_data.a_wb_stock_transfer_products_to_one_time_tasks_archive
+            )"""
+
+        params: List[Any] = []
+        base_query = ""
+        if with_totals:
+            # агрегируем только текущие версии наборов и только задания из диапазона,
+            # а не всю таблицу товаров с накопленными старыми версиями
+            base_query += f"""
+            WITH task_product_qty AS (
+                SELECT p.task_id,
+                       COUNT(p.transfer_qty) AS positions_total,
+                       SUM(p.transfer_qty)   AS quantity_total,
+                       SUM(p.transfer_qty_left) AS quantity_left
+                FROM {products_source} p
+                WHERE p.is_archived = 0
+                  AND p.task_id IN (
+                      SELECT task_id FROM {tasks_source} t
+                      WHERE t.task_creation_date BETWEEN %s AND %s)
+                GROUP BY p.task_id
+            )"""
+            params += [start_date, end_date]
+        base_query += f"""
+            SELECT
+                {select_list}
+            FROM {tasks_source} tasks
+        """
+        if with_totals:
+            base_query += """
+            LEFT JOIN task_product_qty tpq
+              ON tpq.task_id = tasks.task_id
             """
-            params: List[Any] = [start_date, end_date]
-            if only_active:
-                base_query += " AND is_archived = 0 AND task_status != 2"
-            base_query += " ORDER BY task_creation_date DESC"
+        base_query += " WHERE task_creation_date BETWEEN %s AND %s"
+        params += [start_date, end_date]
+        if only_active:
+            base_query += " AND is_archived = 0 AND task_status != 2"
+        base_query += " ORDER BY task_creation_date DESC"
+
+        return base_query, params
 
-            return self.db.execute_query(base_query, params)
+    def get_tasks(self, start_date: str, end_date: str, only_active: bool, fields: Optional[List[str]] = None,
+                  include_archive: bool = False):
+        """
+        fields — проекция: в SELECT попадают только запрошенные колонки, агрегаты по товарам — только если нужны.
+        include_archive — добавить задания, перенесённые в *_archive (только по явному запросу истории).
+        """
+        try:
+            query, params = self._tasks_query(start_date, end_date, only_active,
+                                              fields or list(self.TASK_FIELDS), include_archive)
+            return self.db.execute_query(query, params)
         except Exception as e:
             logging.error(f"Failed to get tasks: {e}")
             raise
 
-    def get_task_products_by_task_id(self, task_id: int):
+    def get_tasks_columns(self, start_date: str, end_date: str, only_active: bool,
+                          fields: Optional[List[str]] = None, include_archive: bool = False) -> Dict[str, List[Any]]:
+        """get_tasks для табличных форматов: тот же SQL, колонки прямо из кортежей курсора."""
         try:
+            query, params = self._tasks_query(start_date, end_date, only_active,
+                                              fields or list(self.TASK_FIELDS), include_archive)
+            return self._to_columns(*self.db.execute_query_rows(query, params))
+        except Exception as e:
+            logging.error(f"Failed to get tasks columns: {e}")
+            raise
+
+    def _changes_query(self, after: Optional[Tuple[datetime, int]], limit: int,
+                       safety_lag_sec: int) -> Tuple[str, List[Any]]:
+        query = """
+            SELECT
+                tasks.task_id,
+                warehouses_from_ids,
+                warehouses_to_ids,
+                task_status,
+                is_archived,
+                version,
+                task_creation_date,
+                task_archiving_date,
+                last_change_date
+            FROM mp_data.a_wb_stock_transfer_one_time_tasks tasks
+            WHERE last_change_date < NOW() - INTERVAL %s SECOND
+        """
+        params: List[Any] = [safety_lag_sec]
+        if after is not None:
+            changed_at, task_id = after
+            query += " AND (last_change_date > %s OR (last_change_date = %s AND tasks.task_id > %s))"
+            params.extend([changed_at, changed_at, task_id])
+        query += " ORDER BY last_change_date, tasks.task_id LIMIT %s"
+        # +1 строка, чтобы понять, есть ли следующая страница
+        params.append(limit + 1)
+        return query, params
+
+    def _changes_products_query(self, tasks_count: int) -> str:
+        placeholders = ",".join(["%s"] * tasks_count)
+        size_column, size_join = self._size_column("p")
+        return f"""
+            SELECT
+                p.task_id,
+                p.product_wb_id,
+                {size_column},
+                p.transfer_qty AS quantity,
+                p.transfer_qty_left AS quantity_left
+            FROM mp_data.a_wb_stock_transfer_products_to_one_time_tasks p
+            {size_join}
+            WHERE p.task_id IN ({placeholders}) AND p.is_archived = 0
+        """
+
+    def get_tasks_changes(self, after: Optional[Tuple[datetime, int]], limit: int, safety_lag_sec: int) -> Dict[str, Any]:
+        """
+        Лента изменений: задания с last_change_date после курсора (keyset по паре
+        (last_change_date, task_id)) и актуальные товары этих заданий.
+        Строки моложе safety_lag_sec не отдаются — иначе запись, закоммиченная
+        позже своей отметки, оказалась бы позади курсора. Гарантия держится, пока между
+        отметкой и COMMIT проходит меньше лага: отметку ставит _mark_tasks_changed последним оператором.
+        """
+        try:
+            query, params = self._changes_query(after, limit, safety_lag_sec)
+
+            # курсор ленты не должен обгонять данные: отстающая реплика пропустила бы изменения
+            with use_primary():
+                tasks = self.db.execute_query(query, params)
+            has_more = len(tasks) > limit
+            tasks = tasks[:limit]
+
+            products_by_task: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+            if tasks:
+                task_ids = [t["task_id"] for t in tasks]
+                products_query = self._changes_products_query(len(task_ids))
+                with use_primary():
+                    product_rows = self.db.execute_query(products_query, tuple(task_ids))
+                for row in self._attach_size_names(product_rows):
+                    products_by_task[row["task_id"]].append(row)
+
+            products = []
+            for task in tasks:
+                task_products = products_by_task.get(task["task_id"], [])
+                task["positions_total"] = len(task_products)
+                task["quantity_total"] = sum(p["quantity"] or 0 for p in task_products)
+                task["quantity_left"] = sum(p["quantity_left"] or 0 for p in task_products)
+                products.extend(task_products)
+
+            last = (tasks[-1]["last_change_date"], tasks[-1]["task_id"]) if tasks else after
+            return {"tasks": tasks, "products": products, "last": last, "has_more": has_more}
+        except Exception as e:
+            logging.error(f"Failed to get tasks changes: {e}")
+            raise
+
+    _TASK_SNAPSHOT_QUERY = """
+        SELECT
+            tasks.task_id,
+            task_status,
+            is_archived,
+            version,
+            last_change_date,
+            COUNT(p.transfer_qty)      AS positions_total,
+            SUM(p.transfer_qty)        AS quantity_total,
+            SUM(p.transfer_qty_left)   AS quantity_left
+        FROM mp_data.a_wb_stock_transfer_one_time_tasks tasks
+        LEFT JOIN mp_data.a_wb_stock_transfer_products_to_one_time_tasks p
+          ON p.task_id = tasks.task_id AND p.is_archived = 0
+        WHERE tasks.task_id = %s
+        GROUP BY tasks.task_id, task_status, is_archived, version, last_change_date
+    """
+
+    def get_task_snapshot(self, task_id: int) -> Optional[Dict[str, Any]]:
+        """Текущее состояние одного задания с итогами по товарам (как строка get_tasks)."""
+        try:
+            rows = self.db.execute_query(self._TASK_SNAPSHOT_QUERY, (task_id,))
+            return rows[0] if rows else None
+        except Exception as e:
+            logging.error(f"Failed to get task snapshot for task_id {task_id}: {e}")
+            raise
+
+    def task_status_code(self, new_status: str) -> int:
+        """Код статуса из _TASK_STATUSES или число; неизвестный — ValueError."""
+        if new_status in self._TASK_STATUSES:
+            return self._TASK_STATUSES[new_status]
+        if new_status.isdigit() and int(new_status) in self._TASK_STATUSES.values():
+            return int(new_status)
+        raise ValueError(f"Unknown task status: {new_status!r}")
+
+    # Лента изменений читает last_change_date с лагом TASK_CHANGES_SAFETY_LAG_SEC, а NOW() — время начала
+    # оператора, не коммита. Поэтому отметка ставится последним оператором транзакции, когда строки
+    # заданий уже заблокированы: между ней и COMMIT нет ни ожидания блокировок, ни тяжёлых операторов.
+    @staticmethod
+    def _lock_tasks(cursor, task_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+        """Блокирует строки заданий (по возрастанию id — без взаимных блокировок); task_id -> строка."""
+        cursor.execute(f"""
+            SELECT task_id, task_status, version
+              FROM mp_data.a_wb_stock_transfer_one_time_tasks
+             WHERE task_id IN ({",".join(["%s"] * len(task_ids))})
+             ORDER BY task_id
+               FOR UPDATE
+        """, list(task_ids))
+        return {row["task_id"]: row for row in cursor.fetchall()}
+
+    @staticmethod
+    def _mark_tasks_changed(cursor, task_ids: Sequence[int]):
+        """Сдвиг last_change_date для ленты изменений — последний оператор перед COMMIT."""
+        cursor.execute(f"""
+            UPDATE mp_data.a_wb_stock_transfer_one_time_tasks
+               SET last_change_date = NOW()
+             WHERE task_id IN ({",".join(["%s"] * len(task_ids))})
+        """, list(task_ids))
+
+    def update_task_status(self, task_id: int, new_status: str, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Меняет статус задания. new_status — код из _TASK_STATUSES или число.
+        expected_version — версия из If-Match: статус меняется только если её никто не сдвинул.
+        Возвращает актуальный снимок задания или None, если задания нет.
+        """
+        status_code = self.task_status_code(new_status)
+
+        def _update(cursor) -> int:
+            # CAS блокирует строку (возможно, дождавшись чужой транзакции); отметка для ленты — после него
             query = """
-                SELECT
-                    p.product_wb_id,
-                    sz.size,
-                    p.transfer_qty AS quantity
-                FROM mp_data.a_wb_stock_transfer_products_to_one_time_tasks p
-                LEFT JOIN mp_data.a_wb_izd_size sz ON p.size_id = sz.size_id
-                WHERE p.task_id = %s AND p.is_archived = 0
+                UPDATE mp_data.a_wb_stock_transfer_one_time_tasks
+                   SET task_status = %s,
+                       version = version + 1
+                 WHERE task_id = %s
             """
-            return self.db.execute_query(query, (task_id,))
+            params: List[Any] = [status_code, task_id]
+            if expected_version is not None:
+                query += " AND version = %s"
+                params.append(expected_version)
+            updated = cursor.execute(query, params)
+            if updated:
+                self._mark_tasks_changed(cursor, [task_id])
+            return updated
+
+        try:
+            updated = self.db.execute_transaction(_update)
+            with use_primary():
+                snapshot = self.get_task_snapshot(task_id)
+            if snapshot is not None and not updated:
+                raise VersionConflictError(current_version=snapshot["version"])
+            return snapshot
+        except VersionConflictError:
+            raise
         except Exception as e:
-            logging.error(f"Failed to get task products by task_id {task_id}: {e}")
+            logging.error(f"Failed to update status for task_id {task_id}: {e}")
+            raise
+
+    # -------- Прогресс отгрузки (пишется пачками из буфера отложенной записи)
+    def apply_products_progress(self, progress: Dict[Tuple[int, int, int], int]) -> int:
+        """
+        progress: (task_id, product_wb_id, size_id) -> transfer_qty_left.
+        Одна пачка — один UPDATE ... JOIN по списку значений (у таблицы товаров нет уникального
+        ключа по этой тройке, поэтому ON DUPLICATE KEY UPDATE тут неприменим) и сдвиг
+        last_change_date заданий для ленты изменений; всё в одной транзакции.
+        Задания, у которых остаток действительно изменился, получают version + 1: ETag/If-Match
+        по заданию учитывает и прогресс, правка по устаревшей версии получит 412.
+        """
+        if not progress:
+            return 0
+        rows = [(task_id, product_wb_id, size_id, qty_left)
+                for (task_id, product_wb_id, size_id), qty_left in progress.items()]
+        values_sql = " UNION ALL ".join(
+            ["SELECT %s AS task_id, %s AS product_wb_id, %s AS size_id, %s AS qty_left"] +
+            ["SELECT %s, %s, %s, %s"] * (len(rows) - 1))
+        params = [v for row in rows for v in row]
+        task_ids = sorted({row[0] for row in rows})
+
+        def _apply(cursor):
+            # строки заданий — первыми: тот же порядок, что у update_task_products, и отметка в конце не ждёт
+            self._lock_tasks(cursor, task_ids)
+            # версия — до обновления товаров, пока видно, у каких заданий остаток отличается
+            cursor.execute(f"""
+                UPDATE mp_data.a_wb_stock_transfer_one_time_tasks t
+                JOIN (SELECT DISTINCT p.task_id
+                        FROM mp_data.a_wb_stock_transfer_products_to_one_time_tasks p
+                        JOIN ({values_sql}) v
+                          ON p.task_id = v.task_id
+                         AND p.product_wb_id = v.product_wb_id
+                         AND p.size_id = v.size_id
+                       WHERE p.is_archived = 0
+                         AND p.transfer_qty_left <> v.qty_left) c
+                  ON c.task_id = t.task_id
+                   SET t.version = t.version + 1
+            """, params)
+            updated = cursor.execute(f"""
+                UPDATE mp_data.a_wb_stock_transfer_products_to_one_time_tasks p
+                JOIN ({values_sql}) v
+                  ON p.task_id = v.task_id
+                 AND p.product_wb_id = v.product_wb_id
+                 AND p.size_id = v.size_id
+                   SET p.transfer_qty_left = v.qty_left
+                 WHERE p.is_archived = 0
+            """, params)
+            self._mark_tasks_changed(cursor, task_ids)
+            return updated
+
+        try:
+            return self.db.execute_transaction(_apply)
+        except Exception as e:
+            logging.error(f"Failed to apply products progress ({len(rows)} rows): {e}")
+            raise
+
+    def apply_task_statuses(self, statuses: Dict[int, int]) -> int:
+        """statuses: task_id -> код статуса. Меняет только отличающиеся статусы, сдвигая версию задания."""
+        if not statuses:
+            return 0
+
+        def _apply(cursor) -> int:
+            current = self._lock_tasks(cursor, sorted(statuses))
+            rows = [(task_id, code) for task_id, code in statuses.items()
+                    if task_id in current and current[task_id]["task_status"] != code]
+            if not rows:
+                return 0
+            values_sql = " UNION ALL ".join(
+                ["SELECT %s AS task_id, %s AS task_status"] + ["SELECT %s, %s"] * (len(rows) - 1))
+            updated = cursor.execute(f"""
+                UPDATE mp_data.a_wb_stock_transfer_one_time_tasks t
+                JOIN ({values_sql}) v ON t.task_id = v.task_id
+                   SET t.task_status = v.task_status,
+                       t.version = t.version + 1
+            """, [v for row in rows for v in row])
+            self._mark_tasks_changed(cursor, sorted(task_id for task_id, _ in rows))
+            return updated
+
+        try:
+            return self.db.execute_transaction(_apply)
+        except Exception as e:
+            logging.error(f"Failed to apply task statuses ({len(statuses)} rows): {e}")
             raise
 
-    def update_task_products(self, task_id: int, products: List[dict]):
+    def get_task_version(self, task_id: int) -> Optional[int]:
         try:
+            # версия для If-Match сравнивается с primary — читаем оттуда же
+            with use_primary():
+                return self.db.execute_scalar(
+                    "SELECT version FROM mp_data.a_wb_stock_transfer_one_time_tasks WHERE task_id = %s",
+                    (task_id,))
+        except Exception as e:
+            logging.error(f"Failed to get version of task_id {task_id}: {e}")
+            raise
+
+    def _task_products_query(self, task_id: int, include_archive: bool) -> Tuple[str, List[Any]]:
+        size_column, size_join = self._size_column("p")
+        query = f"""
+            SELECT
+                p.product_wb_id,
+                {size_column},
+                p.transfer_qty AS quantity
+            FROM mp_data.a_wb_stock_transfer_products_to_one_time_tasks p
+            {size_join}
+            WHERE p.task_id = %s AND p.is_archived = 0
+        """
+        params: List[Any] = [task_id]
+        if include_archive:
+            query += f"""
+            UNION ALL
+            SELECT
+                p.product_wb_id,
+                {size_column},
+                p.transfer_qty AS quantity
+            FROM mp_data.a_wb_stock_transfer_products_to_one_time_tasks_archive p
+            {size_join}
+            WHERE p.task_id = %s AND p.is_archived = 0
+            """
+            params.append(task_id)
+        return query, params
+
+    def get_task_products_by_task_id(self, task_id: int, include_archive: bool = False):
+        """include_archive — искать и среди заданий, перенесённых в архив (задание лежит ровно в одном месте)."""
+        try:
+            query, params = self._task_products_query(task_id, include_archive)
+            return self._attach_size_names(self.db.execute_query(query, params))
+        except Exception as e:
+            logging.error(f"Failed to get task products by task_id {task_id}: {e}")
+            raise
+
+    def _resolve_size_names(self, products: List[dict]) -> Dict[str, int]:
+        """Подписи размеров из строк без size -> size_id; неизвестная подпись — ValueError (UnknownSizeError)."""
+        named = [p for p in products if "size" not in p]
+        if not named:
+            return {}
+        if any("size_name" not in p for p in named):
+            raise ValueError("Each product needs either size or size_name")
+        labels = {p["size_name"] for p in named}
+        if self.references is None:
+            raise ValueError("Size names are not supported without reference dictionaries")
+        return self.references.size_ids(labels)
+
+    def update_task_products(self, task_id: int, products: List[dict], expected_version: Optional[int] = None) -> int:
+        """
+        Заменяет набор товаров задания (архив + вставка) в одной транзакции.
+        Первым шагом — CAS по версии задания: один UPDATE по первичному ключу
+        и блокирует только строку этого задания, и отсекает устаревшие правки.
+        last_change_date сдвигается последним оператором: вставка десятков тысяч строк может
+        идти дольше лага ленты изменений, а отметка должна быть не старше коммита.
+        Возвращает новую версию задания.
+        """
+        # products — словари product_id/size/quantity (строки TaskProductRow из TypeAdapter);
+        # size — это size_id, вместо него можно size_name: подписи переводятся в id пачкой по справочнику.
+        # transfer_qty_left = transfer_qty при создании
+        size_ids = self._resolve_size_names(products)
+        batch = [(task_id, p["product_id"], int(p["size"]) if "size" in p else size_ids[p["size_name"]],
+                  p["quantity"], p["quantity"], 0) for p in products]
+
+        def _replace(cursor):
+            # 0) CAS: сдвигаем версию
+            cas_query = """
+                UPDATE mp_data.a_wb_stock_transfer_one_time_tasks
+                   SET version = version + 1
+                 WHERE task_id = %s
+            """
+            cas_params: List[Any] = [task_id]
+            if expected_version is not None:
+                cas_query += " AND version = %s"
+                cas_params.append(expected_version)
+            if not cursor.execute(cas_query, cas_params):
+                cursor.execute(
+                    "SELECT version FROM mp_data.a_wb_stock_transfer_one_time_tasks WHERE task_id = %s",
+                    (task_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    raise TaskNotFoundError(f"Task {task_id} not found")
+                raise VersionConflictError(current_version=row["version"])
+
             # 1) Архивируем текущие
-            archive_query = """
+            cursor.execute(
+                """
                 UPDATE mp_data.a_wb_stock_transfer_products_to_one_time_tasks
                 SET is_archived = 1
                 WHERE task_id = %s AND is_archived = 0
-            """
-            self.db.execute_non_query(archive_query, (task_id,))
+                """,
+                (task_id,))
 
             # 2) Вставляем новые записи батчем
-            if products:
-                insert_query = """
+            if batch:
+                cursor.executemany(
+                    """
                     INSERT INTO mp_data.a_wb_stock_transfer_products_to_one_time_tasks
                     (task_id, product_wb_id, size_id, transfer_qty, transfer_qty_left, is_archived)
                     VALUES (%s, %s, %s, %s, %s, %s)
-                """
-                batch = []
-                for p in products:
-                    batch.append((
-                        task_id,
-                        p["product_id"],
-                        int(p["size"]),    # здесь size — это size_id
-                        p["quantity"],
-                        p["quantity"],     # transfer_qty_left = transfer_qty при создании
-                        0
-                    ))
-                self.db.execute_many(insert_query, batch)
+                    """,
+                    batch)
+
+            cursor.execute(
+                "SELECT version FROM mp_data.a_wb_stock_transfer_one_time_tasks WHERE task_id = %s",
+                (task_id,))
+            version = cursor.fetchone()["version"]
+
+            # 3) Отметка для ленты изменений — непосредственно перед COMMIT
+            self._mark_tasks_changed(cursor, [task_id])
+            return version
+
+        try:
+            return self.db.execute_transaction(_replace)
+        except (VersionConflictError, TaskNotFoundError):
+            raise
         except Exception as e:
             logging.error(f"Failed to update task products for task_id {task_id}: {e}")
             raise
 
 
     # ---------- РЕГУЛЯРНЫЕ ЗАДАНИЯ ----------
-    def save_regular_task(self, supplier_id: int, target: Dict[str, float], minimum: Dict[str, float]) -> int:
+    # имя GET_LOCK, под которым сохраняется регулярная запись
+    _REGULAR_TASK_LOCK = "crabot.regular_task.save"
+
+    def save_regular_task(self,
+                          supplier_id: int,
+                          target: Dict[str, float],
+                          minimum: Dict[str, float],
+                          expected_version: Optional[int] = None) -> Dict[str, int]:
         """
-        Архивирует все активные и создаёт новую регулярную запись.
+        Архивирует активную и создаёт новую регулярную запись с version + 1.
         target/minimum — доли 0..1 по русским названиям регионов.
+        expected_version — версия активной записи из If-Match; без неё берётся текущая,
+        так что параллельная правка всё равно не перезапишется молча.
+        Сохранения идут по одному (GET_LOCK на всю транзакцию): без If-Match два параллельных вызова
+        иначе прочли бы одну версию (ложный 412) или, пока активной записи нет, вставили бы две.
         """
-        try:
-            # 1) Архивируем все активные
-            self.db.execute_non_query(
-                """
-                UPDATE mp_data.a_wb_stock_transfer_regular_tasks
-                   SET is_archived = 1,
-                       task_archiving_date = NOW()
-                 WHERE is_archived = 0
-                """
-            )
-
-            # 2) Подготавливаем колонки и значения
-            col_names = ["is_archived"]
-            col_values = [0]
-            placeholders = ["%s"]
-
-            # опционально можем хранить supplier_id, если добавишь поле в таблицу
-            # col_names.append("supplier_id"); col_values.append(supplier_id); placeholders.append("%s")
-
-            for ru_name, (t_col, m_col) in self._REGION_COLS.items():
-                t_val = float(target.get(ru_name, 0.0) or 0.0)
-                m_val = float(minimum.get(ru_name, 0.0) or 0.0)
-                # клипуем 0..1 для безопасности
-                t_val = max(0.0, min(1.0, t_val))
-                m_val = max(0.0, min(1.0, m_val))
-                col_names.extend([t_col, m_col])
-                col_values.extend([t_val, m_val])
-                placeholders.extend(["%s", "%s"])
-
-            insert_sql = f"""
-                INSERT INTO mp_data.a_wb_stock_transfer_regular_tasks
-                ({", ".join(col_names)})
-                VALUES ({", ".join(placeholders)})
-            """
-            self.db.execute_non_query(insert_sql, tuple(col_values))
+        # Подготавливаем колонки и значения
+        col_names = ["is_archived", "version"]
+        col_values: List[Any] = [0, None]  # версия подставится после CAS
+        placeholders = ["%s", "%s"]
+
+        # опционально можем хранить supplier_id, если добавишь поле в таблицу
+        # col_names.append("supplier_id"); col_values.append(supplier_id); placeholders.append("%s")
+
+        for ru_name, (t_col, m_col) in self._REGION_COLS.items():
+            t_val = float(target.get(ru_name, 0.0) or 0.0)
+            m_val = float(minimum.get(ru_name, 0.0) or 0.0)
+            # клипуем 0..1 для безопасности
+            t_val = max(0.0, min(1.0, t_val))
+            m_val = max(0.0, min(1.0, m_val))
+            col_names.extend([t_col, m_col])
+            col_values.extend([t_val, m_val])
+            placeholders.extend(["%s", "%s"])
+
+        insert_sql = f"""
+            INSERT INTO mp_data.a_wb_stock_transfer_regular_tasks
+            ({", ".join(col_names)})
+            VALUES ({", ".join(placeholders)})
+        """
+
+        def _save(cursor):
+            version = expected_version
+            if version is None:
+                cursor.execute(
+                    """
+                    SELECT version
+                    FROM mp_data.a_wb_stock_transfer_regular_tasks
+                    WHERE is_archived = 0
+                    ORDER BY task_creation_date DESC, task_id DESC
+                    LIMIT 1
+                    FOR UPDATE
+                    """)
+                row = cursor.fetchone()
+                version = row["version"] if row else None
+
+            # 1) CAS: архивируем только запись с ожидаемой версией — одним UPDATE по индексу
+            #    (is_archived, version), без блокировки всех неархивных строк
+            if version is not None:
+                archived = cursor.execute(
+                    """
+                    UPDATE mp_data.a_wb_stock_transfer_regular_tasks
+                       SET is_archived = 1,
+                           task_archiving_date = NOW()
+                     WHERE is_archived = 0 AND version = %s
+                    """,
+                    (version,))
+                if not archived:
+                    cursor.execute(
+                        """
+                        SELECT version
+                        FROM mp_data.a_wb_stock_transfer_regular_tasks
+                        WHERE is_archived = 0
+                        ORDER BY task_creation_date DESC, task_id DESC
+                        LIMIT 1
+                        """)
+                    row = cursor.fetchone()
+                    raise VersionConflictError(current_version=row["version"] if row else None)
+
+            # 2) Новая активная запись
+            new_version = (version or 0) + 1
+            values = list(col_values)
+            values[1] = new_version
+            cursor.execute(insert_sql, tuple(values))
+            return {"task_id": int(cursor.lastrowid), "version": new_version}
 
-            new_id = self.db.execute_scalar("SELECT LAST_INSERT_ID()")
-            return int(new_id)
+        try:
+            return self.db.execute_transaction(_save, lock=self._REGULAR_TASK_LOCK)
+        except VersionConflictError:
+            raise
         except Exception as e:
             logging.error(f"Failed to save regular task: {e}")
             raise
 
+    def _active_regular_task_query(self) -> str:
+        # выбираем последнюю неархивную
+        cols = ["task_id", "task_creation_date", "version"] + \
+               [c for pair in self._REGION_COLS.values() for c in pair]  # все target_* и min_*
+        return f"""
+            SELECT {", ".join(cols)}
+            FROM mp_data.a_wb_stock_transfer_regular_tasks
+            WHERE is_archived = 0
+            ORDER BY task_creation_date DESC, task_id DESC
+            LIMIT 1
+        """
+
     def get_active_regular_task(self) -> Optional[Dict[str, Any]]:
         """
         Возвращает активную регулярную запись в словарном виде:
         {
           "task_id": ...,
+          "version": ...,
           "target": { "Центральный":0.3, ... },
           "minimum": { "Центральный":0.05, ... },
           "task_creation_date": "..."
         }
         """
         try:
-            # выбираем последнюю неархивную
-            cols = ["task_id", "task_creation_date"] + \
-                   [c for pair in self._REGION_COLS.values() for c in pair]  # все target_* и min_*
-
-            sql = f"""
-                SELECT {", ".join(cols)}
-                FROM mp_data.a_wb_stock_transfer_regular_tasks
-                WHERE is_archived = 0
-                ORDER BY task_creation_date DESC, task_id DESC
-                LIMIT 1
-            """
-            rows = self.db.execute_query(sql)
+            rows = self.db.execute_query(self._active_regular_task_query())
             if not rows:
                 return None
 
-            row = rows[0]
-            target: Dict[str, float] = {}
-            minimum: Dict[str, float] = {}
-            for ru_name, (t_col, m_col) in self._REGION_COLS.items():
-                target[ru_name]  = float(row.get(t_col) or 0.0)
-                minimum[ru_name] = float(row.get(m_col) or 0.0)
-
-            return {
-                "task_id": row["task_id"],
-                "target": target,
-                "minimum": minimum,
-                "task_creation_date": row.get("task_creation_date").isoformat() if row.get("task_creation_date") else None
-            }
+            return self._map_regular_task_row(rows[0])
         except Exception as e:
             logging.error(f"Failed to get active regular task: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def _map_regular_task_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Строка regular_tasks (target_*/min_* колонки) -> словари долей по регионам."""
+        target: Dict[str, float] = {}
+        minimum: Dict[str, float] = {}
+        for ru_name, (t_col, m_col) in self._REGION_COLS.items():
+            target[ru_name]  = float(row.get(t_col) or 0.0)
+            minimum[ru_name] = float(row.get(m_col) or 0.0)
+
+        return {
+            "task_id": row["task_id"],
+            "version": row["version"],
+            "target": target,
+            "minimum": minimum,
+            "task_creation_date": row.get("task_creation_date").isoformat() if row.get("task_creation_date") else None
+        }
+
+    # ---------- ПРОВЕРКА ПЛАНОВ ----------
+    def plan_probes(self) -> List[Tuple[str, str, Sequence[Any]]]:
+        """
+        Запросы горячих путей с типовыми параметрами — для EXPLAIN при старте (QueryPlanCheck).
+        SQL собирают те же методы, что и в обработчиках, так что проверяется ровно то, что выполняется.
+        """
+        end = datetime.now()
+        start = end - timedelta(days=30)
+        warehouses = [1, 2, 3]
+        return [
+            ("get_current_stocks", self._stocks_query(len(warehouses), self._STOCK_DEFAULT_FIELDS), warehouses),
+            ("get_current_stocks:totals", self._stocks_query(len(warehouses), ["wb_article_id", "stock_total"]),
+             warehouses),
+            ("get_tasks", *self._tasks_query(start, end, False, list(self.TASK_FIELDS))),
+            ("get_tasks:only_active", *self._tasks_query(start, end, True, list(self.TASK_FIELDS))),
+            ("get_tasks_changes", *self._changes_query((start, 0), 500, 2)),
+            ("get_tasks_changes:products", self._changes_products_query(3), [1, 2, 3]),
+            ("get_task_snapshot", self._TASK_SNAPSHOT_QUERY, [1]),
+            ("get_task_products", *self._task_products_query(1, False)),
+            ("get_active_regular_task", self._active_regular_task_query(), []),
+        ]
@@ -0,0 +1,41 @@
+from typing import Dict, List, Tuple
+
+from infrastructure.db.mysql.write_behind import WriteBehindBuffer
+from services.mysql_db_service.stock_transfer_service import DBController
+
+
+class TaskProgressWriter:
+    """
+    Прогресс отгрузки по заданиям: остатки к перемещению по (задание, товар, размер) и статусы заданий.
+    Обновления копятся в буферах отложенной записи (последнее значение побеждает)
+    и уходят в MySQL пачками, а не отдельным UPDATE на каждое событие.
+    """
+    def __init__(self, db_controller: DBController, interval_ms: float, max_rows: int, max_buffered: int):
+        self.db_controller = db_controller
+        self.products = WriteBehindBuffer("task_products_progress", db_controller.apply_products_progress,
+                                          interval_ms=interval_ms, max_rows=max_rows, max_buffered=max_buffered)
+        self.statuses = WriteBehindBuffer("task_statuses", db_controller.apply_task_statuses,
+                                          interval_ms=interval_ms, max_rows=max_rows, max_buffered=max_buffered)
+
+    def submit(self, products: List[dict], statuses: List[dict]) -> int:
+        """Статус проверяется сразу (ValueError), запись — позже. Возвращает число принятых обновлений."""
+        status_codes: Dict[int, int] = {s["task_id"]: self.db_controller.task_status_code(s["new_status"])
+                                        for s in statuses}
+        progress: Dict[Tuple[int, int, int], int] = {
+            (p["task_id"], p["product_id"], int(p["size"])): p["quantity_left"] for p in products}
+        if progress:
+            self.products.put_many(progress)
+        if status_codes:
+            self.statuses.put_many(status_codes)
+        return len(progress) + len(status_codes)
+
+    def start(self):
+        self.products.start()
+        self.statuses.start()
+
+    def stop(self):
+        self.products.stop()
+        self.statuses.stop()
+
+    def status(self) -> dict:
+        return {"products": self.products.status(), "statuses": self.statuses.status()}
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# модули приложения импортируются от корня пакета (core.*, services.*), как при запуске main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEZKA_LOG_LEVEL", "WARNING")
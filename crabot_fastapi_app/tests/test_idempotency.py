@@ -0,0 +1,188 @@
+import asyncio
+import json
+import threading
+import time
+
+from core.config import settings
+from core.deadline import DeadlineExceededError, DeadlineMiddleware
+from core.executor import BlockingExecutor
+from core.idempotency import IdempotencyMiddleware
+
+PATH = "/stock_transfer/create_full_task"
+
+
+class MemoryStore:
+    """IdempotencyKeysController в памяти: те же исходы claim, без MySQL."""
+    def __init__(self):
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def claim(self, key, endpoint, request_hash, lease_sec, ttl_sec):
+        with self.lock:
+            row = self.rows.get(key)
+            if row is None:
+                self.rows[key] = {"request_hash": request_hash, "status_code": None,
+                                  "response_headers": None, "response_body": None}
+                return "claimed", None
+            return ("stored" if row["status_code"] is not None else "busy"), dict(row)
+
+    def get(self, key):
+        with self.lock:
+            row = self.rows.get(key)
+            return dict(row) if row is not None else None
+
+    def complete(self, key, status_code, headers, body):
+        with self.lock:
+            self.rows[key].update(status_code=status_code, response_headers=headers, response_body=body)
+
+    def release(self, key):
+        with self.lock:
+            if key in self.rows and self.rows[key]["status_code"] is None:
+                del self.rows[key]
+
+    def purge_expired(self, limit=1000):
+        return 0
+
+
+class CreateApp:
+    """Обработчик создания: один вызов БД в пуле потоков, как db_calls.create_new_task."""
+    def __init__(self, executor, duration=0.2):
+        self.executor = executor
+        self.duration = duration
+        self.executions = 0
+
+    def _create(self):
+        time.sleep(self.duration)
+        self.executions += 1
+        return self.executions
+
+    async def __call__(self, scope, receive, send):
+        await receive()
+        try:
+            task_id = await self.executor.run(self._create)
+            status, body = 200, json.dumps({"task_id": task_id}).encode("utf-8")
+        except DeadlineExceededError as e:
+            status, body = 504, json.dumps({"detail": str(e)}).encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def make_stack(duration=0.2):
+    executor = BlockingExecutor("test-db", max_workers=4, max_queue=10)
+    app = CreateApp(executor, duration)
+    store = MemoryStore()
+    stack = DeadlineMiddleware(IdempotencyMiddleware(app, store=store, executor=executor, routes=PATH, wait_sec=2))
+    return stack, app, store, executor
+
+
+async def request(stack, body=b'{"a": 1}', key=b"key-1", disconnect_after=None, timeout=None):
+    headers = [(b"idempotency-key", key), (b"content-type", b"application/json")]
+    if timeout is not None:
+        headers.append((settings.DEADLINE_HEADER.lower().encode("latin-1"), timeout))
+    scope = {"type": "http", "method": "POST", "path": PATH, "headers": headers}
+    sent_body = False
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        if disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await stack(scope, receive, send)
+    start = next((m for m in messages if m["type"] == "http.response.start"), None)
+    if start is None:
+        return None, {}, None
+    payload = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return start["status"], dict(start["headers"]), json.loads(payload)
+
+
+def test_disconnect_then_retry_does_not_execute_twice():
+    async def scenario():
+        stack, app, store, executor = make_stack(duration=0.3)
+        try:
+            status, _, _ = await request(stack, disconnect_after=0.05)
+            assert status is None  # клиент ушёл до ответа
+            # повтор сразу: ждёт операцию первого запроса и получает её ответ
+            status, headers, payload = await request(stack)
+            assert status == 200
+            assert headers.get(b"idempotent-replayed") == b"true"
+            assert payload == {"task_id": 1}
+            assert app.executions == 1
+            assert store.rows  # ответ сохранён и для других воркеров
+        finally:
+            executor.shutdown()
+    asyncio.run(scenario())
+
+
+def test_disconnect_then_late_retry_replays_stored_response():
+    async def scenario():
+        stack, app, store, executor = make_stack(duration=0.1)
+        try:
+            await request(stack, disconnect_after=0.02)
+            await asyncio.sleep(0.3)
+            status, headers, payload = await request(stack)
+            assert (status, payload) == (200, {"task_id": 1})
+            assert headers.get(b"idempotent-replayed") == b"true"
+            assert app.executions == 1
+        finally:
+            executor.shutdown()
+    asyncio.run(scenario())
+
+
+def test_same_key_with_different_body_is_rejected():
+    async def scenario():
+        stack, app, _, executor = make_stack(duration=0.01)
+        try:
+            assert (await request(stack, body=b'{"a": 1}'))[0] == 200
+            status, _, payload = await request(stack, body=b'{"a": 2}')
+            assert status == 422
+            assert "different request" in payload["detail"]
+            assert app.executions == 1
+        finally:
+            executor.shutdown()
+    asyncio.run(scenario())
+
+
+def test_concurrent_duplicate_waits_for_in_flight_request():
+    async def scenario():
+        stack, app, _, executor = make_stack(duration=0.2)
+        try:
+            first, second = await asyncio.gather(request(stack), request(stack))
+            assert first[0] == second[0] == 200
+            assert first[2] == second[2] == {"task_id": 1}
+            assert b"idempotent-replayed" not in first[1]
+            assert second[1].get(b"idempotent-replayed") == b"true"
+            assert app.executions == 1
+        finally:
+            executor.shutdown()
+    asyncio.run(scenario())
+
+
+def test_deadline_before_call_started_releases_key():
+    async def scenario():
+        stack, app, store, executor = make_stack(duration=0.2)
+        # единственный поток занят — вызов запроса ждёт в очереди, пока не выйдет срок, и не стартует
+        app.executor = BlockingExecutor("test-db-1", max_workers=1, max_queue=10)
+        try:
+            busy = asyncio.ensure_future(app.executor.run(time.sleep, 0.3))
+            await asyncio.sleep(0.01)
+            status, _, _ = await request(stack, body=b'{"b": 1}', key=b"key-2", timeout=b"0.05")
+            await busy
+            await asyncio.sleep(0.1)
+            assert status == 504
+            assert app.executions == 0
+            assert store.rows == {}  # аренда снята: повтор выполнится заново
+        finally:
+            executor.shutdown()
+            app.executor.shutdown()
+    asyncio.run(scenario())
@@ -0,0 +1,123 @@
+import random
+import time
+
+import pytest
+
+from core.load_shedding import AdaptiveLimiter, parse_priority_routes
+
+
+def limiter(**kwargs) -> AdaptiveLimiter:
+    # adjust_interval=0: лимит пересчитывается на каждом ответе, тесту не нужно ждать
+    params = dict(initial=64, min_limit=8, max_limit=512, adjust_interval=0, queue_sustain=0.05)
+    params.update(kwargs)
+    return AdaptiveLimiter(**params)
+
+
+def serve(lim: AdaptiveLimiter, rtt: float, route: str, priority: str = "normal"):
+    assert lim.try_acquire(priority)
+    lim.release(rtt, route, priority)
+
+
+def test_mixed_fast_and_slow_routes_are_not_congestion():
+    lim = limiter()
+    rng = random.Random(1)
+    for _ in range(2000):
+        if rng.random() < 0.5:
+            serve(lim, rng.uniform(0.0015, 0.0025), "/stock_transfer/get_regions", "high")
+        else:
+            serve(lim, rng.uniform(0.04, 0.06), "/stock_transfer/get_tasks", "low")
+    assert lim.limit == 64
+    assert not lim.status()["congested"]
+
+
+def test_jittery_route_is_not_congestion():
+    lim = limiter()
+    rng = random.Random(2)
+    for _ in range(2000):
+        serve(lim, rng.uniform(0.01, 0.09), "/stock_transfer/get_tasks")
+    assert lim.limit == 64
+
+
+def test_sustained_latency_growth_backs_off():
+    lim = limiter()
+    for _ in range(200):
+        serve(lim, 0.01, "/stock_transfer/get_tasks")
+    for _ in range(50):
+        serve(lim, 0.05, "/stock_transfer/get_tasks")
+    assert lim.limit < 64
+    assert lim.status()["congested"]
+
+
+def test_route_below_warmup_does_not_signal():
+    lim = limiter(warmup=20)
+    for _ in range(10):
+        serve(lim, 0.001, "/a")
+    for _ in range(10):
+        serve(lim, 0.5, "/a")
+    assert lim.limit == 64
+
+
+def test_single_queue_blip_is_ignored_but_sustained_queue_backs_off():
+    waiters = [1]
+    lim = limiter(signals=lambda: (0.0, waiters[0]))
+    serve(lim, 0.01, "/a")
+    assert lim.limit == 64
+    waiters[0] = 0
+    serve(lim, 0.01, "/a")
+    waiters[0] = 1
+    serve(lim, 0.01, "/a")
+    time.sleep(0.06)
+    serve(lim, 0.01, "/a")
+    assert lim.limit < 64
+
+
+def test_event_loop_lag_backs_off_to_min_limit():
+    lim = limiter(signals=lambda: (0.5, 0))
+    for _ in range(100):
+        serve(lim, 0.01, "/a")
+    assert lim.limit == 8
+
+
+def test_limit_grows_only_when_utilized():
+    lim = limiter(initial=10)
+    serve(lim, 0.01, "/a")
+    assert lim.limit == 10
+    for _ in range(10):
+        assert lim.try_acquire("high")
+    lim.release(0.01, "/a")
+    assert lim.limit == 11
+
+
+def test_priority_shares():
+    lim = limiter(initial=10)
+    for _ in range(5):
+        assert lim.try_acquire("low")
+    assert not lim.try_acquire("low")
+    for _ in range(3):
+        assert lim.try_acquire("normal")
+    assert not lim.try_acquire("normal")
+    assert lim.try_acquire("high")
+    assert lim.try_acquire("high")
+    assert not lim.try_acquire("high")
+
+
+def test_routes_over_cap_fall_back_to_priority():
+    lim = limiter(max_routes=2)
+    for route in ("/a", "/b", "/c", "/d"):
+        serve(lim, 0.01, route, "low")
+    assert set(lim.status()["routes"]) == {"/a", "/b", "low"}
+
+
+def test_parse_priority_routes_longest_prefix_first():
+    routes = parse_priority_routes("exempt=/healthcheck,/metrics;low=/stock_transfer/get_tasks/ ,/stock_transfer;"
+                                   "high=/stock_transfer/get_regions")
+    assert routes[0] == ("/stock_transfer/get_regions", "high")
+    assert ("/stock_transfer/get_tasks", "low") in routes
+    assert routes.index(("/stock_transfer/get_tasks", "low")) < routes.index(("/stock_transfer", "low"))
+    assert ("/healthcheck", "exempt") in routes
+
+
+def test_parse_priority_routes_empty_and_unknown_class():
+    assert parse_priority_routes("") == []
+    with pytest.raises(ValueError):
+        parse_priority_routes("urgent=/x")
@@ -0,0 +1,48 @@
+import logging
+import queue
+import threading
+
+from utils.logger import SamplingFilter, StructuredFormatter, _DeferredQueueHandler, summarize
+
+
+def enqueue(*args, msg="items: %s"):
+    q = queue.Queue()
+    handler = _DeferredQueueHandler(q)
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+    handler.handle(record)
+    return q.get_nowait()
+
+
+def test_mutable_args_are_formatted_at_call_time():
+    items = [1, 2]
+    record = enqueue(items)
+    items.append(3)
+    assert record.args is None
+    assert StructuredFormatter().format(record).endswith("items: [1, 2]")
+
+
+def test_summary_stays_deferred_and_other_args_are_copied():
+    items = [1, 2]
+    record = enqueue(items, summarize({"a": 1}), msg="items: %s body: %s")
+    items.append(3)
+    assert record.args[1].__class__.__name__ == "_Summary"
+    assert record.getMessage() == 'items: [1, 2] body: {"a": 1}'
+
+
+def test_sampling_counter_is_thread_safe():
+    sampling = SamplingFilter()
+    passed = []
+
+    def worker():
+        for _ in range(10_000):
+            record = logging.LogRecord("test", logging.INFO, __file__, 1, "tick", (), None)
+            record.sample_every = 100
+            if sampling.filter(record):
+                passed.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(passed) == 800
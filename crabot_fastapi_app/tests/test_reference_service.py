@@ -0,0 +1,45 @@
+import re
+
+from services.mysql_db_service.reference_service import ReferenceDictionaries
+
+
+class FakeDB:
+    """execute_query_rows над двумя таблицами в памяти; запросы считаются."""
+    def __init__(self):
+        self.sizes = {1: "S", 2: "M"}
+        self.articles = {500: "Футболка"}
+        self.queries = []
+
+    def execute_query_rows(self, query, params=None):
+        self.queries.append(query)
+        table = self.sizes if "a_wb_izd_size" in query else self.articles
+        rows = sorted(table.items())
+        if "IN (" in query:
+            rows = [r for r in rows if r[0] in params or r[1] in params]
+        elif ">" in query:
+            rows = [r for r in rows if r[0] > params[0]]
+        return None, rows
+
+
+def test_missing_article_is_rechecked_after_refresh_interval():
+    db = FakeDB()
+    refs = ReferenceDictionaries(db, refresh_sec=60)
+    assert refs.article_names([7]).get(7) is None
+    assert refs.article_names([7]).get(7) is None
+    assert sum("IN (" in q for q in db.queries) == 1  # промах закэширован
+
+    db.articles[7] = "Носки"  # артикул с id меньше известного максимума
+    refs._refreshed_at -= 61
+    assert refs.article_names([7])[7] == "Носки"
+
+
+def test_incremental_refresh_loads_new_sizes_but_not_articles_by_max_id():
+    db = FakeDB()
+    refs = ReferenceDictionaries(db, refresh_sec=60)
+    refs.size_names([1])
+    db.sizes[3] = "L"
+    refs._refreshed_at -= 61
+    db.queries.clear()
+    assert refs.size_names([3])[3] == "L"
+    assert not any("a_wb_article" in q for q in db.queries)
+    assert all(not re.search(r"IN \(", q) for q in db.queries)  # размер пришёл обновлением, не промахом
@@ -0,0 +1,39 @@
+import asyncio
+from datetime import datetime
+
+from infrastructure.events.task_events import TaskEventBroker
+
+EVENT = {"task_id": 5, "task_status": 1, "last_change_date": datetime(2026, 1, 1, 12, 0, 0), "quantity_left": 3}
+
+
+def drain(queue):
+    messages = []
+    while not queue.empty():
+        messages.append(queue.get_nowait())
+    return messages
+
+
+def test_local_event_has_no_id_and_poller_copy_sends_only_id():
+    async def scenario():
+        broker = TaskEventBroker()
+        queue = broker.subscribe()
+        broker.publish(dict(EVENT))
+        local, = drain(queue)
+        assert "id:" not in local and "data:" in local
+
+        broker.publish(dict(EVENT), resumable=True)
+        id_only, = drain(queue)
+        assert id_only.startswith("id: ") and "data:" not in id_only
+    asyncio.run(scenario())
+
+
+def test_poller_event_carries_cursor_id():
+    async def scenario():
+        broker = TaskEventBroker()
+        queue = broker.subscribe()
+        broker.publish(dict(EVENT), resumable=True)
+        message, = drain(queue)
+        assert message.startswith("id: ") and "data:" in message
+        broker.publish(dict(EVENT), resumable=True)
+        assert drain(queue) == []
+    asyncio.run(scenario())
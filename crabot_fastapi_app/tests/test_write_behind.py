@@ -0,0 +1,34 @@
+import threading
+
+from infrastructure.db.mysql.write_behind import WriteBehindBuffer
+
+
+def test_stop_skips_final_flush_while_worker_is_still_flushing():
+    entered, release = threading.Event(), threading.Event()
+    written = []
+
+    def slow_flush(batch):
+        entered.set()
+        release.wait(5)
+        written.append(dict(batch))
+
+    buffer = WriteBehindBuffer("test", slow_flush, interval_ms=10)
+    buffer.put("k", 1)
+    buffer.start()
+    assert entered.wait(2)
+    buffer.put("k", 2)  # новее, чем пачка, которая сейчас пишется
+    buffer.stop(timeout=0.05)
+    assert written == []  # stop не писал параллельно с потоком
+    assert buffer.status()["buffered"] == 1
+    release.set()
+    buffer._thread.join(2)
+    assert written == [{"k": 1}]
+
+
+def test_stop_flushes_leftovers_after_thread_exits():
+    written = []
+    buffer = WriteBehindBuffer("test", lambda batch: written.append(dict(batch)), interval_ms=10_000)
+    buffer.start()
+    buffer.put_many({"a": 1, "b": 2})
+    buffer.stop()
+    assert written == [{"a": 1, "b": 2}]
@@ -0,0 +1,18 @@
+from typing import Any
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+
+
+async def validate_body(request: Request, adapter: TypeAdapter) -> Any:
+    """
+    Сырое тело -> adapter.validate_json: разбор и проверка за один проход в pydantic-core,
+    без промежуточного json.loads и моделей на строку. Ошибки — тот же 422, что отдаёт FastAPI.
+    """
+    body = await request.body()
+    try:
+        return adapter.validate_json(body)
+    except ValidationError as e:
+        errors = [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        raise RequestValidationError(errors, body=body)
@@ -0,0 +1,25 @@
+from typing import Optional
+
+
+class InvalidETagError(ValueError):
+    pass
+
+
+def format_etag(version: Optional[int]) -> Optional[str]:
+    return f'"{version}"' if version is not None else None
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """If-Match -> ожидаемая версия. None — заголовка нет (или '*'), проверка не нужна."""
+    if if_match is None:
+        return None
+    value = if_match.strip()
+    if not value or value == "*":
+        return None
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    try:
+        return int(value)
+    except ValueError as e:
+        raise InvalidETagError(f"Invalid If-Match: {if_match!r}") from e
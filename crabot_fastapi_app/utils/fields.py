@@ -0,0 +1,25 @@
+from typing import Iterable, List, Optional
+
+
+class InvalidFieldsError(ValueError):
+    pass
+
+
+def parse_fields(raw: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """
+    'task_id,task_status' -> ['task_id', 'task_status'] в порядке из запроса.
+    None/пустая строка -> None (отдаём все поля).
+    """
+    if raw is None or not raw.strip():
+        return None
+
+    allowed = list(allowed)
+    fields: List[str] = []
+    for name in raw.split(","):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in allowed:
+            raise InvalidFieldsError(f"Unknown field {name!r}, allowed: {', '.join(allowed)}")
+        fields.append(name)
+    return fields or None
@@ -1,18 +1,197 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
 import sys
+import threading
+from typing import Any, Optional
 
 from core.config import settings
 
+_TEXT_FORMAT = "[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s"
+# атрибуты, которые есть у любой LogRecord; всё остальное пришло через extra= и выводится как поля
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample_every"}
+
+_lock = threading.Lock()
+_queue_handler: Optional[logging.Handler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """Текстовая строка как раньше + поля из extra= в виде key=value, либо JSON-строка (LOG_FORMAT=json)."""
+    def __init__(self, as_json: bool = False):
+        super().__init__(_TEXT_FORMAT)
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {k: v for k, v in record.__dict__.items() if k not in _RESERVED_ATTRS and not k.startswith("_")}
+        if self.as_json:
+            data = {"ts": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                    "msg": record.getMessage(), **fields}
+            if record.exc_info and not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            if record.exc_text:
+                data["exc"] = record.exc_text
+            return json.dumps(data, ensure_ascii=False, default=str)
+
+        line = super().format(record)
+        if fields:
+            line += " | " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+_IMMUTABLE_ARGS = (str, bytes, int, float, bool, type(None))
+
+
+def _snapshot(value: Any) -> Any:
+    try:
+        return copy.copy(value)
+    except Exception:
+        return value
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Стандартный QueueHandler форматирует всю строку в вызывающем потоке.
+    Здесь в вызывающем потоке подставляются только аргументы сообщения — к моменту записи
+    слушателем изменяемый аргумент мог уже поменяться — и снимается трейсбек (кадры стека
+    дальше не живут). Отложенными остаются рендер summarize() и форматирование строки.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple) and any(isinstance(a, _Summary) for a in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        elif args:
+            # summarize() рендерится в слушателе; остальные аргументы — копией на момент вызова
+            record.args = tuple(a if isinstance(a, _IMMUTABLE_ARGS) else _snapshot(a) for a in args)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # лучше потерять строку лога, чем остановить event loop
+            pass
+
+
+class SamplingFilter(logging.Filter):
+    """logger.info(..., extra={"sample_every": 100}) пропускает каждую сотую строку с этим шаблоном."""
+    def __init__(self):
+        super().__init__()
+        self._counters: dict = {}
+        self._counters_lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, "sample_every", None)
+        if not every or every <= 1:
+            return True
+        key = (record.name, record.msg)
+        # фильтр вызывается из любого потока (event loop, пул БД) — счётчик под блокировкой
+        with self._counters_lock:
+            count = self._counters.get(key, 0)
+            self._counters[key] = count + 1
+        if count % every:
+            return False
+        record.sampled = f"1/{every}"
+        return True
+
+
+class _TraceIdFilter(logging.Filter):
+    """Добавляет trace_id текущего запроса (см. core.tracing) — в потоке слушателя контекста уже нет."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        from core.tracing import current_trace
+        trace = current_trace()
+        if trace is not None:
+            record.trace_id = trace.trace_id
+        return True
+
+
+def _shared_handler() -> logging.Handler:
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is None:
+            stream_handler = logging.StreamHandler(sys.stdout)
+            stream_handler.setFormatter(StructuredFormatter(as_json=settings.LOG_FORMAT == "json"))
+
+            log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+            _queue_handler = _DeferredQueueHandler(log_queue)
+            _queue_handler.addFilter(SamplingFilter())
+            _queue_handler.addFilter(_TraceIdFilter())
+
+            _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+            _listener.start()
+            atexit.register(shutdown_logging)
+    return _queue_handler
+
+
 def get_logger(name: str = "app") -> logging.Logger:
     logger = logging.getLogger(name)
     level = getattr(logging, settings.LOG_LEVEL.upper(), logging.DEBUG)
     logger.setLevel(level)
 
     if not logger.handlers:
-        handler = logging.StreamHandler(sys.stdout)
-        formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        logger.addHandler(_shared_handler())
 
     logger.propagate = False
     return logger
+
+
+def configure_logging():
+    """Корневой логгер (logging.getLogger(__name__) в роутерах, uvicorn) — через ту же очередь и уровень LOG_LEVEL."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_shared_handler())
+    root.setLevel(getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO))
+
+
+def shutdown_logging():
+    """Дописывает очередь в stdout. Вызывается при остановке приложения и из atexit."""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+class _Summary:
+    __slots__ = ("value", "max_items", "max_str")
+
+    def __init__(self, value: Any, max_items: int = 3, max_str: int = 200):
+        self.value = value
+        self.max_items = max_items
+        self.max_str = max_str
+
+    def _shape(self, value: Any, depth: int = 0) -> Any:
+        if hasattr(value, "model_dump"):
+            value = {k: getattr(value, k) for k in type(value).model_fields}
+        if isinstance(value, dict):
+            if depth > 2:
+                return f"{{{len(value)} keys}}"
+            return {k: self._shape(v, depth + 1) for k, v in list(value.items())[:20]}
+        if isinstance(value, (list, tuple, set)):
+            items = list(value)
+            if len(items) <= self.max_items:
+                return [self._shape(v, depth + 1) for v in items]
+            return {"len": len(items), "head": [self._shape(v, depth + 1) for v in items[:self.max_items]]}
+        if isinstance(value, str) and len(value) > self.max_str:
+            return value[:self.max_str] + f"...(+{len(value) - self.max_str})"
+        return value
+
+    def __str__(self) -> str:
+        return json.dumps(self._shape(self.value), ensure_ascii=False, default=str)
+
+
+def summarize(value: Any, max_items: int = 3, max_str: int = 200) -> _Summary:
+    """
+    Короткое описание тела запроса для лога: списки -> длина и первые элементы,
+    длинные строки обрезаются. Считается лениво — только если строка реально пишется.
+        logger.info("Request: %s", summarize(request))
+    """
+    return _Summary(value, max_items, max_str)
@@ -0,0 +1,156 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger("Profiler")
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+class StackSampler:
+    """
+    Сэмплирующий профайлер: отдельный поток раз в interval снимает стеки всех потоков
+    через sys._current_frames() и копит их в формате collapsed stacks
+    (строка "поток;внешняя функция;...;внутренняя функция N" — вход для flamegraph.pl / speedscope).
+    Код приложения не инструментируется, накладные расходы — один обход стеков на сэмпл.
+    """
+    MAX_SECONDS = 120
+    MIN_INTERVAL = 0.005
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self.interval = 0.01
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: float = 0.01):
+        with self._lock:
+            if self.running:
+                raise ProfilerBusyError("Profiler is already running")
+            self.interval = max(float(interval), self.MIN_INTERVAL)
+            self._stacks = Counter()
+            self._samples = 0
+            self._started_at = time.time()
+            self._finished_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(min(float(seconds), self.MAX_SECONDS),),
+                                            daemon=True, name="stack-sampler")
+            self._thread.start()
+        logger.info("Stack sampler started for %.0fs at %.0f ms interval", seconds, self.interval * 1000)
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def _run(self, seconds: float):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self._stacks[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+            self._samples += 1
+            self._stop.wait(self.interval)
+        self._finished_at = time.time()
+        logger.info("Stack sampler finished: %d samples, %d unique stacks", self._samples, len(self._stacks))
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        parts: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        parts.reverse()
+        # ";" разделяет кадры в collapsed-формате
+        return ";".join(p.replace(";", ",") for p in parts)
+
+    def collapsed(self) -> str:
+        stacks = list(self._stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks, key=lambda x: -x[1]))
+
+    def status(self) -> dict:
+        return {"running": self.running,
+                "samples": self._samples,
+                "unique_stacks": len(self._stacks),
+                "interval_ms": round(self.interval * 1000, 1),
+                "started_at": self._started_at,
+                "finished_at": self._finished_at}
+
+
+class MemoryTracker:
+    """
+    tracemalloc по запросу: start() включает трассировку (заметно замедляет аллокации —
+    держим включённой только пока ищем утечку), diff() сравнивает снимок с предыдущим.
+    """
+    _FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10):
+        with self._lock:
+            if tracemalloc.is_tracing():
+                raise ProfilerBusyError("tracemalloc is already running")
+            tracemalloc.start(frames)
+            self._baseline = self._snapshot()
+        logger.info("tracemalloc started (%d frames)", frames)
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+        logger.info("tracemalloc stopped")
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self._FILTERS)
+
+    def diff(self, top: int = 30, group_by: str = "lineno", reset: bool = True) -> dict:
+        """Рост памяти с прошлого снимка; reset=True делает текущий снимок новой точкой отсчёта."""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not running")
+            snapshot = self._snapshot()
+            stats = snapshot.compare_to(self._baseline, group_by)
+            if reset:
+                self._baseline = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        return {"traced_current_bytes": current,
+                "traced_peak_bytes": peak,
+                "top": [{"location": [f"{f.filename}:{f.lineno}" for f in stat.traceback],
+                         "size_diff_bytes": stat.size_diff,
+                         "size_bytes": stat.size,
+                         "count_diff": stat.count_diff,
+                         "count": stat.count} for stat in stats[:top]]}
+
+
+stack_sampler = StackSampler()
+memory_tracker = MemoryTracker()
@@ -0,0 +1,43 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+SyncCursor = Tuple[datetime, int]
+
+
+def encode_cursor(changed_at: datetime, task_id: int) -> str:
+    """Кодирует пару (last_change_date, task_id) в непрозрачную строку для клиента."""
+    raw = f"{changed_at.isoformat()}|{int(task_id)}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SyncCursor:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        changed_at, task_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(changed_at), int(task_id)
+    except Exception as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}") from e
+
+
+def cursor_from_watermark(since: str) -> SyncCursor:
+    """Водяная отметка от клиента (ISO-дата) -> курсор, начинающийся сразу после неё."""
+    try:
+        # task_id = 0: все задания, изменённые ровно в эту секунду, попадут в выдачу
+        return datetime.fromisoformat(since), 0
+    except ValueError as e:
+        raise InvalidCursorError(f"Invalid watermark: {since!r}") from e
+
+
+def resolve_cursor(cursor: Optional[str], since: Optional[str]) -> Optional[SyncCursor]:
+    if cursor:
+        return decode_cursor(cursor)
+    if since:
+        return cursor_from_watermark(since)
+    return None
@@ -1,76 +1,203 @@
+import asyncio
+import gc
 import os
-import time
 import threading
-import docker
-from prometheus_client import Gauge
-
-# Метрики
-cpu_usage_percent = Gauge("app_cpu_usage_percent", "CPU usage percent")
-memory_usage_bytes = Gauge("app_memory_usage_bytes", "Memory usage in bytes")
-disk_read_bytes = Gauge("app_disk_read_bytes", "Disk read bytes")
-disk_write_bytes = Gauge("app_disk_write_bytes", "Disk write bytes")
-network_sent = Gauge("app_network_sent_bytes", "Network bytes sent")
-network_recv = Gauge("app_network_received_bytes", "Network bytes received")
-
-container_name = os.getenv("NEZKA_CONTAINER_NAME")
-DOCKER_SOCKET = "/var/run/docker.sock"
-
-def get_docker_client():
-    if os.path.exists(DOCKER_SOCKET):
-        try:
-            return docker.DockerClient(base_url=f'unix://{DOCKER_SOCKET}')
-        except docker.errors.DockerException as e:
-            print(f"[!] Docker client error: {e}")
-    else:
-        print(f"[!] Docker socket not found at {DOCKER_SOCKET}")
-    return None
+import time
+from typing import Dict, Optional
 
-client = get_docker_client()
+from prometheus_client import Counter, Gauge, Histogram
 
-def get_docker_stats():
-    if not client:
-        return None
+from utils.logger import get_logger
+
+logger = get_logger("SystemMetrics")
+
+# Метрики процесса (/proc/self)
+cpu_usage_percent = Gauge("app_cpu_usage_percent", "Process CPU usage percent over the last interval (100 = one core)")
+memory_usage_bytes = Gauge("app_memory_usage_bytes", "Process resident memory in bytes")
+disk_read_bytes = Gauge("app_disk_read_bytes", "Bytes read from storage by the process")
+disk_write_bytes = Gauge("app_disk_write_bytes", "Bytes written to storage by the process")
+network_sent = Gauge("app_network_sent_bytes", "Network bytes sent (network namespace, without lo)")
+network_recv = Gauge("app_network_received_bytes", "Network bytes received (network namespace, without lo)")
+open_fds = Gauge("app_open_fds", "Open file descriptors")
+threads_count = Gauge("app_threads", "OS threads in the process")
+
+# Метрики контейнера (cgroup v2)
+cgroup_cpu_usage_percent = Gauge("app_cgroup_cpu_usage_percent", "Container CPU usage percent over the last interval")
+cgroup_cpu_throttled_seconds = Gauge("app_cgroup_cpu_throttled_seconds", "Total time the container was CPU-throttled")
+cgroup_memory_bytes = Gauge("app_cgroup_memory_bytes", "Container memory usage in bytes (memory.current)")
+cgroup_memory_limit_bytes = Gauge("app_cgroup_memory_limit_bytes", "Container memory limit in bytes (0 = unlimited)")
+
+# Event loop и GC
+event_loop_lag_seconds = Gauge("app_event_loop_lag_seconds", "Event loop scheduling delay of the last probe")
+gc_pause_seconds = Histogram("app_gc_pause_seconds", "Garbage collector pause duration", ["generation"],
+                             buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+gc_collected_objects = Counter("app_gc_collected_objects", "Objects collected by the garbage collector", ["generation"])
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def _read(path: str) -> Optional[str]:
     try:
-        container = client.containers.get(container_name)
-        return container.stats(stream=False)
-    except docker.errors.NotFound:
-        print(f"[!] Container '{container_name}' not found.")
-    except Exception as e:
-        print(f"[!] Failed to get stats: {e}")
-    return None
-
-def collect_system_metrics():
-    def run():
-        while True:
-            stats = get_docker_stats()
-            if stats:
-                try:
-                    # CPU
-                    cpu_total = stats["cpu_stats"]["cpu_usage"]["total_usage"]
-                    system_cpu = stats["cpu_stats"].get("system_cpu_usage", 1) or 1
-                    cpu_percent = (cpu_total / system_cpu) * 100
-                    cpu_usage_percent.set(cpu_percent)
-
-                    # Memory
-                    memory = stats["memory_stats"].get("usage", 0)
-                    memory_usage_bytes.set(memory)
-
-                    # Disk I/O
-                    blkio_stats = stats.get("blkio_stats", {}).get("io_service_bytes_recursive", [])
-                    read_bytes = sum(x["value"] for x in blkio_stats if x.get("op", "").lower() == "read")
-                    write_bytes = sum(x["value"] for x in blkio_stats if x.get("op", "").lower() == "write")
-                    disk_read_bytes.set(read_bytes)
-                    disk_write_bytes.set(write_bytes)
-
-                    # Network
-                    networks = stats.get("networks", {})
-                    sent = sum(iface["tx_bytes"] for iface in networks.values())
-                    recv = sum(iface["rx_bytes"] for iface in networks.values())
-                    network_sent.set(sent)
-                    network_recv.set(recv)
-
-                except Exception as parse_err:
-                    print(f"[!] Error parsing stats: {parse_err}")
-            time.sleep(5)
-
-    threading.Th
+        with open(path, "rb") as f:
+            return f.read().decode("ascii", errors="replace")
+    except OSError:
+        return None
+
+
+def _read_kv(path: str) -> Dict[str, int]:
+    text = _read(path)
+    result = {}
+    for line in (text or "").splitlines():
+        key, _, value = line.replace(":", " ").partition(" ")
+        try:
+            result[key] = int(value.strip())
+        except ValueError:
+            pass
+    return result
+
+
+class ResourceSampler:
+    """
+    Фоновый поток: раз в interval читает /proc/self и cgroup v2 и обновляет метрики.
+    Чтение нескольких небольших файлов — без Docker API и без внешних вызовов.
+    """
+    def __init__(self, interval: float = 5.0):
+        self.interval = float(interval)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cgroup_v2 = os.path.exists(os.path.join(_CGROUP_ROOT, "cgroup.controllers"))
+        self._last_cpu: Optional[tuple] = None
+        self._last_cgroup_cpu: Optional[tuple] = None
+
+    def start(self):
+        if not os.path.exists("/proc/self/stat"):
+            logger.warning("/proc is not available; system metrics are disabled")
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name="resource-sampler")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning("Resource sampling failed: %s", e)
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        now = time.monotonic()
+        self._sample_process(now)
+        self._sample_network()
+        if self._cgroup_v2:
+            self._sample_cgroup(now)
+
+    def _sample_process(self, now: float):
+        stat = _read("/proc/self/stat")
+        if stat:
+            # поле comm в скобках может содержать пробелы — режем по последней ")"
+            fields = stat[stat.rindex(")") + 2:].split()
+            cpu_seconds = (int(fields[11]) + int(fields[12])) / _CLK_TCK  # utime + stime
+            threads_count.set(int(fields[17]))
+            if self._last_cpu is not None:
+                elapsed = now - self._last_cpu[0]
+                if elapsed > 0:
+                    cpu_usage_percent.set((cpu_seconds - self._last_cpu[1]) / elapsed * 100)
+            self._last_cpu = (now, cpu_seconds)
+
+        statm = _read("/proc/self/statm")
+        if statm:
+            memory_usage_bytes.set(int(statm.split()[1]) * _PAGE_SIZE)
+
+        io = _read_kv("/proc/self/io")
+        if io:
+            disk_read_bytes.set(io.get("read_bytes", 0))
+            disk_write_bytes.set(io.get("write_bytes", 0))
+
+        try:
+            open_fds.set(len(os.listdir("/proc/self/fd")))
+        except OSError:
+            pass
+
+    def _sample_network(self):
+        text = _read("/proc/self/net/dev")
+        if not text:
+            return
+        sent = recv = 0
+        for line in text.splitlines()[2:]:
+            iface, _, data = line.partition(":")
+            if iface.strip() == "lo":
+                continue
+            values = data.split()
+            recv += int(values[0])
+            sent += int(values[8])
+        network_sent.set(sent)
+        network_recv.set(recv)
+
+    def _sample_cgroup(self, now: float):
+        cpu = _read_kv(os.path.join(_CGROUP_ROOT, "cpu.stat"))
+        if "usage_usec" in cpu:
+            usage = cpu["usage_usec"] / 1e6
+            if self._last_cgroup_cpu is not None:
+                elapsed = now - self._last_cgroup_cpu[0]
+                if elapsed > 0:
+                    cgroup_cpu_usage_percent.set((usage - self._last_cgroup_cpu[1]) / elapsed * 100)
+            self._last_cgroup_cpu = (now, usage)
+        if "throttled_usec" in cpu:
+            cgroup_cpu_throttled_seconds.set(cpu["throttled_usec"] / 1e6)
+
+        current = _read(os.path.join(_CGROUP_ROOT, "memory.current"))
+        if current:
+            cgroup_memory_bytes.set(int(current))
+        limit = _read(os.path.join(_CGROUP_ROOT, "memory.max"))
+        if limit:
+            limit = limit.strip()
+            cgroup_memory_limit_bytes.set(0 if limit == "max" else int(limit))
+
+
+class GCMonitor:
+    """Длительность пауз GC через gc.callbacks: колбэк вызывается в начале и в конце каждой сборки."""
+    def __init__(self):
+        self._started_at: Optional[float] = None
+
+    def _callback(self, phase: str, info: dict):
+        if phase == "start":
+            self._started_at = time.perf_counter()
+            return
+        if self._started_at is None:
+            return
+        generation = str(info.get("generation"))
+        gc_pause_seconds.labels(generation).observe(time.perf_counter() - self._started_at)
+        gc_collected_objects.labels(generation).inc(info.get("collected", 0))
+        self._started_at = None
+
+    def install(self):
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+
+    def uninstall(self):
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+
+
+_last_event_loop_lag = 0.0
+
+
+def current_event_loop_lag() -> float:
+    """Последний замер задержки event loop (0, пока монитор не запущен)."""
+    return _last_event_loop_lag
+
+
+async def monitor_event_loop_lag(interval: float = 1.0):
+    """Задача в event loop: насколько позже запланированного просыпается sleep(interval)."""
+    global _last_event_loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        _last_event_loop_lag = max(0.0, loop.time() - expected)
+        event_loop_lag_seconds.set(_last_event_loop_lag)